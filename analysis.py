@@ -0,0 +1,129 @@
+"""Text analysis, i.e. turning a text into the terms which are indexed.
+
+An `Analyzer` is a pipeline of stages, applied to each text:
+
+1. lowercasing;
+2. tokenization (tokens are runs of alphanumeric characters);
+3. stop word removal (optional);
+4. stemming (optional), where the stem of each distinct token is computed
+once and memoized.
+
+Analyzers are shared: `get_analyzer()` returns the same instance for the
+same stages, so that stop words are read once and stems are computed once
+per process, whether texts are analyzed to build an index (see
+`data_collections`) or to parse requests.
+"""
+import re
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from datatypes import Term
+from resources import load_stop_words
+
+TOKEN = re.compile(r"\w+")
+
+
+def s_stemmer(token: str) -> str:
+    """Conflate the singular and plural forms of English words.
+
+    This is the "S" stemmer (Harman, 1991), which only handles regular
+    plurals, e.g. "queries" -> "query", "documents" -> "document".
+    """
+    if len(token) > 3 and token.endswith("ies") and token[-4] not in "ae":
+        return token[:-3] + "y"
+    if len(token) > 2 and token.endswith("es") and token[-3] not in "aeo":
+        return token[:-1]
+    if len(token) > 1 and token.endswith("s") and token[-2] not in "us":
+        return token[:-1]
+    return token
+
+
+STEMMERS: Dict[str, Callable[[str], str]] = {"s": s_stemmer}
+
+
+class _StemCache(dict):
+    # Memoized stems: the stem of a token is computed on first lookup.
+
+    def __init__(self, stem: Callable[[str], str]):
+        super().__init__()
+        self.stem = stem
+
+    def __missing__(self, token: str) -> str:
+        stem = self[token] = self.stem(token)
+        return stem
+
+
+class Analyzer:
+    """Turn texts into lists of terms.
+
+    Parameters
+    ----------
+    stop_words : set of str, optional
+        Tokens which are removed. Defaults to none.
+    stemmer : str, optional
+        Name of a stemmer (see `STEMMERS`). Defaults to no stemming.
+    """
+
+    def __init__(self, stop_words: Iterable[str] = (), stemmer: str = None):
+        self.stop_words: FrozenSet[str] = frozenset(stop_words)
+        self.stemmer = stemmer
+        self._stems: Optional[_StemCache] = None
+        if stemmer is not None:
+            self._stems = _StemCache(STEMMERS[stemmer])
+
+    def __reduce__(self):
+        # Analyzers sent to other processes (e.g. with a collection) are
+        # shared there too, rather than copied along with their stems.
+        return _shared_analyzer, (self.stop_words, self.stemmer)
+
+    def analyze(self, text: str) -> List[Term]:
+        """Return the terms of a text, in order."""
+        tokens = TOKEN.findall(text.lower())
+        if self.stop_words:
+            stop_words = self.stop_words
+            tokens = [token for token in tokens if token not in stop_words]
+        if self._stems is not None:
+            tokens = list(map(self._stems.__getitem__, tokens))
+        return tokens
+
+    def analyze_many(self, texts: Iterable[str]) -> List[List[Term]]:
+        """Return the terms of each of a batch of texts.
+
+        This is faster than calling `analyze()` for each text: stages are
+        looked up once for the whole batch, rather than once per text.
+        """
+        findall = TOKEN.findall
+        stop_words = self.stop_words
+        results = [findall(text.lower()) for text in texts]
+        if stop_words:
+            results = [
+                [token for token in tokens if token not in stop_words]
+                for tokens in results
+            ]
+        if self._stems is not None:
+            stem = self._stems.__getitem__
+            results = [list(map(stem, tokens)) for tokens in results]
+        return results
+
+
+_ANALYZERS: Dict[Tuple[FrozenSet[str], Optional[str]], Analyzer] = {}
+
+
+def _shared_analyzer(stop_words: FrozenSet[str], stemmer: Optional[str]) -> Analyzer:
+    key = (stop_words, stemmer)
+    if key not in _ANALYZERS:
+        _ANALYZERS[key] = Analyzer(stop_words, stemmer)
+    return _ANALYZERS[key]
+
+
+def get_analyzer(stop_words: bool = False, stemmer: str = None) -> Analyzer:
+    """Return the shared analyzer with the given stages.
+
+    Parameters
+    ----------
+    stop_words : bool, optional
+        Whether to remove the stop words of `DATA_STOP_WORDS_PATH`.
+    stemmer : str, optional
+        Name of a stemmer (see `STEMMERS`).
+    """
+    words = load_stop_words() if stop_words else frozenset()
+    return _shared_analyzer(words, stemmer)
@@ -0,0 +1,58 @@
+"""Benchmark of text analysis throughput, before and after sharing analyzers."""
+import os
+import re
+from typing import Callable, Dict, List
+
+from analysis import get_analyzer
+from utils import Timer
+
+NON_ALPHA_NUMERIC = re.compile(r"\W+")
+
+
+def legacy_tokenize(text: str) -> List[str]:
+    """Tokenize a text as a freshly constructed `Collection()` used to,
+    including reading the stop words file.
+    """
+    with open(os.getenv("DATA_STOP_WORDS_PATH")) as f:
+        stop_words = {line.strip() for line in f}
+    tokens = filter(None, NON_ALPHA_NUMERIC.split(text))
+    tokens = map(str.lower, tokens)
+    return list(filter(lambda t: t not in stop_words, tokens))
+
+
+def read_texts(path: str) -> List[str]:
+    """Read the non-empty lines of a file, as texts to analyze."""
+    with open(path) as f:
+        return [line for line in f if line.strip()]
+
+
+def _throughput(analyze: Callable[[List[str]], int], texts: List[str]) -> float:
+    # Best throughput of a few runs, in tokens per second.
+    best = float("inf")
+    for _ in range(3):
+        with Timer() as timer:
+            num_tokens = analyze(texts)
+        best = min(best, timer.total)
+    return num_tokens / best
+
+
+def run(texts: List[str]) -> Dict[str, float]:
+    """Compare the throughput (in tokens/s) of analysis pipelines, with stop
+    word removal.
+    """
+    analyzer = get_analyzer(stop_words=True)
+    stemming = get_analyzer(stop_words=True, stemmer="s")
+    return {
+        "legacy": _throughput(
+            lambda texts: sum(len(legacy_tokenize(text)) for text in texts), texts
+        ),
+        "analyze": _throughput(
+            lambda texts: sum(len(analyzer.analyze(text)) for text in texts), texts
+        ),
+        "batch": _throughput(
+            lambda texts: sum(map(len, analyzer.analyze_many(texts))), texts
+        ),
+        "stemmed": _throughput(
+            lambda texts: sum(map(len, stemming.analyze_many(texts))), texts
+        ),
+    }
@@ -0,0 +1,153 @@
+import click
+from dotenv import load_dotenv
+
+from cli_utils import CollectionType
+from data_collections import Collection
+from indexes import build_index
+from indexes.disk import IndexFile
+from models.vector import VectorEngine, vector_search
+from models.vector.schemes import NORMS, SCHEMES
+
+from . import analysis as analysis_benchmark
+from . import intersect as intersect_benchmark
+from . import lexicon as lexicon_benchmark
+from . import merge as merge_benchmark
+from . import vector as vector_benchmark
+
+load_dotenv()
+
+
+@click.group()
+def cli():
+    pass
+
+
+def _int_list(ctx, param, value: str):
+    return [int(item) for item in value.split(",")]
+
+
+@cli.command()
+@click.option("--entries", "-n", type=int, default=200000, show_default=True)
+@click.option(
+    "--blocks",
+    "-b",
+    default="2,10,50,100",
+    callback=_int_list,
+    show_default=True,
+    help="Comma-separated numbers of blocks.",
+)
+def merge(entries: int, blocks: list):
+    """Compare merge throughput of the linear-scan and heap-based merges."""
+    click.echo(f"{'blocks':>8} {'linear':>14} {'heap':>14} {'speedup':>8}")
+    for num_blocks in blocks:
+        result = merge_benchmark.run(entries, num_blocks)
+        click.echo(
+            f"{num_blocks:>8} "
+            f"{result['linear']:>10.0f} e/s "
+            f"{result['heap']:>10.0f} e/s "
+            f"{result['heap'] / result['linear']:>7.1f}x"
+        )
+
+
+@cli.command()
+@click.option(
+    "--length",
+    "-n",
+    type=int,
+    default=100000,
+    show_default=True,
+    help="Length of the longest posting list.",
+)
+@click.option(
+    "--ratios",
+    "-r",
+    default="1,4,16,64,256,1024",
+    callback=_int_list,
+    show_default=True,
+    help="Comma-separated ratios between the lengths of the posting lists.",
+)
+@click.option("--documents", "-d", type=int, default=1000000, show_default=True)
+def intersect(length: int, ratios: list, documents: int):
+    """Compare posting list intersection algorithms."""
+    algorithms = ["merge", "gallop", "skips", "adaptive"]
+    click.echo(f"{'ratio':>8} " + " ".join(f"{name:>10}" for name in algorithms))
+    for ratio in ratios:
+        result = intersect_benchmark.run(length, ratio, documents)
+        click.echo(
+            f"{ratio:>8} "
+            + " ".join(f"{result[name]:>8.2f}ms" for name in algorithms)
+        )
+
+
+@cli.command()
+@click.argument("collection", type=CollectionType())
+@click.option("--queries", "-n", type=int, default=50, show_default=True)
+@click.option(
+    "--lengths",
+    "-l",
+    default="1,3,10,30",
+    callback=_int_list,
+    show_default=True,
+    help="Comma-separated numbers of terms per query.",
+)
+@click.option("--topk", "-k", type=int, default=10, show_default=True)
+def vector(collection: Collection, queries: int, lengths: list, topk: int):
+    """Compare the latency of vector search implementations."""
+    index = build_index(collection, statistics=NORMS)
+
+    click.echo(
+        f"{'scheme':>8} {'length':>6} {'search':>8} "
+        f"{'mean':>10} {'p50':>10} {'p95':>10}"
+    )
+    for name, wcs in SCHEMES.items():
+        engine = VectorEngine(index, wcs=wcs)
+        implementations = {
+            "dense": vector_benchmark.dense_vector_search,
+            "sparse": vector_search,
+            "numpy": lambda query, index, k, wcs: engine.search(query, k=k),
+        }
+        for length in lengths:
+            sample = vector_benchmark.sample_queries(index, queries, length)
+            for label, search in implementations.items():
+                result = vector_benchmark.measure(
+                    lambda query: search(query, index, k=topk, wcs=wcs), sample
+                )
+                click.echo(
+                    f"{name:>8} {length:>6} {label:>8} "
+                    + " ".join(
+                        f"{result[key]:>8.2f}ms" for key in ("mean", "p50", "p95")
+                    )
+                )
+
+
+@cli.command()
+@click.argument("collection", type=CollectionType())
+@click.option("--lookups", "-n", type=int, default=100000, show_default=True)
+def lexicon(collection: Collection, lookups: int):
+    """Compare term lookups in the front-coded lexicon and in a dict."""
+    build_index(collection)
+    path = collection.index_cache
+    num_terms = IndexFile(path).meta["num_terms"]
+    click.echo(f"{num_terms} terms, {lookups} lookups (half of them missing)")
+
+    click.echo(f"{'lexicon':>12} {'lookup':>10} {'heap':>10} {'mapped':>10}")
+    for name, result in lexicon_benchmark.run(path, lookups).items():
+        click.echo(
+            f"{name:>12} {result['lookup']:>8.3f}µs "
+            f"{result['heap'] / 2 ** 20:>8.3f}MB "
+            f"{result['mapped'] / 2 ** 20:>8.3f}MB"
+        )
+
+
+@cli.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def analyzer(path: str):
+    """Compare the throughput of text analysis pipelines on the lines of a file."""
+    texts = analysis_benchmark.read_texts(path)
+    click.echo(f"{len(texts)} texts")
+    results = analysis_benchmark.run(texts)
+    click.echo(f"{'pipeline':>10} {'throughput':>16} {'speedup':>8}")
+    for name, result in results.items():
+        click.echo(
+            f"{name:>10} {result:>12.0f} t/s {result / results['legacy']:>7.1f}x"
+        )
@@ -0,0 +1,50 @@
+"""Benchmark of posting list intersection algorithms."""
+import random
+from array import array
+from typing import Callable, Dict, List
+
+from indexes.disk import SKIP_INTERVAL, skip_pointers
+from models.boolean.merge import (
+    gallop_intersect,
+    intersect,
+    merge_intersect,
+    skip_intersect,
+)
+from utils import Timer
+
+
+def posting_list(rng: random.Random, length: int, num_documents: int) -> array:
+    """Return a random posting list of `length` doc IDs."""
+    return array("I", sorted(rng.sample(range(num_documents), length)))
+
+
+def run(
+    length: int, ratio: int, num_documents: int, repeat: int = 5
+) -> Dict[str, float]:
+    """Return the time taken by each algorithm to intersect two lists, in ms.
+
+    The long list has `length` doc IDs, and the short one `length / ratio`.
+    """
+    rng = random.Random(ratio)
+    large = posting_list(rng, length, num_documents)
+    small = posting_list(rng, max(1, length // ratio), num_documents)
+    skips = array("I", skip_pointers(large))
+
+    algorithms: Dict[str, Callable[[], List[int]]] = {
+        "merge": lambda: merge_intersect(small, large),
+        "gallop": lambda: gallop_intersect(small, large),
+        "skips": lambda: skip_intersect(small, large, skips, SKIP_INTERVAL),
+        "adaptive": lambda: intersect(small, large, skips, SKIP_INTERVAL),
+    }
+    expected = sorted(set(small) & set(large))
+
+    timings = {}
+    for name, algorithm in algorithms.items():
+        assert algorithm() == expected, name
+        best = float("inf")
+        for _ in range(repeat):
+            with Timer() as timer:
+                algorithm()
+            best = min(best, timer.total)
+        timings[name] = best * 1000
+    return timings
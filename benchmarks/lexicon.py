@@ -0,0 +1,82 @@
+"""Benchmark of term lookups, in the front-coded lexicon and in a dict."""
+import random
+import tracemalloc
+from typing import Callable, Dict, List
+
+from indexes.disk import IndexFile
+from utils import Timer
+
+
+def sample_terms(index_file: IndexFile, num_lookups: int, seed: int = 0) -> List[str]:
+    """Sample terms to look up. Half of them are not in the lexicon."""
+    rng = random.Random(seed)
+    lexicon = index_file.lexicon
+    terms = [
+        lexicon.term(rng.randrange(len(lexicon))) for _ in range(num_lookups // 2)
+    ]
+    # "~" sorts after letters and digits, so missing terms fall within blocks.
+    missing = [term + "~" for term in terms]
+    sample = terms + missing
+    rng.shuffle(sample)
+    return sample
+
+
+def _traced(build: Callable[[], object]):
+    # Return the result of `build()` and the memory it allocated, in bytes.
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def _lookup_time(lookup: Callable[[str], object], terms: List[str]) -> float:
+    # Best time of a few runs, in microseconds per lookup.
+    best = float("inf")
+    for _ in range(3):
+        with Timer() as timer:
+            for term in terms:
+                lookup(term)
+        best = min(best, timer.total)
+    return best / len(terms) * 1e6
+
+
+def run(path: str, num_lookups: int) -> Dict[str, Dict[str, float]]:
+    """Compare the lexicon of an index file with a dict of its terms.
+
+    The dict maps terms to IDs, and is paired with a list of terms, which
+    maps IDs to terms, as the lexicon does both.
+
+    Returns
+    -------
+    results : dict
+        For each approach, the mean lookup time (`lookup`, in µs), the
+        memory allocated on the heap (`heap`, in bytes), and the size of the
+        memory-mapped data (`mapped`, in bytes).
+    """
+    index_file = IndexFile(path)
+    terms = sample_terms(index_file, num_lookups)
+
+    # A fresh lexicon, whose block index has not been read yet.
+    lexicon = IndexFile(path).lexicon
+    sections = index_file.file.sections
+    _, heads_size = _traced(lambda: lexicon.heads)
+    results = {
+        "front-coded": {
+            "lookup": _lookup_time(lexicon.lookup, terms),
+            "heap": heads_size,
+            "mapped": sections["lexicon.blocks"] + sections["lexicon.offsets"],
+        }
+    }
+
+    def build_dict():
+        term_list = list(index_file.lexicon)
+        return {term: term_id for term_id, term in enumerate(term_list)}, term_list
+
+    (ids, term_list), dict_size = _traced(build_dict)
+    results["dict"] = {
+        "lookup": _lookup_time(ids.get, terms),
+        "heap": dict_size,
+        "mapped": 0,
+    }
+    return results
@@ -0,0 +1,84 @@
+"""Benchmark of the merge phase of an external sort, on text blocks of
+`token doc_id` lines (the format of the blocks of the original sort).
+"""
+import heapq
+import os
+import random
+import string
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils import Timer, multi_open
+
+# A `(token, doc_id)` pair.
+Entry = Tuple[str, int]
+
+
+def _read_entries(f) -> Iterator[Entry]:
+    for line in f:
+        token, doc_id = line.split()
+        yield token, int(doc_id)
+
+
+def _to_line(entry: Entry) -> str:
+    return f"{entry[0]} {entry[1]}\n"
+
+
+def linear_merge(block_paths: List[str], out: str):
+    """Reference merge, which scans the head of every block per entry."""
+    with multi_open(block_paths) as files, open(out, "w") as out_file:
+        blocks = [_read_entries(f) for f in files]
+        entry_pointers: List[Optional[Entry]] = [
+            next(block, None) for block in blocks
+        ]
+        while any(entry_pointers):
+            idx, smallest = min(
+                (i, entry)
+                for i, entry in enumerate(entry_pointers)
+                if entry is not None
+            )
+            out_file.write(_to_line(smallest))
+            entry_pointers[idx] = next(blocks[idx], None)
+
+
+def heap_merge(block_paths: List[str], out: str):
+    """K-way merge: the next entry is popped from a heap holding the head of
+    each block, which costs O(log k) per entry.
+    """
+    with multi_open(block_paths) as files, open(out, "w") as out_file:
+        merged = heapq.merge(*map(_read_entries, files))
+        out_file.writelines(map(_to_line, merged))
+
+
+def _random_token(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+
+
+def write_blocks(directory: str, num_entries: int, num_blocks: int) -> List[str]:
+    """Write `num_blocks` sorted blocks holding `num_entries` in total."""
+    rng = random.Random(0)
+    vocabulary = [_random_token(rng) for _ in range(5000)]
+    paths = []
+    for block in range(num_blocks):
+        entries = sorted(
+            (rng.choice(vocabulary), rng.randint(1, 100000))
+            for _ in range(num_entries // num_blocks)
+        )
+        path = os.path.join(directory, f"block-{block}")
+        with open(path, "w") as f:
+            f.writelines(map(_to_line, entries))
+        paths.append(path)
+    return paths
+
+
+def run(num_entries: int, num_blocks: int) -> Dict[str, float]:
+    """Return the throughput of each merge algorithm, in entries/s."""
+    throughputs = {}
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_blocks(directory, num_entries, num_blocks)
+        out = os.path.join(directory, "out")
+        for name, merge in (("linear", linear_merge), ("heap", heap_merge)):
+            with Timer() as timer:
+                merge(paths, out)
+            throughputs[name] = num_entries / timer.total
+    return throughputs
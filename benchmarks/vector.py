@@ -0,0 +1,73 @@
+"""Benchmark of vector search query latency."""
+import random
+from heapq import nlargest
+from math import sqrt
+from statistics import mean, median
+from typing import Callable, Dict, List, Type
+
+from analysis import get_analyzer
+from datatypes import DocID
+from indexes import Index
+from models.vector.schemes import TfIdfSimple, WeightingScheme
+from utils import Timer
+
+
+def dense_vector_search(
+    request: str, index: Index, k: int = 10, wcs: Type[WeightingScheme] = None
+) -> List[DocID]:
+    """Reference vector search, which scores every document of the index.
+
+    This is the algorithm that `vector_search` used to implement.
+    """
+    if wcs is None:
+        wcs = TfIdfSimple
+
+    scores: Dict[DocID, float] = {doc_id: 0 for doc_id in index.doc_ids}
+    wq: List[float] = []
+    w = wcs(index=index, query=get_analyzer().analyze(request))
+
+    for term in w.query:
+        w_i_q = w.tf(term, request) * w.df(term)
+        wq.append(w_i_q)
+
+        postings = zip(index.postings[term], index.frequencies[term])
+        for doc_id, count in postings:
+            scores[doc_id] += w(term, doc_id, count) * w_i_q
+
+    norm_q = sqrt(sum(w_i_q ** 2 for w_i_q in wq))
+
+    for doc_id in index.doc_ids:
+        if scores[doc_id]:
+            scores[doc_id] /= w.norm(doc_id) * norm_q or 1
+
+    top_k: list = nlargest(k, scores.items(), key=lambda item: item[1])
+    return [doc_id for doc_id, _ in top_k]
+
+
+def sample_queries(
+    index: Index, num_queries: int, length: int, seed: int = 0
+) -> List[str]:
+    """Sample queries made of `length` terms of the index.
+
+    Terms are sampled among the most frequent ones, so that queries match
+    a realistic number of documents.
+    """
+    rng = random.Random(seed)
+    terms = sorted(index.terms, key=lambda term: index.df[term], reverse=True)
+    candidates = terms[:1000]
+    return [" ".join(rng.sample(candidates, length)) for _ in range(num_queries)]
+
+
+def measure(search: Callable[[str], object], queries: List[str]) -> Dict[str, float]:
+    """Run each query and return latency statistics, in milliseconds."""
+    latencies = []
+    for query in queries:
+        with Timer() as timer:
+            search(query)
+        latencies.append(timer.total * 1000)
+    latencies.sort()
+    return {
+        "mean": mean(latencies),
+        "p50": median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+    }
@@ -1,11 +1,11 @@
 import os
 import re
 from itertools import count
-from typing import List
+from typing import Any, Iterator, List, Optional, Tuple
 
-from datatypes import TokenStream, TokenDocIDStream
-from resources import load_stop_words
-from utils import find_files, find_dirs
+from analysis import get_analyzer
+from datatypes import Token, TokenDocIDStream, TokenDocIDPositionStream
+from utils import find_files, find_dirs, read_lines, split_lines
 
 CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
 os.makedirs(CACHE, exist_ok=True)
@@ -16,12 +16,21 @@ class Collection:
 
     A collection is a Python iterator that yields a stream
     of (token, doc_id) pairs.
+
+    Collections can also yield the position of each token in its document
+    through `positions()`. Positions are counted after tokenization (e.g.
+    stop words are not counted), so the same tokenization must be applied to
+    phrase queries.
+
+    Texts are tokenized by the shared analyzer (see `analysis`) whose stages
+    are given by `remove_stop_words` and `stemmer`.
     """
 
-    NON_ALPHA_NUMERIC = re.compile(r"\W+")
+    remove_stop_words = False
+    stemmer: Optional[str] = None
 
     def __init__(self):
-        self.stop_words = load_stop_words()
+        self.analyzer = get_analyzer(self.remove_stop_words, self.stemmer)
 
     @property
     def name(self) -> str:
@@ -30,26 +39,79 @@ class Collection:
     @property
     def index_cache(self) -> str:
         """Return the location of the index cache for this collection."""
+        return os.path.join(CACHE, f"{self.name}_index.idx")
+
+    @property
+    def index_json_cache(self) -> str:
+        """Return the location of the (legacy) JSON index for this collection."""
         return os.path.join(CACHE, f"{self.name}_index.json")
 
     @property
     def index_cache_exists(self) -> bool:
         return os.path.isfile(self.index_cache)
 
-    def tokenize(self, text: str) -> TokenStream:
-        """Separate a text into a stream of tokens."""
-        tokens = filter(None, self.NON_ALPHA_NUMERIC.split(text))
-        tokens = map(str.lower, tokens)
-        return tokens
+    @property
+    def index_segments(self) -> str:
+        """Return the directory of the index segments for this collection."""
+        return os.path.join(CACHE, f"{self.name}_index.segments")
 
-    def __iter__(self) -> TokenDocIDStream:
+    @property
+    def index_shards(self) -> str:
+        """Return the directory of the index shards for this collection."""
+        return os.path.join(CACHE, f"{self.name}_index.shards")
+
+    def tokenize(self, text: str) -> List[Token]:
+        """Separate a text into a list of tokens."""
+        return self.analyzer.analyze(text)
+
+    def positions(self) -> TokenDocIDPositionStream:
+        """Return a stream of (token, doc_id, position) triples."""
+        raise NotImplementedError
+
+    def partitions(self, n: int) -> List[Any]:
+        """Split the collection into parts which can be indexed in parallel.
+
+        Parts are picklable, and sorted by doc ID: the streams returned by
+        `partition_positions()` for each part, concatenated, are the same as
+        `positions()`. Collections which cannot be split have a single part.
+
+        Parameters
+        ----------
+        n : int
+            Number of parts to aim for.
+        """
+        return [None]
+
+    def partition_positions(self, part: Any) -> TokenDocIDPositionStream:
+        """Return the stream of (token, doc_id, position) triples of a part."""
+        return self.positions()
+
+    def load_documents(
+        self, paths: List[str], first_doc_id: int
+    ) -> TokenDocIDPositionStream:
+        """Return the stream of (token, doc_id, position) triples of new
+        documents, which are not part of the collection yet.
+
+        Parameters
+        ----------
+        paths : list of str
+            Files containing the new documents, in the format of the
+            collection.
+        first_doc_id : int
+            Smallest doc ID available for new documents.
+        """
         raise NotImplementedError
 
+    def __iter__(self) -> TokenDocIDStream:
+        for token, doc_id, _ in self.positions():
+            yield token, doc_id
+
 
 class CACM(Collection):
     """The CACM collection."""
 
     location_env_var = "DATA_CACM_PATH"
+    remove_stop_words = True
 
     SECTIONS_OF_INTEREST = {"W", "T", "K"}
     DOC_ID_REGEX = re.compile(r"^\.(?P<section>I) (?P<doc_id>\d+)$")
@@ -58,86 +120,168 @@ class CACM(Collection):
     def __init__(self):
         super().__init__()
         self.filename = os.getenv(self.location_env_var)
-        self.stop_words = load_stop_words()
 
-    def tokenize(self, text: str):
-        tokens = super().tokenize(text)
-        tokens = filter(lambda t: t not in self.stop_words, tokens)
-        return tokens
-
-    def _from_file(self) -> TokenDocIDStream:
-        """Load tokens and doc_ids from the CACM collection from disk."""
+    def _from_file(
+        self, start: int = 0, end: int = None, filename: str = None
+    ) -> TokenDocIDPositionStream:
+        """Load tokens, doc_ids and positions from the CACM collection.
+
+        Parameters
+        ----------
+        start : int, optional
+            Offset of the first document to load, in bytes.
+        end : int, optional
+            Offset of the end of the last document to load, in bytes.
+        filename : str, optional
+            A file in the CACM format. Defaults to the collection file.
+        """
+        if filename is None:
+            filename = self.filename
         # The doc ID and section currently being parsed
         doc_id = None
         current_section = None
+        # Positions of tokens in the current document
+        positions = count()
         # Store the lines of text for the current section
         buffer: List[str] = []
 
-        def flush() -> TokenDocIDStream:
+        def flush() -> TokenDocIDPositionStream:
             """Generate tokens and doc_ids from the buffer, and reset it."""
             nonlocal buffer
             text = " ".join(buffer)
             assert doc_id is not None, "doc_id unexpectedly None"
             for token in self.tokenize(text):
-                yield (token, doc_id)
+                yield (token, doc_id, next(positions))
             buffer = []
 
-        with open(self.filename, "r") as f:
-            for line in f:
-                # Is this line a doc_id line?
-                match = self.DOC_ID_REGEX.match(line)
-                if match is not None:
-                    if doc_id is not None:
-                        # Although most examples show that the last section
-                        # before a new  "I" is "X", in which we're not
-                        # interested, it is possible that the before is not
-                        # empty.
-                        yield from flush()
-                    doc_id = match.group("doc_id")
-                    current_section = match.group("section")
-                    continue
-
-                # If not, is this a section line?
-                match = self.SECTION_REGEX.match(line)
-                if match is not None:
-                    # Flush the buffer for the previous section
+        for line in read_lines(filename, start, end):
+            # Is this line a doc_id line?
+            match = self.DOC_ID_REGEX.match(line)
+            if match is not None:
+                if doc_id is not None:
+                    # Although most examples show that the last section
+                    # before a new  "I" is "X", in which we're not
+                    # interested, it is possible that the before is not
+                    # empty.
                     yield from flush()
-                    current_section = match.group("section")
-
-                # This line is a simple text line. Add it to the buffer, but
-                # only if we're interested in this section.
-                elif current_section in self.SECTIONS_OF_INTEREST:
-                    # strip() to remove white spaces, tabs and newlines.
-                    buffer.append(line.strip())
-
-    def __iter__(self) -> TokenDocIDStream:
+                doc_id = int(match.group("doc_id"))
+                positions = count()
+                current_section = match.group("section")
+                continue
+
+            # If not, is this a section line?
+            match = self.SECTION_REGEX.match(line)
+            if match is not None:
+                # Flush the buffer for the previous section
+                yield from flush()
+                current_section = match.group("section")
+
+            # This line is a simple text line. Add it to the buffer, but
+            # only if we're interested in this section.
+            elif current_section in self.SECTIONS_OF_INTEREST:
+                # strip() to remove white spaces, tabs and newlines.
+                buffer.append(line.strip())
+
+    def positions(self) -> TokenDocIDPositionStream:
         yield from self._from_file()
 
+    def partitions(self, n: int) -> List[Any]:
+        # Split the file on document boundaries.
+        return split_lines(
+            self.filename, n, lambda line, _: line.startswith(b".I ")
+        )
+
+    def partition_positions(self, part: Any) -> TokenDocIDPositionStream:
+        start, end = part
+        yield from self._from_file(start, end)
+
+    def load_documents(
+        self, paths: List[str], first_doc_id: int
+    ) -> TokenDocIDPositionStream:
+        # New documents come with their `.I` doc IDs.
+        for path in paths:
+            for token, doc_id, position in self._from_file(filename=path):
+                if doc_id < first_doc_id:
+                    raise ValueError(
+                        f"Doc ID {doc_id} of {path} is already used: new "
+                        f"documents must have doc IDs from {first_doc_id}."
+                    )
+                yield token, doc_id, position
+
 
 class CS276(Collection):
-    """The Stanford CS276 collection."""
+    """The Stanford CS276 collection.
+
+    Tokens of documents are cached in a binary token cache (see
+    `token_cache`), which is updated when documents change.
+    """
 
     location_env_var = "DATA_CS276_PATH"
 
     def __init__(self):
         super().__init__()
         self.dir_name = os.environ[self.location_env_var]
-        self.token_cache_filename = os.path.join(CACHE, "stanford_tokens.txt")
+        self.token_cache_filename = os.path.join(CACHE, "stanford_tokens.cache")
         self.doc_map_filename = os.path.join(CACHE, "stanford_doc_map.txt")
 
-    def _from_dir(self) -> TokenDocIDStream:
-        doc_ids = count(1)
-        with open(self.doc_map_filename, "w") as doc_map, open(
-            self.token_cache_filename, "w"
-        ) as cache:
-            for _, dir_path in find_dirs(self.dir_name):
-                for filename, path in find_files(dir_path):
-                    print(f"Loading {path}…")
-                    doc_id = next(doc_ids)
-                    doc_map.write(f"{doc_id} {filename}\n")
-                    for token in self._from_file(path):
-                        cache.write(f"{token} {doc_id}\n")
-                        yield (token, doc_id)
+    def _directories(self) -> List[str]:
+        # Sorted, so that doc IDs do not depend on the file system.
+        return sorted(path for _, path in find_dirs(self.dir_name))
+
+    @staticmethod
+    def _files(dir_path: str) -> List[Tuple[str, str]]:
+        return sorted(find_files(dir_path))
+
+    def _manifest(self) -> list:
+        # Path (relative to the collection), size and modification time of
+        # each document, in doc ID order.
+        manifest = []
+        for dir_path in self._directories():
+            directory = os.path.basename(dir_path)
+            for filename, path in self._files(dir_path):
+                stat = os.stat(path)
+                manifest.append(
+                    (f"{directory}/{filename}", stat.st_size, stat.st_mtime_ns)
+                )
+        return manifest
+
+    def _token_cache(self):
+        # Imported here, as `indexes` imports this module.
+        from token_cache import TokenCache
+
+        return TokenCache(self.token_cache_filename, self.dir_name)
+
+    def _from_subdir(
+        self, dir_path: str, doc_ids: Iterator[int]
+    ) -> TokenDocIDPositionStream:
+        for filename, path in self._files(dir_path):
+            print(f"Loading {path}…")
+            doc_id = next(doc_ids)
+            for position, token in enumerate(self._from_file(path)):
+                yield (token, doc_id, position)
+
+    def _update_cache(self):
+        """Tokenize the documents which are not in the token cache, or which
+        have changed since it was written.
+        """
+        cache, manifest = self._token_cache(), self._manifest()
+        if cache.is_current(manifest):
+            return cache
+
+        def tokenize(path: str) -> Iterator[Token]:
+            print(f"Loading {path}…")
+            return self._from_file(path)
+
+        tokenized = cache.update(manifest, tokenize)
+        print(
+            f"Tokenized {tokenized} of {len(manifest)} documents into "
+            f"{self.token_cache_filename}"
+        )
+        with open(f"{self.doc_map_filename}.tmp", "w") as doc_map:
+            for doc_id, (path, _, _) in enumerate(manifest, 1):
+                doc_map.write(f"{doc_id} {os.path.basename(path)}\n")
+        os.replace(f"{self.doc_map_filename}.tmp", self.doc_map_filename)
+        return cache
 
     @staticmethod
     def _from_file(path: str):
@@ -146,16 +290,51 @@ class CS276(Collection):
                 for token in line.split():
                     yield token
 
-    def _from_cache(self) -> TokenDocIDStream:
-        with open(self.token_cache_filename, "r") as f:
-            print(f"Using cache at {self.token_cache_filename}…")
-            for line in f:
-                token, doc_id = line.split()
-                yield token, int(doc_id)
-            print("Finished consuming cache")
-
-    def __iter__(self) -> TokenDocIDStream:
-        try:
-            yield from self._from_cache()
-        except FileNotFoundError:
-            yield from self._from_dir()
+    def _from_cache(
+        self, cache, start: int = 0, end: int = None
+    ) -> TokenDocIDPositionStream:
+        print(f"Using cache at {self.token_cache_filename}…")
+        # Doc IDs are numbered from 1, in the order of the cache.
+        for i, tokens in cache.documents(start, end):
+            doc_id = i + 1
+            for position, token in enumerate(tokens):
+                yield token, doc_id, position
+        print("Finished consuming cache")
+
+    def positions(self) -> TokenDocIDPositionStream:
+        yield from self._from_cache(self._update_cache())
+
+    def partitions(self, n: int) -> List[Any]:
+        cache = self._token_cache()
+        if cache.is_current(self._manifest()):
+            # Split the token cache into ranges of documents.
+            num_docs = len(cache)
+            bounds = sorted({num_docs * i // n for i in range(n + 1)})
+            return [("cache", start, end) for start, end in zip(bounds, bounds[1:])]
+
+        # One part per directory. Doc IDs are numbered across directories,
+        # so the first doc ID of each of them is computed beforehand.
+        # NOTE: the token cache and doc map are only written by serial builds.
+        parts = []
+        first_doc_id = 1
+        for dir_path in self._directories():
+            parts.append(("dir", dir_path, first_doc_id))
+            first_doc_id += len(self._files(dir_path))
+        return parts
+
+    def partition_positions(self, part: Any) -> TokenDocIDPositionStream:
+        kind, *args = part
+        if kind == "cache":
+            start, end = args
+            yield from self._from_cache(self._token_cache(), start, end)
+        else:
+            dir_path, first_doc_id = args
+            yield from self._from_subdir(dir_path, count(first_doc_id))
+
+    def load_documents(
+        self, paths: List[str], first_doc_id: int
+    ) -> TokenDocIDPositionStream:
+        # Each file is a document.
+        for doc_id, path in enumerate(paths, first_doc_id):
+            for position, token in enumerate(self._from_file(path)):
+                yield token, doc_id, position
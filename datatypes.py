@@ -3,6 +3,9 @@ from typing import Iterator, Tuple, List
 Token = str
 Term = str
 DocID = int
+Position = int
 TokenStream = Iterator[Token]
 TokenDocIDStream = Iterator[Tuple[Token, DocID]]
+TokenDocIDPositionStream = Iterator[Tuple[Token, DocID, Position]]
 PostingList = List[DocID]
+PositionalPostingList = List[Tuple[DocID, List[Position]]]
@@ -1,20 +1,32 @@
 import os
+import tracemalloc
+from typing import Optional
 
 import click
-import matplotlib.pyplot as plt
+import numpy as np
 
 from cli_utils import CollectionType
 from data_collections import Collection, CACM
-from indexes import build_index
 from indexes import cli as indexes_cli
+from indexes.index import ALGORITHMS
 from models.boolean import Q
 from models.boolean import cli as boolean_cli
 from models.vector import cli as vector_cli
-from models.vector import vector_search
 from utils import Timer
 
-from .evaluation import precision_recall, parse_answers, parse_queries, interpolate
-from .measures import f_measure, e_measure
+from .evaluation import parse_answers, parse_queries
+from .measures import (
+    average_precision,
+    e_measure,
+    f_measure,
+    interpolated_precision,
+    ndcg_at,
+    precision_at,
+    r_precision,
+    recall_at,
+    relevance,
+)
+from .runs import cached_run
 
 
 @click.group()
@@ -34,91 +46,123 @@ def get_answers() -> dict:
     return parse_answers(os.getenv("DATA_CACM_QRELS"))
 
 
-@cli.command()
-def plot():
-    """Plot the precision-recall curve for the CACM collection."""
-    header("Vector search precision-recall curve")
+# Depth of the rankings plotted by `plot`, and cut-off of `fe`.
+PLOT_DEPTH = 50
+CUTOFF = 10
 
-    collection = CACM()
-    queries = get_queries()
-    answers = get_answers()
-    index = build_index(collection)
 
-    click.echo("Computing precision and recall values…")
+def evaluate(depth: int, workers: int = 1, force: bool = False):
+    """Return the relevance of the rankings of the CACM queries which have
+    relevant documents (see `measures.relevance()`), using the cached run.
+    """
+    queries, answers = get_queries(), get_answers()
+    queries = {
+        query_id: query for query_id, query in queries.items() if answers.get(query_id)
+    }
+    run = cached_run(CACM(), queries, depth, workers=workers, force=force)
+    rankings = {
+        query_id: [doc_id for doc_id, _ in ranking] for query_id, ranking in run.items()
+    }
+    return (list(rankings), *relevance(rankings, answers, depth))
 
-    precisions = {}
 
-    found: dict = {
-        query_id: vector_search(query, index, k=50)
-        for query_id, query in queries.items()
-        if answers.get(query_id)
-    }
+def _max_relevant() -> int:
+    answers = get_answers()
+    queries = get_queries()
+    return max((len(answers.get(query_id, ())) for query_id in queries), default=0)
 
-    for i, fids in found.items():
-        precisions[i] = {}
-        for j, fid in enumerate(fids):
-            if fid in answers.get(i):
-                precision, recall = precision_recall(set(fids[: j + 1]), answers.get(i))
-                precisions[i][recall] = precision
 
-    int_precisions = {
-        i: interpolate(11, iprecisions) for i, iprecisions in precisions.items()
-    }
-    avg_int_precisions = [
-        {
-            "recall": recall,
-            "precision": sum(
-                [
-                    iprecisions[recall] / len(int_precisions)
-                    for _, iprecisions in int_precisions.items()
-                ]
-            ),
-        }
-        for recall in int_precisions[1].keys()
-    ]
-
-    plt.plot(
-        [i["recall"] for i in avg_int_precisions],
-        [i["precision"] for i in avg_int_precisions],
-    )
+def _plot(precisions):
+    # Imported here, as it is slow to import and only used to plot.
+    import matplotlib.pyplot as plt
+
+    plt.plot(np.linspace(0, 1, len(precisions)), precisions)
     plt.xlabel("Recall")
     plt.ylabel("Precision")
     plt.show()
 
 
+@cli.command()
+@click.option(
+    "--depth",
+    "-k",
+    type=int,
+    default=None,
+    help=(
+        "Number of documents ranked per query. Defaults to the largest number "
+        f"of relevant documents of a query, and at least {PLOT_DEPTH}."
+    ),
+)
+@click.option("--cutoff", "-c", type=int, default=CUTOFF, show_default=True)
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of processes running queries. Defaults to the number of CPUs.",
+)
+@click.option("--force", is_flag=True, help="Run queries even if a run is cached.")
+@click.option("--plot", "show_plot", is_flag=True, help="Plot the P/R curve.")
+def run(depth: Optional[int], cutoff: int, workers: int, force: bool, show_plot: bool):
+    """Run the CACM queries once and compute every measure on the run.
+
+    Rankings are stored as a TREC run file in the cache directory, which is
+    re-used (e.g. by `plot`, `rprec` and `fe`) until the index is re-built.
+    """
+    if depth is None:
+        depth = max(PLOT_DEPTH, cutoff, _max_relevant())
+    header(f"Evaluation of {depth} documents per query")
+    query_ids, relevant, num_relevant, num_retrieved = evaluate(
+        depth, workers=workers, force=force
+    )
+
+    precision = precision_at(relevant, num_retrieved, cutoff).mean()
+    recall = recall_at(relevant, num_relevant, cutoff).mean()
+    click.echo(f"Queries: {len(query_ids)}")
+    click.echo(f"P@{cutoff}: {precision:.4f}")
+    click.echo(f"R@{cutoff}: {recall:.4f}")
+    click.echo(f"F-measure@{cutoff}: {f_measure(precision, recall):.4f}")
+    click.echo(f"E-measure@{cutoff}: {e_measure(precision, recall):.4f}")
+    click.echo(f"R-precision: {r_precision(relevant, num_relevant).mean():.4f}")
+    click.echo(f"MAP: {average_precision(relevant, num_relevant).mean():.4f}")
+    ndcg = ndcg_at(relevant, num_relevant, cutoff).mean()
+    click.echo(f"nDCG@{cutoff}: {ndcg:.4f}")
+
+    precisions = interpolated_precision(relevant, num_relevant).mean(axis=0)
+    click.echo("Interpolated precision-recall curve:")
+    for level, value in zip(np.linspace(0, 1, len(precisions)), precisions):
+        click.echo(f"  R={level:.1f}: P={value:.4f}")
+    if show_plot:
+        _plot(precisions)
+
+
+@cli.command()
+def plot():
+    """Plot the precision-recall curve for the CACM collection."""
+    header("Vector search precision-recall curve")
+    click.echo("Computing precision and recall values…")
+    _, relevant, num_relevant, _ = evaluate(PLOT_DEPTH)
+    _plot(interpolated_precision(relevant, num_relevant).mean(axis=0))
+
+
 @cli.command()
 def rprec():
     """Compute the R-precision for queries on the CACM collection."""
-    collection = CACM()
-    header(f"R-precision for the {collection.name} collection")
-
-    queries, answers = get_queries(), get_answers()
-    index = build_index(collection)
-
-    for query_id, query in queries.items():
-        q_answers: set = answers.get(query_id, [])
-        r = len(q_answers)
-        results = vector_search(query, index, k=r)
-        relevant = len(
-            [result_id for result_id in results[:r] if result_id in q_answers]
-        )
-        prec = relevant / r if r else float("inf")
+    header("R-precision for the cacm collection")
+    # The run is cut at the largest R.
+    query_ids, relevant, num_relevant, _ = evaluate(_max_relevant())
+    precisions = r_precision(relevant, num_relevant)
+    for query_id, r, prec in zip(query_ids, num_relevant, precisions):
         click.echo(f"query {query_id}: {r}-precision = {prec}")
 
 
 @cli.command()
 def fe():
     """Show the F- and E-measure on the CACM collection."""
-    collection = CACM()
-    queries, answers = get_queries(), get_answers()
-    index = build_index(collection)
-
     click.echo("Computing precision and recall…")
-    found: dict = {
-        query_id: set(vector_search(query, index, k=10))
-        for query_id, query in queries.items()
-    }
-    precision, recall = map(lambda l: sum(l)/len(l), zip(*[precision_recall(found.get(i), answers.get(i)) for i in answers.keys()]))
+    _, relevant, num_relevant, num_retrieved = evaluate(CUTOFF)
+    precision = precision_at(relevant, num_retrieved, CUTOFF).mean()
+    recall = recall_at(relevant, num_relevant, CUTOFF).mean()
     click.echo(f"Precision: {precision}")
     click.echo(f"Recall: {recall}")
 
@@ -134,28 +178,58 @@ def fe():
 @cli.command()
 @click.argument("collection", type=CollectionType())
 @click.option("-i", "--index", is_flag=True, default=False)
+@click.option(
+    "--server",
+    default=None,
+    help="Time requests sent to a query server (see `python -m server`).",
+)
 @click.pass_context
-def showperfs(ctx: click.Context, collection: Collection, index: bool):
+def showperfs(
+    ctx: click.Context, collection: Collection, index: bool, server: Optional[str]
+):
     click.echo(click.style(f"Collection: {collection.name}", fg="blue"))
 
     if index:
-        header("Index build time")
-        with Timer() as timer:
-            ctx.invoke(
-                indexes_cli.get_command(ctx, "build"), collection=collection, force=True
+        build = indexes_cli.get_command(ctx, "build")
+        results = {}
+        for algorithm in ALGORITHMS:
+            kwargs = dict(collection=collection, algorithm=algorithm, force=True)
+            header(f"Index build time ({algorithm})")
+            with Timer() as timer:
+                ctx.invoke(build, **kwargs)
+            # Tracing allocations slows the build down, so the peak memory
+            # usage is measured by a separate build.
+            header(f"Index build memory ({algorithm})")
+            tracemalloc.start()
+            ctx.invoke(build, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[algorithm] = (timer.total, peak)
+
+        header("Index build")
+        for algorithm, (total, peak) in results.items():
+            click.echo(
+                f"{algorithm}: {total:.6f}s, peak memory: {peak / 2 ** 20:.3f}MB"
             )
-        click.echo(f"Index build time: {timer.total:.6f}s")
 
     header("Boolean request execution time")
     with Timer() as timer:
         ctx.invoke(
-            boolean_cli, collection=collection, query=Q("algorithm") | Q("artifical")
+            boolean_cli,
+            collection=collection,
+            query=Q("algorithm") | Q("artifical"),
+            server=server,
         )
     click.echo(f"{timer.total:.6f}s")
 
     header("Vector request execution time")
     with Timer() as timer:
-        ctx.invoke(vector_cli, collection=collection, query="algorithm artificial")
+        ctx.invoke(
+            vector_cli,
+            collection=collection,
+            query="algorithm artificial",
+            server=server,
+        )
     click.echo(f"{timer.total:.6f}s")
 
     header("Index size")
@@ -1,4 +1,8 @@
-import math
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+from datatypes import DocID
 
 
 def e_measure(precision: float, recall: float, alpha: float = 0.5) -> float:
@@ -7,3 +11,108 @@ def e_measure(precision: float, recall: float, alpha: float = 0.5) -> float:
 
 def f_measure(precision: float, recall: float, alpha: float = 0.5) -> float:
     return 1 - e_measure(precision, recall, alpha=alpha)
+
+
+def relevance(
+    rankings: Dict[int, List[DocID]], answers: Dict[int, Set[DocID]], depth: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the relevance of the ranked documents of each query.
+
+    Measures below are computed for every query at once from these arrays,
+    with queries in the order of `rankings`.
+
+    Returns
+    -------
+    relevant : 2D array of bool
+        Whether the document at each rank (up to `depth`) of each query is
+        relevant. Ranks after the last retrieved document are not relevant.
+    num_relevant : array of int
+        Number of relevant documents of each query.
+    num_retrieved : array of int
+        Number of ranked documents of each query (at most `depth`).
+    """
+    relevant = np.zeros((len(rankings), depth), bool)
+    num_relevant = np.zeros(len(rankings), np.int64)
+    num_retrieved = np.zeros(len(rankings), np.int64)
+    for i, (query_id, doc_ids) in enumerate(rankings.items()):
+        query_answers = answers.get(query_id, set())
+        doc_ids = doc_ids[:depth]
+        relevant[i, : len(doc_ids)] = [doc_id in query_answers for doc_id in doc_ids]
+        num_relevant[i] = len(query_answers)
+        num_retrieved[i] = len(doc_ids)
+    return relevant, num_relevant, num_retrieved
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    # Element-wise ratio, which is 0 where the denominator is 0.
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.zeros(np.shape(numerator)),
+        where=denominator != 0,
+    )
+
+
+def precision_at(
+    relevant: np.ndarray, num_retrieved: np.ndarray, k: int
+) -> np.ndarray:
+    """Precision of the first `k` documents retrieved for each query."""
+    return _ratio(relevant[:, :k].sum(axis=1), np.minimum(num_retrieved, k))
+
+
+def recall_at(relevant: np.ndarray, num_relevant: np.ndarray, k: int) -> np.ndarray:
+    """Recall of the first `k` documents retrieved for each query."""
+    return _ratio(relevant[:, :k].sum(axis=1), num_relevant)
+
+
+def r_precision(relevant: np.ndarray, num_relevant: np.ndarray) -> np.ndarray:
+    """Precision of the first `R` documents retrieved for each query, where
+    `R` is its number of relevant documents.
+    """
+    ranks = np.arange(relevant.shape[1])
+    hits = (relevant & (ranks < num_relevant[:, None])).sum(axis=1)
+    return _ratio(hits, num_relevant)
+
+
+def average_precision(
+    relevant: np.ndarray, num_relevant: np.ndarray
+) -> np.ndarray:
+    """Average of the precisions at the rank of each relevant document of
+    each query (0 for relevant documents which are not retrieved).
+    """
+    precisions = np.cumsum(relevant, axis=1) / np.arange(1, relevant.shape[1] + 1)
+    return _ratio((precisions * relevant).sum(axis=1), num_relevant)
+
+
+def ndcg_at(relevant: np.ndarray, num_relevant: np.ndarray, k: int) -> np.ndarray:
+    """Normalized discounted cumulative gain of the first `k` documents
+    retrieved for each query, with binary relevance.
+    """
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    dcg = (relevant[:, :k] * discounts[: relevant[:, :k].shape[1]]).sum(axis=1)
+    ideal = np.concatenate([[0], np.cumsum(discounts)])
+    return _ratio(dcg, ideal[np.minimum(num_relevant, k)])
+
+
+def interpolated_precision(
+    relevant: np.ndarray, num_relevant: np.ndarray, nb_levels: int = 11
+) -> np.ndarray:
+    """Interpolated precision of each query at `nb_levels` recall levels
+    evenly spaced from 0 to 1, i.e. the best precision at a recall greater
+    than or equal to each level (0 if the level is not reached).
+
+    Returns
+    -------
+    precisions : 2D array of float
+        Precisions of shape `(num_queries, nb_levels)`.
+    """
+    hits = np.cumsum(relevant, axis=1)
+    precisions = hits / np.arange(1, relevant.shape[1] + 1)
+    recalls = _ratio(hits, num_relevant[:, None])
+    # Best precision at each rank or after it.
+    best = np.maximum.accumulate(precisions[:, ::-1], axis=1)[:, ::-1]
+    levels = np.linspace(0, 1, nb_levels)
+    reached = recalls[:, :, None] >= levels
+    first = reached.argmax(axis=1)
+    rows = np.arange(len(relevant))[:, None]
+    return np.where(reached.any(axis=1), best[rows, first], 0)
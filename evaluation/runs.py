@@ -0,0 +1,168 @@
+"""Runs, i.e. the rankings of a batch of queries, stored as TREC run files.
+
+Each line of a run file is a ranked document of a query:
+
+    <query_id> Q0 <doc_id> <rank> <score> <tag>
+
+Runs are cached next to the index, along with the fingerprint of the index
+and the depth of the rankings (in a `.json` file), so that measures can be
+computed again without running any query, until the index is re-built.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from data_collections import Collection
+from datatypes import DocID
+from indexes import build_index
+from models.vector import VectorEngine
+from models.vector.schemes import NORMS, SCHEMES
+
+# Ranked (doc ID, score) pairs of each query.
+Run = Dict[int, List[Tuple[DocID, float]]]
+
+TAG = "cs-ir"
+
+# Engines of the collections searched by the current (worker) process.
+_ENGINES: Dict[Tuple[str, str], VectorEngine] = {}
+
+
+def run_path(collection: Collection, scheme: str) -> str:
+    """Return the location of the cached run of a collection's queries."""
+    directory = os.path.dirname(collection.index_cache)
+    return os.path.join(directory, f"{collection.name}_{scheme}.run")
+
+
+def write_run(path: str, run: Run, tag: str = TAG):
+    """Write a run file, through a temporary file."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        for query_id in sorted(run):
+            for rank, (doc_id, score) in enumerate(run[query_id], 1):
+                f.write(f"{query_id} Q0 {doc_id} {rank} {score} {tag}\n")
+    os.replace(temp_path, path)
+
+
+def read_run(path: str) -> Run:
+    """Read a run file. Documents of each query are sorted by rank."""
+    ranked: Dict[int, List[Tuple[int, DocID, float]]] = {}
+    with open(path) as f:
+        for line in f:
+            query_id, _, doc_id, rank, score, _ = line.split()
+            ranked.setdefault(int(query_id), []).append(
+                (int(rank), int(doc_id), float(score))
+            )
+    return {
+        query_id: [(doc_id, score) for _, doc_id, score in sorted(entries)]
+        for query_id, entries in ranked.items()
+    }
+
+
+def _search(
+    collection: Collection, scheme: str, requests: List[str], depth: int
+) -> List[List[Tuple[DocID, float]]]:
+    key = (collection.name, scheme)
+    engine = _ENGINES.get(key)
+    if engine is None:
+        index = build_index(collection, statistics=NORMS)
+        engine = _ENGINES[key] = VectorEngine(index, wcs=SCHEMES[scheme])
+    return engine.search_many(requests, k=depth, scores=True)
+
+
+def run_queries(
+    collection: Collection,
+    queries: Dict[int, str],
+    depth: int,
+    scheme: str = "simple",
+    workers: int = 1,
+) -> Run:
+    """Run vector search for each query, in a pool of processes.
+
+    Queries are split into one batch per worker. Each worker opens the index
+    of the collection, and scores its batch at once (see
+    `VectorEngine.search_many()`).
+
+    Parameters
+    ----------
+    collection : Collection
+    queries : dict
+        Mapping of query IDs to requests.
+    depth : int
+        Number of documents to rank per query.
+    scheme : str, optional
+        Name of the weighting scheme (see `SCHEMES`).
+    workers : int, optional
+        Number of worker processes. Queries are run by the current process
+        if it is 1.
+    """
+    query_ids = sorted(queries)
+    if workers <= 1:
+        requests = [queries[query_id] for query_id in query_ids]
+        return dict(zip(query_ids, _search(collection, scheme, requests, depth)))
+
+    batches = [query_ids[i::workers] for i in range(workers) if query_ids[i::workers]]
+    run: Run = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _search,
+                collection,
+                scheme,
+                [queries[query_id] for query_id in batch],
+                depth,
+            )
+            for batch in batches
+        ]
+        for batch, future in zip(batches, futures):
+            run.update(zip(batch, future.result()))
+    return run
+
+
+def cached_run(
+    collection: Collection,
+    queries: Dict[int, str],
+    depth: int,
+    scheme: str = "simple",
+    workers: int = 1,
+    force: bool = False,
+) -> Run:
+    """Return the run of a collection's queries, cut at `depth` documents.
+
+    The cached run is used if it was computed against the current index,
+    for the same queries and at least the same depth. Otherwise, queries
+    are run (see `run_queries()`) and the run is cached.
+    """
+    # Queries must run against an up to date index.
+    index_fingerprint = build_index(collection, statistics=NORMS).fingerprint()
+    path = run_path(collection, scheme)
+    meta = {
+        "index": index_fingerprint,
+        "queries": [[query_id, queries[query_id]] for query_id in sorted(queries)],
+    }
+
+    cached: Optional[dict] = None
+    try:
+        with open(f"{path}.json") as f:
+            cached = json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+    if (
+        not force
+        and cached is not None
+        and {key: cached.get(key) for key in meta} == meta
+        and cached["depth"] >= depth
+        and os.path.exists(path)
+    ):
+        print(f"Using run at {path}…")
+        run = read_run(path)
+    else:
+        print(f"Running {len(queries)} queries with {workers} worker(s)…")
+        run = run_queries(collection, queries, depth, scheme, workers)
+        write_run(path, run)
+        with open(f"{path}.json.tmp", "w") as f:
+            json.dump({**meta, "depth": depth}, f)
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+    return {
+        query_id: run.get(query_id, [])[:depth] for query_id in sorted(queries)
+    }
@@ -0,0 +1,79 @@
+"""Bloom filters over sets of terms.
+
+A Bloom filter answers "is this term in the set?" with no false negatives,
+and a small rate of false positives, in a few bits per term. Segments (see
+`segments`) store one over their lexicon, so that queries skip segments
+which do not contain a term without searching their lexicon.
+"""
+import math
+from hashlib import blake2b
+from typing import Iterable, Iterator
+
+from datatypes import Term
+
+DEFAULT_ERROR_RATE = 0.01
+
+
+class BloomFilter:
+    """Bloom filter of `num_bits` bits, using `num_hashes` hash functions.
+
+    Hash functions are derived from a single, stable hash of the term
+    (double hashing), so that filters can be stored on disk.
+
+    Parameters
+    ----------
+    num_bits : int
+        A multiple of 8.
+    num_hashes : int
+    bits : bytes-like, optional
+        Bits of the filter, e.g. as returned by `to_bytes()`.
+    """
+
+    def __init__(self, num_bits: int, num_hashes: int, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        if bits is None:
+            bits = bytearray(num_bits // 8)
+        self.bits = bits
+
+    @classmethod
+    def for_capacity(
+        cls, capacity: int, error_rate: float = DEFAULT_ERROR_RATE
+    ) -> "BloomFilter":
+        """Return an empty filter sized for `capacity` terms."""
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        # Whole bytes, so that the size of the filter is its size in bytes.
+        num_bits = (num_bits + 7) // 8 * 8
+        num_hashes = max(round(num_bits / capacity * math.log(2)), 1)
+        return cls(num_bits, num_hashes)
+
+    @classmethod
+    def from_terms(
+        cls, terms: Iterable[Term], capacity: int, **kwargs
+    ) -> "BloomFilter":
+        bloom = cls.for_capacity(capacity, **kwargs)
+        for term in terms:
+            bloom.add(term)
+        return bloom
+
+    def _positions(self, term: Term) -> Iterator[int]:
+        digest = blake2b(term.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, term: Term):
+        for position in self._positions(term):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, term) -> bool:
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(term)
+        )
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.bits)
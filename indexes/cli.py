@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 
 import click
 from dotenv import load_dotenv
@@ -6,7 +7,11 @@ from dotenv import load_dotenv
 from cli_utils import CollectionType
 from data_collections import Collection
 
-from .index import build_index
+from .codecs import CODECS
+from .disk import DEFAULT_CODEC, IndexFile
+from .index import ALGORITHMS, DEFAULT_ALGORITHM, Index, build_index
+from .segments import Segments
+from .shards import Shards
 
 load_dotenv()
 
@@ -22,9 +27,60 @@ def cli():
 @cli.command()
 @click.argument("collection", type=CollectionType())
 @click.option("--block-size", "-b", default=DEFAULT_BLOCK_SIZE, type=int)
+@click.option(
+    "--codec",
+    type=click.Choice(list(CODECS)),
+    default=DEFAULT_CODEC,
+    show_default=True,
+    help="Posting list compression codec.",
+)
+@click.option(
+    "--positions",
+    is_flag=True,
+    help="Store term positions, for phrase and proximity queries.",
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of processes used to tokenize and sort the collection.",
+)
+@click.option(
+    "--algorithm",
+    type=click.Choice(ALGORITHMS),
+    default=DEFAULT_ALGORITHM,
+    show_default=True,
+    help="Indexing algorithm.",
+)
+@click.option(
+    "--shards",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Split the collection by doc ID range into this many shard indexes.",
+)
 @click.option("--force", is_flag=True)
-def build(collection: Collection, block_size: int, force: bool):
-    if not force and collection.index_cache_exists:
+def build(
+    collection: Collection,
+    block_size: int,
+    codec: str,
+    positions: bool,
+    workers: int,
+    algorithm: str,
+    shards: Optional[int],
+    force: bool,
+):
+    """Build the index of a collection.
+
+    With `--shards`, the collection is split into independent indexes
+    instead, which are searched in parallel by the boolean and vector
+    models. Re-building the index without `--shards` drops them.
+    """
+    exists = collection.index_cache_exists
+    if shards is not None:
+        exists = Shards(collection).exist
+    if not force and exists:
         click.echo(
             click.style(
                 f"{collection.name} index already exists! ", fg="yellow"
@@ -38,12 +94,122 @@ def build(collection: Collection, block_size: int, force: bool):
         )
         return
 
-    build_index(collection, block_size=block_size, no_cache=True)
+    if algorithm == "spimi" and (workers > 1 or shards is not None):
+        raise click.UsageError("--workers and --shards are not supported by SPIMI.")
+
+    if shards is not None:
+        # Shards are built in parallel, by `workers` processes.
+        Shards(collection).build(
+            shards,
+            block_size=block_size,
+            codec=codec,
+            positions=positions,
+            workers=workers,
+        )
+        click.echo(click.style("Done!", fg="green"))
+        return
+
+    Shards(collection).clear()
+    build_index(
+        collection,
+        block_size=block_size,
+        no_cache=True,
+        codec=codec,
+        positions=positions,
+        workers=workers,
+        algorithm=algorithm,
+    )
     click.echo(click.style("Done!", fg="green"))
 
 
 @cli.command()
 @click.argument("collection", type=CollectionType())
-def size(collection):
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--block-size", "-b", default=DEFAULT_BLOCK_SIZE, type=int)
+@click.option(
+    "--no-merge", is_flag=True, help="Do not merge segments in the background."
+)
+def add(collection: Collection, paths: tuple, block_size: int, no_merge: bool):
+    """Add documents to an index, without re-building it.
+
+    New documents are read from PATHS, in the format of the collection
+    (e.g. a file per document for CS276), and indexed into a new segment.
+    """
+    if not collection.index_cache_exists:
+        raise click.UsageError(
+            f"{collection.name} index does not exist: build it first."
+        )
+
+    segments = Segments(collection)
+    segments.add(list(paths), block_size=block_size)
+
+    # Statistics do not change when segments are merged, so they are
+    # computed before merging, while the index has the segments just added.
+    print("Computing document statistics…")
+    Index.from_cache(collection).statistics.compute()
+    if not no_merge:
+        segments.merge_in_background()
+    click.echo(click.style("Done!", fg="green"))
+
+
+@cli.command()
+@click.argument("collection", type=CollectionType())
+def merge(collection: Collection):
+    """Merge the segments of an index, following the merge policy."""
+    merges = Segments(collection).merge()
+    click.echo(f"{merges} merges")
+
+
+def _ratio(raw_size: int, encoded_size: int) -> str:
+    # Empty posting lists have no compression ratio.
+    return f"{raw_size / encoded_size:.2f}" if encoded_size else "n/a"
+
+
+@cli.command()
+@click.argument("collection", type=CollectionType())
+@click.option(
+    "--codecs",
+    "compare_codecs",
+    is_flag=True,
+    help="Compare the compression ratio of every codec.",
+)
+def size(collection: Collection, compare_codecs: bool):
     filesize = os.stat(collection.index_cache).st_size / 2 ** 20
     click.echo(f"{collection.index_cache} --- {filesize:.3f}MB")
+
+    index_file = IndexFile(collection.index_cache)
+    for name, length in index_file.file.sections.items():
+        click.echo(f"  {name}: {length / 2 ** 20:.3f}MB")
+
+    # Compression ratios are relative to 32-bit integers.
+    raw_size = 4 * index_file.meta["num_postings"]
+    postings_size = index_file.file.sections["postings"]
+    codec = index_file.meta["codec"]
+    click.echo(f"Codec: {codec} (ratio: {_ratio(raw_size, postings_size)})")
+
+    if not compare_codecs:
+        return
+
+    sizes = {name: 0 for name in CODECS}
+    postings = index_file.postings
+    for term_id in range(len(index_file.lexicon)):
+        doc_ids = postings.at(term_id)
+        for name, other in CODECS.items():
+            sizes[name] += len(other.encode_postings(doc_ids))
+
+    for name, encoded_size in sizes.items():
+        click.echo(
+            f"  {name}: {encoded_size / 2 ** 20:.3f}MB "
+            f"(ratio: {_ratio(raw_size, encoded_size)})"
+        )
+
+
+@cli.command()
+@click.argument("collection", type=CollectionType())
+@click.option("--output", "-o", type=click.Path(dir_okay=False))
+def export(collection: Collection, output: str):
+    """Export an index to the legacy JSON format."""
+    if output is None:
+        output = collection.index_json_cache
+    Index.from_cache(collection).to_json(output)
+    click.echo(f"Exported to {output}")
@@ -0,0 +1,207 @@
+"""Posting list compression codecs.
+
+Posting lists are sorted, so they are stored as gaps between consecutive
+doc IDs (d-gaps), which are small for frequent terms, and then encoded
+using a variable-length integer code.
+
+Codecs are registered in `CODECS`, keyed by name.
+"""
+from array import array
+from itertools import accumulate
+from typing import Dict, List, Sequence, Tuple
+
+
+def gaps(values: Sequence[int]) -> List[int]:
+    """Convert a sorted sequence of integers to d-gaps."""
+    previous = 0
+    result = []
+    for value in values:
+        result.append(value - previous)
+        previous = value
+    return result
+
+
+class Codec:
+    """Base codec class.
+
+    Codecs encode sequences of non-negative integers to bytes.
+    """
+
+    name: str
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        """Encode a sequence of non-negative integers."""
+        raise NotImplementedError
+
+    def decode(self, data: memoryview) -> Sequence[int]:
+        """Decode a sequence of integers encoded with `encode()`."""
+        raise NotImplementedError
+
+    def encode_postings(self, postings: Sequence[int]) -> bytes:
+        """Encode a sorted posting list."""
+        return self.encode(gaps(postings))
+
+    def decode_postings(self, data: memoryview) -> Sequence[int]:
+        """Decode a posting list encoded with `encode_postings()`."""
+        return list(accumulate(self.decode(data)))
+
+
+class Raw(Codec):
+    """Uncompressed 32-bit integers.
+
+    Decoding is a zero-copy cast of the underlying buffer.
+    """
+
+    name = "raw"
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        return array("I", values).tobytes()
+
+    def decode(self, data: memoryview) -> Sequence[int]:
+        return data.cast("I")
+
+    def encode_postings(self, postings: Sequence[int]) -> bytes:
+        return self.encode(postings)
+
+    def decode_postings(self, data: memoryview) -> Sequence[int]:
+        return self.decode(data)
+
+
+class VByte(Codec):
+    """Variable-byte code.
+
+    Integers are split in groups of 7 bits, most significant first. The high
+    bit is set on the last byte of each integer.
+    """
+
+    name = "vbyte"
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        result = bytearray()
+        for value in values:
+            if value < 128:
+                result.append(value | 128)
+                continue
+            chunk = []
+            while True:
+                chunk.append(value & 127)
+                if value < 128:
+                    break
+                value >>= 7
+            chunk.reverse()
+            chunk[-1] |= 128
+            result.extend(chunk)
+        return bytes(result)
+
+    def decode(self, data: memoryview) -> Sequence[int]:
+        values = []
+        append = values.append
+        n = 0
+        for byte in data:
+            if byte < 128:
+                n = (n << 7) | byte
+            else:
+                append((n << 7) | (byte - 128))
+                n = 0
+        return values
+
+    @staticmethod
+    def decode_one(data: bytes, pos: int) -> Tuple[int, int]:
+        """Decode the integer at `pos`, and return it along with the position
+        of the following byte.
+        """
+        n = 0
+        byte = data[pos]
+        while byte < 128:
+            n = (n << 7) | byte
+            pos += 1
+            byte = data[pos]
+        return (n << 7) | (byte - 128), pos + 1
+
+
+def _to_bits(data: memoryview) -> str:
+    return format(int.from_bytes(data, "big"), f"0{len(data) * 8}b")
+
+
+def _from_bits(bits: str) -> bytes:
+    # Pad with zeros: they are never mistaken for a code, because
+    # every code contains a 1.
+    bits += "0" * (-len(bits) % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, "big") if bits else b""
+
+
+class Gamma(Codec):
+    """Elias gamma code.
+
+    A positive integer `n` is encoded as `len(bin(n)) - 1` zeros followed by
+    `bin(n)`. Integers are shifted by one so that 0 can be encoded.
+
+    Codes are decoded by working on the string of bits, which lets
+    `str.find()` do the unary decoding.
+    """
+
+    name = "gamma"
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        codes = []
+        for value in values:
+            binary = bin(value + 1)[2:]
+            codes.append("0" * (len(binary) - 1))
+            codes.append(binary)
+        return _from_bits("".join(codes))
+
+    def decode(self, data: memoryview) -> Sequence[int]:
+        bits = _to_bits(data)
+        values = []
+        append = values.append
+        find = bits.find
+        position = 0
+        while True:
+            one = find("1", position)
+            if one < 0:
+                return values
+            end = 2 * one - position + 1
+            append(int(bits[one:end], 2) - 1)
+            position = end
+
+
+class Delta(Codec):
+    """Elias delta code.
+
+    A positive integer `n` is encoded as the gamma code of its length in
+    bits, followed by `bin(n)` without its leading 1. Integers are shifted
+    by one so that 0 can be encoded.
+    """
+
+    name = "delta"
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        codes = []
+        for value in values:
+            binary = bin(value + 1)[2:]
+            length = bin(len(binary))[2:]
+            codes.append("0" * (len(length) - 1))
+            codes.append(length)
+            codes.append(binary[1:])
+        return _from_bits("".join(codes))
+
+    def decode(self, data: memoryview) -> Sequence[int]:
+        bits = _to_bits(data)
+        values = []
+        append = values.append
+        find = bits.find
+        position = 0
+        while True:
+            one = find("1", position)
+            if one < 0:
+                return values
+            end = 2 * one - position + 1
+            length = int(bits[one:end], 2)
+            position = end + length - 1
+            append(int("1" + bits[end:position], 2) - 1)
+
+
+CODECS: Dict[str, Codec] = {}
+
+for _codec in (Raw(), VByte(), Gamma(), Delta()):
+    CODECS[_codec.name] = _codec
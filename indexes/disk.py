@@ -0,0 +1,459 @@
+"""Binary on-disk index format.
+
+An index is stored in a section file (see `storage`) made of:
+
+- `doc_ids`: sorted array of document IDs.
+- `lexicon.blocks`: UTF-8 encoded terms in sorted order, front-coded in
+blocks of `lexicon_block_size` terms (stored in the metadata, see `lexicon`).
+- `lexicon.offsets`: offset of each block in `lexicon.blocks` (one more
+item than there are blocks).
+- `postings`: concatenated posting lists, in lexicon order, encoded with
+the codec named in the `codec` metadata (see `codecs`).
+- `postings.offsets`: offset of each posting list in `postings`, in bytes
+(n + 1 items).
+- `frequencies`: for each term, the frequency of the term in each document
+of its posting list (not gap-encoded), encoded with the same codec.
+- `frequencies.offsets`: offset of each term in `frequencies`, in bytes
+(n + 1 items).
+- `df`: document frequency of each term.
+- `skips`: for each term, skip pointers over its posting list, i.e. the last
+doc ID of each block of `skip_interval` postings (see `skip_pointers()`).
+- `skips.offsets`: offset of each term in `skips`, in bytes (n + 1 items).
+
+Indexes written with `bloom=True` (e.g. segments) also have:
+
+- `bloom`: bits of a Bloom filter over the lexicon (see `bloom`), which uses
+`bloom_hashes` hash functions (stored in the metadata).
+
+Positional indexes (built with `positions=True`) also have:
+
+- `positions`: for each term, and each document of its posting list, the
+gaps between positions, encoded with the `vbyte` codec. The number of
+positions is the frequency of the term in the document.
+- `positions.offsets`: offset of each term in `positions`, in bytes
+(n + 1 items).
+
+Terms are found by binary search on the first term of each block of the
+memory-mapped lexicon, and by decoding their block. Posting
+lists are decoded from the mapped file only when they are accessed (with
+the `raw` codec, they are zero-copy views): opening an index does not depend
+on its size.
+"""
+import os
+import shutil
+from array import array
+from itertools import accumulate
+from typing import Callable, Iterator, List, Mapping, Optional, Sequence
+
+from datatypes import Position, PositionalPostingList, PostingList, Term
+
+from .bloom import BloomFilter
+from .codecs import CODECS, gaps
+from .lexicon import BLOCK_SIZE as LEXICON_BLOCK_SIZE
+from .lexicon import Lexicon, LexiconWriter
+from .storage import SectionFile, SectionFileWriter, StorageError
+
+FORMAT = "csir-index"
+FORMAT_VERSION = 6
+DEFAULT_CODEC = "raw"
+POSITIONS_CODEC = CODECS["vbyte"]
+# Number of postings per block of skip pointers.
+SKIP_INTERVAL = 128
+
+
+def skip_pointers(
+    postings: PostingList, interval: int = SKIP_INTERVAL
+) -> PostingList:
+    """Return the last doc ID of each block of `interval` postings.
+
+    Intersections use them to skip whole blocks of a posting list without
+    reading them. Posting lists of a single block have no skip pointers.
+    """
+    num_postings = len(postings)
+    if num_postings <= interval:
+        return []
+    return [
+        postings[min(end, num_postings) - 1]
+        for end in range(interval, num_postings + interval, interval)
+    ]
+
+
+class IndexFormatError(StorageError):
+    pass
+
+
+class PostingsView(Mapping):
+    """Read-only mapping of terms to lists of integers, decoded on access.
+
+    Used for posting lists and the matching term frequencies.
+    Like the `defaultdict` used by in-memory indexes, unknown terms map to an
+    empty list.
+    """
+
+    def __init__(
+        self,
+        lexicon: Lexicon,
+        data: memoryview,
+        offsets: memoryview,
+        decode: Callable[[memoryview], Sequence[int]],
+    ):
+        self._lexicon = lexicon
+        self._data = data
+        self._offsets = offsets
+        self._decode = decode
+
+    def encoded(self, term_id: int) -> memoryview:
+        """Return the encoded list of a term given its ID."""
+        start, end = self._offsets[term_id], self._offsets[term_id + 1]
+        return self._data[start:end]
+
+    def at(self, term_id: int) -> Sequence[int]:
+        """Return the list of a term given its ID."""
+        return self._decode(self.encoded(term_id))
+
+    def __getitem__(self, term: Term) -> Sequence[int]:
+        term_id = self._lexicon.lookup(term)
+        if term_id is None:
+            return self._decode(self._data[0:0])
+        return self.at(term_id)
+
+    def __contains__(self, term) -> bool:
+        return term in self._lexicon
+
+    def __iter__(self) -> Iterator[Term]:
+        return iter(self._lexicon)
+
+    def __len__(self) -> int:
+        return len(self._lexicon)
+
+
+class PositionsView(Mapping):
+    """Read-only mapping of terms to positional posting lists.
+
+    Positional posting lists are lists of `(doc_id, positions)` pairs.
+    Unknown terms map to an empty list.
+    """
+
+    def __init__(
+        self,
+        lexicon: Lexicon,
+        postings: PostingsView,
+        frequencies: PostingsView,
+        positions: memoryview,
+        offsets: memoryview,
+    ):
+        self._lexicon = lexicon
+        self._postings = postings
+        self._frequencies = frequencies
+        self._positions = positions
+        self._offsets = offsets
+
+    def at(self, term_id: int) -> PositionalPostingList:
+        """Return the positional posting list of a term given its ID."""
+        start, end = self._offsets[term_id], self._offsets[term_id + 1]
+        values = POSITIONS_CODEC.decode(self._positions[start:end])
+
+        result = []
+        i = 0
+        for doc_id, tf in zip(
+            self._postings.at(term_id), self._frequencies.at(term_id)
+        ):
+            positions = accumulate(values[i : i + tf])
+            result.append((doc_id, list(positions)))
+            i += tf
+        return result
+
+    def __getitem__(self, term: Term) -> PositionalPostingList:
+        term_id = self._lexicon.lookup(term)
+        return [] if term_id is None else self.at(term_id)
+
+    def __contains__(self, term) -> bool:
+        return term in self._lexicon
+
+    def __iter__(self) -> Iterator[Term]:
+        return iter(self._lexicon)
+
+    def __len__(self) -> int:
+        return len(self._lexicon)
+
+
+class FrequencyView(Mapping):
+    """Read-only mapping of terms to a per-term integer (e.g. `df`).
+
+    Unknown terms map to 0.
+
+    Parameters
+    ----------
+    lexicon : Lexicon
+    values : memoryview
+        Values indexed by term ID.
+    """
+
+    def __init__(self, lexicon: Lexicon, values: memoryview):
+        self._lexicon = lexicon
+        self.values = values
+
+    def __getitem__(self, term: Term) -> int:
+        term_id = self._lexicon.lookup(term)
+        return 0 if term_id is None else self.values[term_id]
+
+    def __contains__(self, term) -> bool:
+        return term in self._lexicon
+
+    def __iter__(self) -> Iterator[Term]:
+        return iter(self._lexicon)
+
+    def __len__(self) -> int:
+        return len(self._lexicon)
+
+
+class _SpooledSection:
+    """Per-term section written to a temporary file.
+
+    Only one section of the index file can be written at a time, so per-term
+    sections other than `postings` are spooled and copied to the index file
+    once all terms have been added.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "w+b")
+        self.offsets = array("Q", [0])
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def copy_to(self, writer: SectionFileWriter, name: str):
+        self.file.seek(0)
+        writer.begin_section(name)
+        shutil.copyfileobj(self.file, writer)
+        writer.end_section()
+        writer.add_section(f"{name}.offsets", self.offsets)
+
+    def close(self):
+        self.file.close()
+        os.remove(self.path)
+
+
+class IndexFileWriter:
+    """Write an index to disk, one posting list at a time.
+
+    Posting lists are streamed to the file as they are added, so only the
+    lexicon is kept in memory. Frequencies and positions are streamed to
+    temporary files and copied to the index file once all terms have been
+    added.
+
+    Example
+    -------
+
+    ```python
+    with IndexFileWriter(path, collection="cacm") as writer:
+        for term in sorted(postings):
+            writer.add(term, postings[term], frequencies[term])
+    ```
+
+    Parameters
+    ----------
+    path : str
+    codec : str, optional
+        Name of the codec used to compress posting lists and frequencies.
+        Defaults to `DEFAULT_CODEC`.
+    positions : bool, optional
+        Whether to store the positions of terms in documents.
+    bloom : bool, optional
+        Whether to store a Bloom filter over the lexicon.
+    **meta : any
+        JSON-serializable metadata stored along the index.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        codec: str = DEFAULT_CODEC,
+        positions: bool = False,
+        bloom: bool = False,
+        **meta,
+    ):
+        self.path = path
+        self._codec = CODECS[codec]
+        self._writer = SectionFileWriter(
+            path,
+            meta={
+                "format": FORMAT,
+                "version": FORMAT_VERSION,
+                "codec": codec,
+                "positions": positions,
+                "skip_interval": SKIP_INTERVAL,
+                "lexicon_block_size": LEXICON_BLOCK_SIZE,
+                **meta,
+            },
+        )
+        self._store_positions = positions
+        self._store_bloom = bloom
+        self._spooled: dict = {}
+        self._lexicon = LexiconWriter(LEXICON_BLOCK_SIZE)
+        self._postings_offsets = array("Q", [0])
+        self._df = array("I")
+        self._doc_ids = set()
+        self._num_postings = 0
+        self._last_key: Optional[bytes] = None
+
+    def __enter__(self):
+        self._writer.__enter__()
+        self._writer.begin_section("postings")
+        names = ["frequencies", "skips"]
+        if self._store_positions:
+            names.append("positions")
+        for name in names:
+            self._spooled[name] = _SpooledSection(f"{self.path}.{name}.tmp")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self._finish()
+        finally:
+            for spooled in self._spooled.values():
+                spooled.close()
+        self._writer.__exit__(exc_type, exc_val, exc_tb)
+
+    def add(
+        self,
+        term: Term,
+        postings: PostingList,
+        frequencies: Sequence[int],
+        positions: List[List[Position]] = None,
+    ):
+        """Add the posting list of a term.
+
+        Terms must be added in increasing order.
+
+        Parameters
+        ----------
+        term : str
+        postings : list of int
+            Sorted list of distinct doc IDs.
+        frequencies : list of int
+            Frequency of the term in each document of the posting list.
+        positions : list of lists of int, optional
+            Sorted positions of the term in each document of the posting list.
+            Required if the writer stores positions.
+        """
+        key = term.encode()
+        if self._last_key is not None and key <= self._last_key:
+            raise ValueError(f"Terms must be added in order, got {term!r}")
+        self._last_key = key
+
+        self._lexicon.add(key)
+
+        data = self._codec.encode_postings(postings)
+        self._writer.write(data)
+        self._postings_offsets.append(self._postings_offsets[-1] + len(data))
+        self._df.append(len(postings))
+        self._doc_ids.update(postings)
+        self._num_postings += len(postings)
+
+        self._spooled["frequencies"].write(self._codec.encode(frequencies))
+        self._spooled["skips"].write(array("I", skip_pointers(postings)).tobytes())
+
+        if self._store_positions:
+            if positions is None:
+                raise ValueError(f"Missing positions for {term!r}")
+            values = []
+            for doc_positions in positions:
+                values.extend(gaps(doc_positions))
+            self._spooled["positions"].write(POSITIONS_CODEC.encode(values))
+
+    def _finish(self):
+        self._writer.end_section()
+        for name, spooled in self._spooled.items():
+            spooled.copy_to(self._writer, name)
+        self._writer.add_section("postings.offsets", self._postings_offsets)
+        lexicon_offsets = self._lexicon.finish()
+        self._writer.add_section("lexicon.blocks", self._lexicon.data)
+        self._writer.add_section("lexicon.offsets", lexicon_offsets)
+        self._writer.add_section("df", self._df)
+        self._writer.add_section("doc_ids", array("I", sorted(self._doc_ids)))
+        self._writer.meta["num_terms"] = len(self._df)
+        self._writer.meta["num_documents"] = len(self._doc_ids)
+        self._writer.meta["num_postings"] = self._num_postings
+        if self._store_bloom:
+            terms = Lexicon(
+                memoryview(self._lexicon.data), lexicon_offsets, len(self._df)
+            )
+            bloom = BloomFilter.from_terms(terms, capacity=len(self._df))
+            self._writer.add_section("bloom", bloom.to_bytes())
+            self._writer.meta["bloom_hashes"] = bloom.num_hashes
+
+
+class IndexFile:
+    """Memory-mapped index, as written by `IndexFileWriter`.
+
+    Parameters
+    ----------
+    path : str
+    """
+
+    def __init__(self, path: str):
+        self.file = SectionFile(path)
+        meta = self.file.meta
+        if meta.get("format") != FORMAT:
+            raise IndexFormatError(f"{path} is not an index file")
+        if meta.get("version") != FORMAT_VERSION:
+            raise IndexFormatError(
+                f"{path} has format version {meta.get('version')}, "
+                f"expected {FORMAT_VERSION}. Re-build it using `--force`."
+            )
+
+        try:
+            codec = CODECS[meta["codec"]]
+        except KeyError:
+            raise IndexFormatError(f"{path} uses an unknown codec")
+
+        self.lexicon = Lexicon(
+            self.file.section("lexicon.blocks"),
+            self.file.array("lexicon.offsets", "Q"),
+            meta["num_terms"],
+            meta["lexicon_block_size"],
+        )
+        self.postings = PostingsView(
+            self.lexicon,
+            self.file.section("postings"),
+            self.file.array("postings.offsets", "Q"),
+            codec.decode_postings,
+        )
+        self.frequencies = PostingsView(
+            self.lexicon,
+            self.file.section("frequencies"),
+            self.file.array("frequencies.offsets", "Q"),
+            codec.decode,
+        )
+        self.df = FrequencyView(self.lexicon, self.file.array("df", "I"))
+        self.doc_ids = self.file.array("doc_ids", "I")
+        self.skips = PostingsView(
+            self.lexicon,
+            self.file.section("skips"),
+            self.file.array("skips.offsets", "Q"),
+            CODECS["raw"].decode,
+        )
+        self.skip_interval: int = meta["skip_interval"]
+
+        self.positions: Optional[PositionsView] = None
+        if meta.get("positions"):
+            self.positions = PositionsView(
+                self.lexicon,
+                self.postings,
+                self.frequencies,
+                self.file.section("positions"),
+                self.file.array("positions.offsets", "Q"),
+            )
+
+        self.bloom: Optional[BloomFilter] = None
+        if "bloom" in self.file:
+            bits = self.file.section("bloom")
+            self.bloom = BloomFilter(len(bits) * 8, meta["bloom_hashes"], bits)
+
+    @property
+    def meta(self) -> dict:
+        return self.file.meta
@@ -1,21 +1,46 @@
-from dataclasses import astuple, dataclass
-from typing import Optional
+from typing import Dict, Iterable, List
 
+import numpy as np
 
-# NOTE: `order=True` auto-generates comparison methods, allowing
-# to sort a list of entries without specifying a `key` function.
-# In this case, comparing two entries will be done by token and then by doc_id.
-@dataclass(order=True)
-class Entry:
-    """Entry in a collection made of a token ID and document ID."""
 
-    token: str
-    doc_id: int
+class TermDictionary:
+    """Interned terms, identified by integer term IDs.
 
-    def to_line(self, nl=True) -> str:
-        return " ".join(map(str, astuple(self))) + (nl and "\n" or "")
+    Term IDs are assigned in order of first occurrence, so that entries can
+    be sorted (and written to disk) as integers. Once all terms have been
+    added, `sort()` renumbers them in lexicon order.
+    """
 
-    @classmethod
-    def from_line(cls, line: str) -> Optional["Entry"]:
-        token, doc_id = line.split()
-        return cls(token, int(doc_id))
+    def __init__(self, terms: Iterable[str] = ()):
+        self.ids: Dict[str, int] = {}
+        self.terms: List[str] = []
+        for term in terms:
+            self.add(term)
+
+    def add(self, term: str) -> int:
+        """Return the ID of a term, assigning it a new ID if needed."""
+        term_id = self.ids.setdefault(term, len(self.terms))
+        if term_id == len(self.terms):
+            self.terms.append(term)
+        return term_id
+
+    def sort(self) -> np.ndarray:
+        """Renumber terms in lexicon order.
+
+        Returns
+        -------
+        labels : array of int
+            The new ID of each term, indexed by its previous ID.
+        """
+        order = sorted(range(len(self.terms)), key=self.terms.__getitem__)
+        labels = np.empty(len(order), dtype=np.uint32)
+        labels[order] = np.arange(len(order), dtype=np.uint32)
+        self.terms = [self.terms[term_id] for term_id in order]
+        self.ids = {term: term_id for term_id, term in enumerate(self.terms)}
+        return labels
+
+    def __getitem__(self, term_id: int) -> str:
+        return self.terms[term_id]
+
+    def __len__(self) -> int:
+        return len(self.terms)
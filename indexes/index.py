@@ -1,21 +1,41 @@
 import json
 import os
+from bisect import bisect_left
 from collections import defaultdict
-from typing import DefaultDict, Dict, Set
+from itertools import groupby
+from typing import Iterable, Mapping, Optional, Sequence
 
 from data_collections import Collection
-from datatypes import DocID, PostingList, Term
+from datatypes import DocID, PositionalPostingList, PostingList, Term
 
-from .entry import Entry
-from .sort import sort_external
+from .disk import DEFAULT_CODEC, IndexFile, IndexFileWriter
+from .entry import TermDictionary
+from .kgrams import KGramIndex
+from .parallel import sort_parallel
+from .segments import (
+    ChainedDocIDs,
+    ChainedKGrams,
+    ChainedSkips,
+    ChainedView,
+    Segments,
+)
+from .sort import group_entries, sort_term_ids
+from .spimi import spimi
+from .stats import STATISTICS, DocumentStatistic, DocumentStatistics
+from .storage import StorageError, fingerprint
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_BLOCK_SIZE = 10000
+ALGORITHMS = ["bsbi", "spimi"]
+DEFAULT_ALGORITHM = "bsbi"
 
 
 class Index:
     """Represents an index.
 
+    Indexes are either held in memory (when built from dicts, e.g. in tests)
+    or backed by a memory-mapped index file (see `Index.open()`).
+
     Parameters
     ----------
     postings : dict
@@ -27,94 +47,328 @@ class Index:
     df : dict
         Document frequency for each term, i.e. number of documents that
         contain the term.
+    positions : dict, optional
+        Mapping of terms to a list of `(doc_id, positions)` pairs, for
+        positional indexes.
+    frequencies : dict, optional
+        Mapping of terms to the frequency of the term in each document of its
+        posting list. If not given, posting lists may contain a doc ID once
+        per occurrence of the term, and frequencies are computed from them.
     """
 
     def __init__(
         self,
-        postings: Dict[Term, PostingList],
-        terms: Set[Term],
-        doc_ids: Set[DocID],
-        df: Dict[Term, int],
+        postings: Mapping[Term, PostingList],
+        terms: Iterable[Term],
+        doc_ids: Iterable[DocID],
+        df: Mapping[Term, int],
         collection: Collection = None,
+        positions: Mapping[Term, PositionalPostingList] = None,
+        frequencies: Mapping[Term, Sequence[int]] = None,
     ):
-        self.postings: DefaultDict[Term, PostingList] = defaultdict(
-            list, **postings
-        )
+        if frequencies is None:
+            postings, frequencies = _count_occurrences(postings)
+        if isinstance(postings, dict):
+            postings = defaultdict(list, postings)
+        if isinstance(frequencies, dict):
+            frequencies = defaultdict(list, frequencies)
+        self.postings: Mapping[Term, PostingList] = postings
+        self.frequencies: Mapping[Term, Sequence[int]] = frequencies
+        if isinstance(df, dict):
+            df = defaultdict(int, df)
         self.terms = terms
         self.doc_ids = doc_ids
         self.df = df
         self.collection = collection
+        if isinstance(positions, dict):
+            positions = defaultdict(list, positions)
+        self.positions: Optional[Mapping[Term, PositionalPostingList]] = positions
+        self.statistics = DocumentStatistics(self)
+        # K-gram index of the terms, for wildcard queries.
+        self.kgrams = KGramIndex(self)
+        # Underlying index file and skip pointers of posting lists, for
+        # indexes opened with `Index.open()`.
+        self.file: Optional[IndexFile] = None
+        self.skips: Optional[Mapping[Term, PostingList]] = None
+        self.skip_interval: Optional[int] = None
 
     @property
     def num_documents(self) -> int:
         """Number of documents in the collection."""
         return len(self.doc_ids)
 
+    @property
+    def has_positions(self) -> bool:
+        """Whether this is a positional index."""
+        return self.positions is not None
+
+    def fingerprint(self) -> Optional[list]:
+        """Return a fingerprint of the index on disk, if any.
+
+        It changes when the index is re-built, e.g. to invalidate caches.
+        """
+        if self.file is None:
+            return None
+        return fingerprint(self.file.file.path)
+
+    def tf(self, term: Term, doc_id: DocID) -> int:
+        """Return the frequency of a term in a document.
+
+        When iterating over a posting list, prefer reading `frequencies`
+        alongside it.
+        """
+        postings = self.postings[term]
+        i = bisect_left(postings, doc_id)
+        if i < len(postings) and postings[i] == doc_id:
+            return self.frequencies[term][i]
+        return 0
+
     @classmethod
-    def from_cache(cls, collection: Collection):
-        print(f"Loading {collection.name} index from cache…")
-        with open(collection.index_cache, "r") as index_file:
+    def open(cls, path: str, collection: Collection = None) -> "Index":
+        """Open a binary index file without loading it in memory."""
+        index_file = IndexFile(path)
+        index = cls(
+            postings=index_file.postings,
+            terms=index_file.lexicon,
+            doc_ids=index_file.doc_ids,
+            df=index_file.df,
+            collection=collection,
+            positions=index_file.positions,
+            frequencies=index_file.frequencies,
+        )
+        index.file = index_file
+        index.statistics = DocumentStatistics(index, path)
+        index.kgrams = KGramIndex(index, path)
+        index.skips = index_file.skips
+        index.skip_interval = index_file.skip_interval
+        return index
+
+    def save(self, path: str, codec: str = DEFAULT_CODEC):
+        """Write the index to a binary index file.
+
+        Parameters
+        ----------
+        path : str
+        codec : str, optional
+            Name of the posting list codec. Defaults to `DEFAULT_CODEC`.
+        """
+        name = self.collection.name if self.collection is not None else None
+        with IndexFileWriter(
+            path, codec=codec, positions=self.has_positions, collection=name
+        ) as writer:
+            for term in sorted(self.postings):
+                positions = None
+                if self.has_positions:
+                    positions = [p for _, p in self.positions[term]]
+                writer.add(
+                    term, self.postings[term], self.frequencies[term], positions
+                )
+
+    @classmethod
+    def from_json(cls, path: str, collection: Collection = None) -> "Index":
+        """Load an index from a (legacy) JSON file."""
+        with open(path, "r") as index_file:
             data = json.load(index_file)
 
-        return Index(
+        index = cls(
             postings=data["postings"],
-            terms=data["terms"],
-            doc_ids=data["doc_ids"],
+            terms=set(data["terms"]),
+            doc_ids=set(data["doc_ids"]),
             df=data["df"],
             collection=collection,
+            positions=data.get("positions"),
+            frequencies=data.get("frequencies"),
         )
+        if "frequencies" not in data:
+            # Legacy indexes stored collection frequencies in `df`.
+            index.df = {term: len(index.postings[term]) for term in index.postings}
+        return index
+
+    def to_json(self, path: str):
+        """Export the index to a JSON file."""
+        data = {
+            "collection": self.collection and self.collection.name,
+            "postings": {
+                term: list(self.postings[term]) for term in self.postings
+            },
+            "frequencies": {
+                term: list(self.frequencies[term]) for term in self.postings
+            },
+            "terms": list(self.terms),
+            "doc_ids": list(self.doc_ids),
+            "df": {term: self.df[term] for term in self.df},
+        }
+        if self.has_positions:
+            data["positions"] = {
+                term: self.positions[term] for term in self.positions
+            }
+        with open(path, "w") as index_file:
+            json.dump(data, index_file)
+
+    @classmethod
+    def from_cache(cls, collection: Collection):
+        print(f"Loading {collection.name} index from cache…")
+        if not collection.index_cache_exists and os.path.isfile(
+            collection.index_json_cache
+        ):
+            print(f"Using legacy JSON index at {collection.index_json_cache}")
+            return cls.from_json(collection.index_json_cache, collection)
+        index = cls.open(collection.index_cache, collection)
+        segments = Segments(collection)
+        if segments.segment_paths():
+            return SegmentedIndex(index, segments)
+        return index
 
     @classmethod
     def build(
-        cls, collection: Collection, block_size: int = DEFAULT_BLOCK_SIZE
+        cls,
+        collection: Collection,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        codec: str = DEFAULT_CODEC,
+        positions: bool = False,
+        workers: int = 1,
+        algorithm: str = DEFAULT_ALGORITHM,
+        statistics: Iterable[DocumentStatistic] = (),
     ):
-        print(f"Building index for {collection.name}…")
-        entries = (Entry(token, doc_id) for token, doc_id in collection)
-        result = sort_external(entries, block_size=block_size)
-
-        postings = defaultdict(list)
-        doc_ids = set()
-        terms = set()
-        document_frequencies = defaultdict(int)
-        for entry in result:
-            # Note: if a token occurs multiple times in a document, the docID will
-            # be present multiple times in the posting list.
-            postings.setdefault(entry.token, [])
-            postings[entry.token].append(entry.doc_id)
-            doc_ids.add(entry.doc_id)
-            terms.add(entry.token)
-            document_frequencies[entry.token] += 1
+        print(f"Building index for {collection.name} ({algorithm})…")
+        # Documents added to the previous index are dropped.
+        Segments(collection).clear()
+        if algorithm == "spimi":
+            if workers > 1:
+                raise ValueError("SPIMI does not support multiple workers")
+            postings = spimi(
+                collection.positions(), block_size=block_size, positions=positions
+            )
+        else:
+            # Entries are sorted with term IDs in place of terms, which are
+            # resolved once posting lists have been grouped.
+            terms = TermDictionary()
+            if workers > 1:
+                entries = sort_parallel(
+                    collection,
+                    terms,
+                    workers,
+                    block_size=block_size,
+                    positions=positions,
+                )
+            else:
+                stream = collection.positions() if positions else iter(collection)
+                entries = sort_term_ids(stream, terms, block_size=block_size)
+            postings = (
+                (terms[term_id], term_postings)
+                for term_id, term_postings in group_entries(entries, positions)
+            )
 
-        index = cls(
+        # Posting lists are streamed straight into the index file, one at a
+        # time.
+        with IndexFileWriter(
+            collection.index_cache,
+            codec=codec,
+            positions=positions,
+            collection=collection.name,
+        ) as writer:
+            for term, (doc_ids, frequencies, doc_positions) in postings:
+                writer.add(term, doc_ids, frequencies, doc_positions)
+
+        index = cls.from_cache(collection)
+        print("Computing document statistics…")
+        index.statistics.compute([*STATISTICS, *statistics])
+        print("Building k-gram index…")
+        index.kgrams.build()
+        return index
+
+    def to_cache(self, codec: str = DEFAULT_CODEC):
+        assert self.collection is not None
+        self.save(self.collection.index_cache, codec=codec)
+
+
+class SegmentedIndex(Index):
+    """Index made of a main index and of the segments of documents added
+    since it was built (see `segments`).
+
+    The posting list of a term is the concatenation of its posting lists in
+    the main index and in each segment. Segments which do not contain a term
+    are skipped using their Bloom filter.
+
+    Parameters
+    ----------
+    main : Index
+        The main index, opened from disk.
+    segments : Segments
+    """
+
+    def __init__(self, main: Index, segments: Segments):
+        manifest, parts = self._open_parts(main, segments)
+        postings = ChainedView(parts, "postings")
+        super().__init__(
             postings=postings,
-            terms=terms,
-            doc_ids=doc_ids,
-            df=document_frequencies,
-            collection=collection,
+            terms=postings,
+            doc_ids=ChainedDocIDs(parts),
+            df=ChainedView(parts, "df", combine=sum),
+            collection=main.collection,
+            positions=ChainedView(parts, "positions") if main.has_positions else None,
+            frequencies=ChainedView(parts, "frequencies"),
+        )
+        self.main = main
+        self.parts = parts
+        self.segments = segments
+        self.generation = manifest["generation"]
+        self.skips = ChainedSkips(parts)
+        self.kgrams = ChainedKGrams(parts)
+        self.skip_interval = main.skip_interval
+        # Statistics depend on the documents of the index, which do not
+        # change when segments are merged.
+        self.statistics = DocumentStatistics(
+            self,
+            segments.manifest_path,
+            version=[*main.fingerprint(), self.generation],
         )
 
-        index.to_cache()
+    @staticmethod
+    def _open_parts(main: Index, segments: Segments):
+        # A merge removes the merged segments right after writing a manifest
+        # which no longer lists them (see `Segments.merge()`): if a segment
+        # is gone, the manifest was read before then, and is read again.
+        previous = None
+        while True:
+            manifest = segments.read_manifest()
+            names = [segment["name"] for segment in manifest["segments"]]
+            try:
+                parts = [main] + [
+                    Index.open(os.path.join(segments.path, name)) for name in names
+                ]
+            except FileNotFoundError:
+                if names == previous:
+                    raise
+                previous = names
+                continue
+            return manifest, parts
 
-        return index
+    def fingerprint(self) -> Optional[list]:
+        generation = self.segments.read_manifest()["generation"]
+        return [*self.main.fingerprint(), generation]
 
-    def to_cache(self):
-        assert self.collection is not None
-        data = {
-            "collection": self.collection.name,
-            "postings": self.postings,
-            "terms": list(self.terms),
-            "doc_ids": list(self.doc_ids),
-            "df": self.df,
-        }
-        contents = json.dumps(data)
-        with open(self.collection.index_cache, "w") as index_file:
-            index_file.write(contents)
+
+def _count_occurrences(postings: Mapping[Term, PostingList]):
+    """Collapse repeated doc IDs of posting lists into term frequencies."""
+    unique = {}
+    frequencies = {}
+    for term, doc_ids in postings.items():
+        groups = [(doc_id, sum(1 for _ in g)) for doc_id, g in groupby(doc_ids)]
+        unique[term] = [doc_id for doc_id, _ in groups]
+        frequencies[term] = [count for _, count in groups]
+    return unique, frequencies
 
 
 def build_index(
     collection: Collection,
     block_size: int = DEFAULT_BLOCK_SIZE,
     no_cache: bool = False,
+    codec: str = DEFAULT_CODEC,
+    positions: bool = False,
+    workers: int = 1,
+    algorithm: str = DEFAULT_ALGORITHM,
+    statistics: Iterable[DocumentStatistic] = (),
 ) -> Index:
     """Build an index out of a token stream.
 
@@ -123,13 +377,24 @@ def build_index(
 
     Notes
     -----
-    This function uses the BSBI (Block Sort-Based Indexing) algorithm.
-    - The stream is consumed and `(token, doc_id)` pairs are stored into
-    a buffer.
+    By default, this function uses the BSBI (Block Sort-Based Indexing)
+    algorithm.
+    - The stream is consumed, tokens are mapped to integer term IDs, and
+    `(term_id, doc_id)` pairs are stored into a buffer.
     - When the buffer is full (as determined by `block_size`), it is sorted
-    in memory and the result is stored on disk.
-    - In the last step, intermediary files are read line-by-line to merge
-    the results into the final index dictionary.
+    in memory and the result is stored on disk as a binary run.
+    - In the last step, term IDs are renumbered in lexicon order, runs are
+    merged, and the merged stream is written to the index file one posting
+    list at a time. Memory usage is thus bounded by the block size (and the
+    size of the largest posting list, and of the lexicon), not by the size
+    of the collection.
+    - With multiple workers, parts of the collection are tokenized and
+    sorted in parallel (see `indexes.parallel`), and the sorted runs of the
+    workers are merged in the last step.
+
+    The SPIMI (Single-Pass In-Memory Indexing) algorithm is also available
+    (see `indexes.spimi`). It does not sort entries, but builds a dictionary
+    of posting lists per block, and merges blocks term by term.
 
     Parameters
     ----------
@@ -140,16 +405,45 @@ def build_index(
     no_cache : bool, optional
         If `True`, skip using the cache (if it exists) and
         re-build the index from scratch.
+    codec : str, optional
+        Name of the codec used to compress posting lists on disk
+        (see `indexes.codecs.CODECS`). Defaults to `"raw"`.
+    positions : bool, optional
+        If `True`, build a positional index, which supports phrase and
+        proximity queries.
+    workers : int, optional
+        Number of processes used to tokenize and sort the collection.
+        The index is the same whatever the number of workers. Defaults to 1.
+    algorithm : str, optional
+        Indexing algorithm, one of `ALGORITHMS`. Defaults to `"bsbi"`.
+        The index is the same whatever the algorithm.
+    statistics : list of DocumentStatistic, optional
+        Per-document statistics to precompute in addition to the registered
+        ones (see `indexes.stats`), e.g. the norms of the vector model's
+        weighting schemes. They are also computed if the cached index does
+        not have them yet.
 
     Returns
     -------
-    index : dict
-        A mapping of a `token` to a posting list (list of `doc_id`s).
+    index : Index
+        An index mapping each `token` to a posting list (list of `doc_id`s).
     """
     if not no_cache:
         try:
-            return Index.from_cache(collection)
+            index = Index.from_cache(collection)
+            index.statistics.compute(statistics)
+            return index
         except FileNotFoundError as exc:
             print(f"Cache does not exist: {exc}")
+        except StorageError as exc:
+            print(f"Cache is unusable: {exc}")
 
-    return Index.build(collection, block_size=block_size)
+    return Index.build(
+        collection,
+        block_size=block_size,
+        codec=codec,
+        positions=positions,
+        workers=workers,
+        algorithm=algorithm,
+        statistics=statistics,
+    )
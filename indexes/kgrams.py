@@ -0,0 +1,310 @@
+"""K-gram index over the lexicon, for wildcard queries and fuzzy matching.
+
+The k-gram index maps each k-gram (substring of `k` characters) of the
+terms of an index to the sorted IDs of the terms which contain it. Terms
+are padded with `$` so that k-grams also mark their start and end, e.g. the
+3-grams of `graph` are `$gr`, `gra`, `rap`, `aph` and `ph$`. The index
+holds both 3-grams (`K`), used for wildcards, and 2-grams (`FUZZY_K`), used
+for fuzzy matching.
+
+A wildcard pattern, e.g. `comput*` or `*graph*`, is expanded into terms by
+intersecting the term IDs of the k-grams of its fixed parts (`$co`, `com`,
+..., `put`), and by matching the pattern against the remaining terms, as
+k-grams may occur in a different order. Only patterns without any k-gram
+(e.g. `c*`) are matched against every term of the lexicon.
+
+Misspelled terms are matched in a similar way (see `KGramIndex.similar()`):
+terms within an edit distance `d` of a term share most of its k-grams, as
+an edit changes at most `k` of them. Only terms which share enough k-grams
+with the term are compared with it, using a bounded edit distance. Shorter
+k-grams are changed by fewer edits, so they filter more candidates out.
+
+K-gram indexes are built along with indexes, and stored next to them in a
+`.kgrams` file:
+
+- `grams.blocks` and `grams.offsets`: the k-grams, front-coded in sorted
+order (see `lexicon`).
+- `terms`: concatenated term IDs of each k-gram, as 32-bit integers.
+- `terms.offsets`: offset of the term IDs of each k-gram in `terms` (one
+more than the number of k-grams).
+"""
+import os
+import re
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from datatypes import Term
+
+from .lexicon import BLOCK_SIZE, Lexicon, LexiconWriter
+from .storage import SectionFile, SectionFileWriter, StorageError, fingerprint
+
+K = 3
+FUZZY_K = 2
+WILDCARD = "*"
+
+
+def is_wildcard(term: Term) -> bool:
+    return WILDCARD in term
+
+
+def kgrams(text: str, k: int = K) -> List[str]:
+    """Return the k-grams of a string, e.g. a term padded with `$`."""
+    return [text[i : i + k] for i in range(len(text) - k + 1)]
+
+
+def _pattern_kgrams(pattern: str, k: int) -> List[str]:
+    # K-grams of the fixed parts of a pattern.
+    grams = []
+    for part in f"${pattern}$".split(WILDCARD):
+        grams.extend(kgrams(part, k))
+    return grams
+
+
+def _compile(pattern: str):
+    return re.compile(".*".join(map(re.escape, pattern.split(WILDCARD))))
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Return the Levenshtein distance between two strings, bounded by
+    `max_distance`.
+
+    Only the cells of the dynamic programming matrix which are at most
+    `max_distance` away from its diagonal are computed, and the computation
+    stops as soon as a row only holds distances greater than `max_distance`.
+
+    Returns
+    -------
+    distance : int
+        The edit distance, or `max_distance + 1` if it is greater than
+        `max_distance`.
+    """
+    bound = max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return bound
+    if a == b:
+        return 0
+    n = len(b)
+    previous = [min(j, bound) for j in range(n + 1)]
+    for i, char in enumerate(a, 1):
+        start = max(1, i - max_distance)
+        end = min(n, i + max_distance)
+        current = [bound] * (n + 1)
+        current[0] = min(i, bound)
+        smallest = current[0] if start == 1 else bound
+        for j in range(start, end + 1):
+            value = min(
+                previous[j - 1] + (char != b[j - 1]),
+                previous[j] + 1,
+                current[j - 1] + 1,
+                bound,
+            )
+            current[j] = value
+            if value < smallest:
+                smallest = value
+        if smallest > max_distance:
+            return bound
+        previous = current
+    return previous[n]
+
+
+class KGramIndex:
+    """K-gram index of the terms of an index.
+
+    It is read from the `.kgrams` file of indexes stored on disk, if it is
+    up to date, and built on first use otherwise.
+
+    Parameters
+    ----------
+    index : Index
+    index_path : str, optional
+        Path to the index file, if the index is stored on disk.
+    k : int, optional
+        Size of the k-grams of wildcard patterns. Defaults to `K`.
+    fuzzy_k : int, optional
+        Size of the k-grams of fuzzy terms. Defaults to `FUZZY_K`.
+    """
+
+    def __init__(
+        self, index, index_path: str = None, k: int = K, fuzzy_k: int = FUZZY_K
+    ):
+        self._index = index
+        self._index_path = index_path
+        self.k = k
+        self.fuzzy_k = fuzzy_k
+        self._grams: Optional[Lexicon] = None
+        self._terms: Optional[Sequence[int]] = None
+        self._offsets: Optional[Sequence[int]] = None
+        self._sorted_terms: Optional[Sequence[Term]] = None
+        # The last expanded pattern and similar terms, as a query expands
+        # them more than once. Callers get copies, which they may modify.
+        self._last_expanded: Tuple[Optional[str], List[Term]] = (None, [])
+        self._last_similar: Tuple[Optional[tuple], Dict[Term, int]] = (None, {})
+        if index_path is not None:
+            self.path = os.path.splitext(index_path)[0] + ".kgrams"
+            self._load()
+
+    @property
+    def version(self) -> list:
+        return fingerprint(self._index_path)
+
+    @property
+    def sizes(self) -> List[int]:
+        """Sizes of the k-grams of the index."""
+        return sorted({self.k, self.fuzzy_k})
+
+    @property
+    def built(self) -> bool:
+        return self._grams is not None
+
+    def _lexicon(self) -> Sequence[Term]:
+        # Terms of the index, in term ID order.
+        if self._sorted_terms is None:
+            index = self._index
+            if index.file is not None:
+                self._sorted_terms = index.file.lexicon
+            else:
+                self._sorted_terms = sorted(
+                    term for term in index.postings if index.postings[term]
+                )
+        return self._sorted_terms
+
+    def _term(self, term_id: int) -> Term:
+        lexicon = self._lexicon()
+        if isinstance(lexicon, Lexicon):
+            return lexicon.term(term_id)
+        return lexicon[term_id]
+
+    def _load(self):
+        try:
+            kgrams_file = SectionFile(self.path)
+        except (FileNotFoundError, StorageError):
+            return
+        meta = kgrams_file.meta
+        # The k-grams of a previous build of the index are stale.
+        if meta.get("index") != self.version or meta.get("k") != self.sizes:
+            return
+        self._grams = Lexicon(
+            kgrams_file.section("grams.blocks"),
+            kgrams_file.array("grams.offsets", "Q"),
+            meta["num_grams"],
+            meta["block_size"],
+        )
+        self._terms = kgrams_file.array("terms", "I")
+        self._offsets = kgrams_file.array("terms.offsets", "Q")
+
+    def build(self):
+        """Build (and persist) the k-gram index, unless it is up to date."""
+        if self.built:
+            return
+        postings: Dict[str, array] = defaultdict(lambda: array("I"))
+        for term_id, term in enumerate(self._lexicon()):
+            # A term may contain a k-gram more than once.
+            grams = set()
+            for k in self.sizes:
+                grams.update(kgrams(f"${term}$", k))
+            for gram in grams:
+                postings[gram].append(term_id)
+
+        writer = LexiconWriter(BLOCK_SIZE)
+        terms = array("I")
+        offsets = array("Q", [0])
+        for gram in sorted(postings):
+            writer.add(gram.encode())
+            terms.extend(postings[gram])
+            offsets.append(len(terms))
+        grams_offsets = writer.finish()
+        self._grams = Lexicon(
+            memoryview(writer.data), grams_offsets, writer.num_terms, BLOCK_SIZE
+        )
+        self._terms = terms
+        self._offsets = offsets
+
+        if self._index_path is None:
+            return
+        meta = {
+            "index": self.version,
+            "k": self.sizes,
+            "num_grams": writer.num_terms,
+            "block_size": BLOCK_SIZE,
+        }
+        with SectionFileWriter(self.path, meta=meta) as kgrams_writer:
+            kgrams_writer.add_section("grams.blocks", writer.data)
+            kgrams_writer.add_section("grams.offsets", grams_offsets)
+            kgrams_writer.add_section("terms", terms)
+            kgrams_writer.add_section("terms.offsets", offsets)
+
+    def __getitem__(self, gram: str) -> Sequence[int]:
+        """Return the sorted IDs of the terms which contain a k-gram."""
+        self.build()
+        gram_id = self._grams.lookup(gram)
+        if gram_id is None:
+            return []
+        return self._terms[self._offsets[gram_id] : self._offsets[gram_id + 1]]
+
+    def candidates(self, pattern: str) -> Optional[List[int]]:
+        """Return the sorted IDs of the terms which contain all the k-grams
+        of a pattern, or `None` if the pattern has no k-gram.
+        """
+        grams = _pattern_kgrams(pattern, self.k)
+        if not grams:
+            return None
+        lists = sorted((self[gram] for gram in set(grams)), key=len)
+        # Start from the rarest k-gram, so that the result only shrinks.
+        result = set(lists[0])
+        for term_ids in lists[1:]:
+            if not result:
+                break
+            result.intersection_update(term_ids)
+        return sorted(result)
+
+    def similar(self, term: Term, max_distance: int) -> Dict[Term, int]:
+        """Return the terms of the index within an edit distance of a term.
+
+        Candidates share at least `n - k * max_distance` of the `n` distinct
+        k-grams of the term, since an edit changes at most `k` of them. Only
+        they are compared with the term (see `edit_distance()`), unless the
+        term is too short for any k-gram to be required.
+
+        Returns
+        -------
+        similar : dict
+            Mapping of similar terms, in sorted order, to their distance to
+            `term` (including `term` itself, if it is in the index).
+        """
+        key = (term, max_distance)
+        if self._last_similar[0] == key:
+            return dict(self._last_similar[1])
+        grams = set(kgrams(f"${term}$", self.fuzzy_k))
+        threshold = len(grams) - self.fuzzy_k * max_distance
+        if threshold > 0:
+            counts = Counter()
+            for gram in grams:
+                counts.update(self[gram])
+            term_ids = sorted(i for i, count in counts.items() if count >= threshold)
+            candidates: Iterable[Term] = (self._term(i) for i in term_ids)
+        else:
+            candidates = iter(self._lexicon())
+        similar = {}
+        for candidate in candidates:
+            distance = edit_distance(term, candidate, max_distance)
+            if distance <= max_distance:
+                similar[candidate] = distance
+        self._last_similar = (key, similar)
+        return dict(similar)
+
+    def expand(self, pattern: str) -> List[Term]:
+        """Return the sorted terms of the index which match a wildcard
+        pattern, where `*` matches any (possibly empty) string.
+        """
+        if self._last_expanded[0] == pattern:
+            return list(self._last_expanded[1])
+        term_ids = self.candidates(pattern)
+        if term_ids is None:
+            terms = iter(self._lexicon())
+        else:
+            terms = (self._term(term_id) for term_id in term_ids)
+        match = _compile(pattern).fullmatch
+        expanded = [term for term in terms if match(term)]
+        self._last_expanded = (pattern, expanded)
+        return list(expanded)
@@ -0,0 +1,187 @@
+"""Front-coded lexicon.
+
+Terms are sorted, so consecutive terms often share a prefix. The lexicon is
+split into blocks of `BLOCK_SIZE` terms: the first term of a block (its
+head) is stored in full, and each other term as the length of the prefix
+it shares with the previous term, followed by the rest of the term:
+
+```
+head: len(term) term
+term: len(prefix) len(suffix) suffix
+```
+
+Lengths are encoded with the variable-byte code of posting lists (see
+`codecs.VByte`). A term is found by binary search on the heads of blocks,
+which are kept in memory (the sparse block index), and then by decoding its
+block.
+"""
+from array import array
+from bisect import bisect_right
+from os.path import commonprefix
+from typing import Iterator, List, Optional
+
+from datatypes import Term
+
+from .codecs import CODECS
+
+BLOCK_SIZE = 16
+VBYTE = CODECS["vbyte"]
+
+
+class LexiconWriter:
+    """Front-code sorted terms into blocks.
+
+    Parameters
+    ----------
+    block_size : int, optional
+        Number of terms per block. Defaults to `BLOCK_SIZE`.
+    """
+
+    def __init__(self, block_size: int = BLOCK_SIZE):
+        self.block_size = block_size
+        self.data = bytearray()
+        # Offset of each block in `data`, and the end of the last one.
+        self.offsets = array("Q", [0])
+        self.num_terms = 0
+        self._previous = b""
+
+    def add(self, key: bytes):
+        """Add a UTF-8 encoded term, greater than the previous one."""
+        if self.num_terms % self.block_size == 0:
+            if self.num_terms:
+                self.offsets.append(len(self.data))
+            self.data += VBYTE.encode((len(key),))
+            self.data += key
+        else:
+            prefix = len(commonprefix((self._previous, key)))
+            self.data += VBYTE.encode((prefix, len(key) - prefix))
+            self.data += key[prefix:]
+        self._previous = key
+        self.num_terms += 1
+
+    def finish(self) -> array:
+        """Return the offsets of blocks, once all terms have been added."""
+        if self.num_terms:
+            self.offsets.append(len(self.data))
+        return self.offsets
+
+
+class Lexicon:
+    """Sorted, memory-mapped set of terms, front-coded in blocks.
+
+    Each term is identified by its rank in the lexicon (its term ID). The
+    term ID is also the index of the term's posting list and statistics in
+    the other sections of an index file.
+
+    Parameters
+    ----------
+    data : memoryview
+        Front-coded blocks, as written by `LexiconWriter`.
+    offsets : memoryview
+        Offset of each block in `data`, and the end of the last one.
+    num_terms : int
+    block_size : int, optional
+    """
+
+    def __init__(
+        self,
+        data: memoryview,
+        offsets: memoryview,
+        num_terms: int,
+        block_size: int = BLOCK_SIZE,
+    ):
+        self._data = data
+        self._offsets = offsets
+        self._num_terms = num_terms
+        self.block_size = block_size
+        self._heads: Optional[List[bytes]] = None
+        # The last decoded block, as terms are often accessed in order.
+        self._last_block = (-1, [])
+
+    def __len__(self) -> int:
+        return self._num_terms
+
+    @property
+    def heads(self) -> List[bytes]:
+        """First term of each block, read on first use."""
+        if self._heads is None:
+            data = self._data
+            heads = []
+            for block in range(len(self._offsets) - 1):
+                length, start = VBYTE.decode_one(data, self._offsets[block])
+                heads.append(bytes(data[start : start + length]))
+            self._heads = heads
+        return self._heads
+
+    def _block(self, block: int) -> List[bytes]:
+        # Return the (encoded) terms of a block.
+        if self._last_block[0] == block:
+            return self._last_block[1]
+        data = self._data[self._offsets[block] : self._offsets[block + 1]]
+        terms = list(self._decode(bytes(data)))
+        self._last_block = (block, terms)
+        return terms
+
+    @staticmethod
+    def _decode(data: bytes) -> Iterator[bytes]:
+        # Yield the (encoded) terms of a block, one at a time, so that a
+        # lookup can stop as soon as it has gone past the term.
+        length, pos = VBYTE.decode_one(data, 0)
+        term = data[pos : pos + length]
+        pos += length
+        yield term
+        end = len(data)
+        while pos < end:
+            # Lengths nearly always fit in a single byte.
+            prefix = data[pos]
+            if prefix >= 128:
+                prefix -= 128
+                pos += 1
+            else:
+                prefix, pos = VBYTE.decode_one(data, pos)
+            length = data[pos]
+            if length >= 128:
+                length -= 128
+                pos += 1
+            else:
+                length, pos = VBYTE.decode_one(data, pos)
+            term = term[:prefix] + data[pos : pos + length]
+            pos += length
+            yield term
+
+    def term(self, term_id: int) -> Term:
+        """Return the term with the given ID."""
+        if not 0 <= term_id < self._num_terms:
+            raise IndexError(term_id)
+        block, i = divmod(term_id, self.block_size)
+        return self._block(block)[i].decode()
+
+    def lookup(self, term: Term) -> Optional[int]:
+        """Return the ID of a term, or `None` if it is not in the lexicon.
+
+        UTF-8 preserves code point order, so terms can be compared as bytes.
+        """
+        key = term.encode()
+        block = bisect_right(self.heads, key) - 1
+        if block < 0:
+            return None
+        if self._last_block[0] == block:
+            terms = iter(self._last_block[1])
+        else:
+            start, end = self._offsets[block], self._offsets[block + 1]
+            terms = self._decode(bytes(self._data[start:end]))
+        # Terms are decoded in order, so the scan stops past the key.
+        for i, candidate in enumerate(terms):
+            if candidate == key:
+                return block * self.block_size + i
+            if candidate > key:
+                break
+        return None
+
+    def __contains__(self, term) -> bool:
+        return isinstance(term, str) and self.lookup(term) is not None
+
+    def __iter__(self) -> Iterator[Term]:
+        for block in range(len(self._offsets) - 1):
+            for key in self._block(block):
+                yield key.decode()
@@ -0,0 +1,111 @@
+"""Parallel sort of the entries of a collection.
+
+The collection is split into parts (see `Collection.partitions()`), which
+are tokenized and sorted by a pool of worker processes. Each worker writes
+a sorted binary run (see `sort.BinarySorter`) using its own term IDs, and
+runs are merged on the fly by the parent process, once term IDs of each
+run have been mapped to those of the whole collection.
+
+Parts are numbered in doc ID order and doc IDs are assigned by the parts
+themselves, so the merged stream is the same as the one of a serial build.
+"""
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, List
+
+import numpy as np
+
+from data_collections import Collection
+
+from .entry import TermDictionary
+from .sort import WRITE_BUFFER_SIZE, BinarySorter, Record, write_run, read_runs
+
+
+def _sort_part(
+    collection: Collection,
+    part: Any,
+    positions: bool,
+    out: str,
+    block_size: int,
+    temp_dir: str,
+) -> List[str]:
+    stream = collection.partition_positions(part)
+    if not positions:
+        stream = ((token, doc_id) for token, doc_id, _ in stream)
+    terms = TermDictionary()
+    with BinarySorter(terms, block_size=block_size, temp_dir=temp_dir) as sorter:
+        for entry in stream:
+            sorter.add(entry)
+        sorter.finish()
+        with open(out, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+            write_run(f, sorter.merge())
+    # Sorted terms of the part, indexed by term ID.
+    return terms.terms
+
+
+def sort_parallel(
+    collection: Collection,
+    terms: TermDictionary,
+    workers: int,
+    block_size: int,
+    positions: bool = False,
+    temp_dir: str = "tmp",
+) -> Iterator[Record]:
+    """Sort the entries of a collection using multiple processes.
+
+    Parameters
+    ----------
+    collection : Collection
+    terms : TermDictionary
+        Where terms are interned. As with `sort.sort_term_ids()`, records
+        are yielded with term IDs in place of tokens.
+    workers : int
+        Number of worker processes.
+    block_size : int
+        Number of entries per block, in each worker.
+    positions : bool, optional
+        If `True`, yield `(token, doc_id, position)` triples instead of
+        `(token, doc_id)` pairs.
+    temp_dir : str, optional
+        Where run files and blocks are stored.
+
+    Yields
+    ------
+    record : tuple
+        Records, in sorted order.
+    """
+    parts = collection.partitions(workers)
+    print(f"Sorting {len(parts)} parts using {workers} workers…")
+    os.makedirs(temp_dir, exist_ok=True)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _sort_part,
+                    collection,
+                    part,
+                    positions,
+                    os.path.join(temp_dir, f"run-{i}"),
+                    block_size,
+                    os.path.join(temp_dir, f"blocks-{i}"),
+                )
+                for i, part in enumerate(parts)
+            ]
+            vocabularies = [future.result() for future in futures]
+
+        for vocabulary in vocabularies:
+            for term in vocabulary:
+                terms.add(term)
+        terms.sort()
+        # Runs are in lexicon order, and so are the global term IDs.
+        labels = [
+            np.array([terms.ids[term] for term in vocabulary], dtype=np.uint32)
+            for vocabulary in vocabularies
+        ]
+        run_paths = [os.path.join(temp_dir, f"run-{i}") for i in range(len(parts))]
+
+        print(f"Merging {len(run_paths)} runs…")
+        yield from read_runs(run_paths, 3 if positions else 2, labels)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,455 @@
+"""Index segments, for adding documents without re-building the index.
+
+New documents are indexed into small auxiliary indexes (segments), stored
+in the collection's segments directory next to a JSON manifest:
+
+```json
+{
+    "generation": 2,
+    "next_segment": 3,
+    "last_doc_id": 3210,
+    "segments": [{"name": "1.idx", "level": 1, "num_documents": 4}, ...]
+}
+```
+
+Segments are listed in doc ID order: new documents get doc IDs greater
+than those of the main index and of previous segments, so the posting list
+of a term is the concatenation of its posting lists in the main index and
+in each segment (see `index.SegmentedIndex`). `generation` is incremented
+each time documents are added, but not when segments are merged.
+
+Segments are merged under a logarithmic merge policy: new segments have
+level 0, and whenever there are `MERGE_FACTOR` segments of the same level,
+they are merged into one segment of the next level. There are thus
+`O(log n)` segments for `n` added documents, and each posting is rewritten
+`O(log n)` times.
+
+Segments store a Bloom filter over their lexicon (see `bloom`), so that
+queries skip the segments which do not contain a term.
+"""
+import fcntl
+import heapq
+import json
+import os
+import shutil
+import sys
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from itertools import chain, groupby
+from operator import itemgetter
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence
+
+from datatypes import Term
+
+from data_collections import Collection
+
+from .disk import DEFAULT_CODEC, IndexFile, IndexFileWriter
+from .entry import TermDictionary
+from .sort import group_entries, sort_term_ids
+
+MANIFEST = "manifest.json"
+MERGE_FACTOR = 2
+DEFAULT_BLOCK_SIZE = 10000
+
+
+def _lexicon_entries(index_file: IndexFile, i: int):
+    for term_id, term in enumerate(index_file.lexicon):
+        yield term, i, term_id
+
+
+class Segments:
+    """Segments of a collection's index.
+
+    Parameters
+    ----------
+    collection : Collection
+    """
+
+    def __init__(self, collection: Collection):
+        self.collection = collection
+        self.path = collection.index_segments
+        self.manifest_path = os.path.join(self.path, MANIFEST)
+
+    @contextmanager
+    def _lock(self, name: str = "manifest"):
+        # Lock files are shared with other processes, e.g. a background
+        # merge started by a previous `indexes add`.
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, f"{name}.lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_manifest(self) -> dict:
+        """Return the manifest, or that of an empty set of segments."""
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {
+                "generation": 0,
+                "next_segment": 1,
+                "last_doc_id": None,
+                "segments": [],
+            }
+
+    def _write_manifest(self, manifest: dict):
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def segment_paths(self) -> List[str]:
+        """Return the paths of the current segments, in doc ID order."""
+        return [
+            os.path.join(self.path, segment["name"])
+            for segment in self.read_manifest()["segments"]
+        ]
+
+    def clear(self):
+        """Remove all segments, e.g. when the main index is re-built."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def add(
+        self, paths: List[str], block_size: int = DEFAULT_BLOCK_SIZE
+    ) -> dict:
+        """Index new documents into a new segment.
+
+        Segments use the codec of the main index, and store positions if it
+        does.
+
+        Parameters
+        ----------
+        paths : list of str
+            Files containing the new documents (see
+            `Collection.load_documents()`).
+        block_size : int, optional
+            Number of entries per block of the external sort.
+
+        Returns
+        -------
+        segment : dict
+            The manifest entry of the new segment.
+        """
+        main = IndexFile(self.collection.index_cache)
+        codec = main.meta.get("codec", DEFAULT_CODEC)
+        positions = bool(main.meta.get("positions"))
+
+        with self._lock():
+            manifest = self.read_manifest()
+            last_doc_id = manifest["last_doc_id"]
+            if last_doc_id is None:
+                last_doc_id = main.doc_ids[-1] if len(main.doc_ids) else 0
+            stream = self.collection.load_documents(paths, last_doc_id + 1)
+            if not positions:
+                stream = ((token, doc_id) for token, doc_id, _ in stream)
+
+            name = f"{manifest['next_segment']}.idx"
+            terms = TermDictionary()
+            entries = sort_term_ids(
+                stream,
+                terms,
+                block_size=block_size,
+                temp_dir=os.path.join(self.path, "tmp"),
+            )
+            path = os.path.join(self.path, name)
+            with IndexFileWriter(
+                path,
+                codec=codec,
+                positions=positions,
+                bloom=True,
+                collection=self.collection.name,
+            ) as writer:
+                for term_id, postings in group_entries(entries, positions):
+                    writer.add(terms[term_id], *postings)
+            doc_ids = IndexFile(path).doc_ids
+
+            segment = {"name": name, "level": 0, "num_documents": len(doc_ids)}
+            manifest["segments"].append(segment)
+            manifest["next_segment"] += 1
+            manifest["generation"] += 1
+            if doc_ids:
+                manifest["last_doc_id"] = doc_ids[-1]
+            else:
+                manifest["last_doc_id"] = last_doc_id
+            self._write_manifest(manifest)
+
+        print(f"Added {len(doc_ids)} documents to segment {name}")
+        return segment
+
+    @staticmethod
+    def _pick(segments: List[dict]) -> Optional[List[dict]]:
+        # Segments are sorted by decreasing level, so segments of the same
+        # level are contiguous.
+        for _, group in groupby(segments, key=itemgetter("level")):
+            group = list(group)
+            if len(group) >= MERGE_FACTOR:
+                return group[:MERGE_FACTOR]
+        return None
+
+    def _merge_files(self, paths: List[str], out: str):
+        files = [IndexFile(path) for path in paths]
+        meta = files[0].meta
+        positions = bool(meta.get("positions"))
+        # Stream the lexicons of all segments in term order. Segments are in
+        # doc ID order, so posting lists are concatenated in that order.
+        lexicons = [_lexicon_entries(f, i) for i, f in enumerate(files)]
+        with IndexFileWriter(
+            out,
+            codec=meta["codec"],
+            positions=positions,
+            bloom=True,
+            collection=meta.get("collection"),
+        ) as writer:
+            for term, group in groupby(heapq.merge(*lexicons), key=itemgetter(0)):
+                doc_ids = []
+                frequencies = []
+                doc_positions = [] if positions else None
+                for _, i, term_id in group:
+                    doc_ids.extend(files[i].postings.at(term_id))
+                    frequencies.extend(files[i].frequencies.at(term_id))
+                    if positions:
+                        doc_positions.extend(
+                            p for _, p in files[i].positions.at(term_id)
+                        )
+                writer.add(term, doc_ids, frequencies, doc_positions)
+
+    def merge(self) -> int:
+        """Merge segments until the merge policy is satisfied.
+
+        Returns
+        -------
+        merges : int
+            Number of merges performed.
+        """
+        merges = 0
+        # Only one merge runs at a time, but documents can be added while
+        # segments are being merged.
+        with self._lock("merge"):
+            while True:
+                with self._lock():
+                    manifest = self.read_manifest()
+                    picked = self._pick(manifest["segments"])
+                    if picked is None:
+                        return merges
+                    merged_name = f"{manifest['next_segment']}.idx"
+                    manifest["next_segment"] += 1
+                    self._write_manifest(manifest)
+
+                names = [segment["name"] for segment in picked]
+                print(f"Merging segments {', '.join(names)} into {merged_name}…")
+                self._merge_files(
+                    [os.path.join(self.path, name) for name in names],
+                    os.path.join(self.path, merged_name),
+                )
+                merged = {
+                    "name": merged_name,
+                    "level": picked[0]["level"] + 1,
+                    "num_documents": sum(s["num_documents"] for s in picked),
+                }
+
+                with self._lock():
+                    manifest = self.read_manifest()
+                    segments = manifest["segments"]
+                    start = [s["name"] for s in segments].index(names[0])
+                    segments[start : start + len(names)] = [merged]
+                    self._write_manifest(manifest)
+
+                # Readers which opened the previous segments keep them
+                # mapped in memory, and those opening them now read the new
+                # manifest (see `SegmentedIndex`).
+                for name in names:
+                    os.remove(os.path.join(self.path, name))
+                    _remove_sidecars(os.path.join(self.path, name))
+                merges += 1
+
+    def merge_in_background(self) -> int:
+        """Merge segments in a detached child process.
+
+        The current process does not wait for merges to complete, e.g. it
+        may exit right away. Merges are safe against concurrent readers and
+        writers (see `merge()`), in this or another process.
+
+        Returns
+        -------
+        pid : int
+            ID of the merging process.
+        """
+        # Output buffered so far must not be written by both processes.
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            # Detach from the session, so that the merge is not interrupted
+            # when the terminal of the parent process is closed.
+            os.setsid()
+            status = 1
+            try:
+                self.merge()
+                status = 0
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        return pid
+
+
+def _remove_sidecars(path: str):
+    # Files stored next to a segment, e.g. its k-gram index.
+    for extension in (".stats", ".kgrams"):
+        try:
+            os.remove(os.path.splitext(path)[0] + extension)
+        except FileNotFoundError:
+            pass
+
+
+def _may_contain(part, term: Term) -> bool:
+    # Segments have a Bloom filter, the main index does not.
+    bloom = part.file.bloom if part.file is not None else None
+    return bloom is None or term in bloom
+
+
+def _concatenate(values: List[Sequence]) -> Sequence:
+    non_empty = [value for value in values if len(value)]
+    if len(non_empty) == 1:
+        # Avoid copying, e.g. zero-copy posting lists of the main index.
+        return non_empty[0]
+    return list(chain.from_iterable(values))
+
+
+class ChainedView(Mapping):
+    """Read-only mapping of terms to values combined over several indexes.
+
+    Indexes (the main index, then segments in doc ID order) are called
+    parts. Parts whose Bloom filter does not contain a term are skipped.
+
+    Parameters
+    ----------
+    parts : list of Index
+    attribute : str
+        Name of the per-term mapping of parts, e.g. `"postings"`.
+    combine : callable, optional
+        Combines the values of the parts which may contain a term. Defaults
+        to concatenating them.
+    """
+
+    def __init__(
+        self,
+        parts: list,
+        attribute: str,
+        combine: Callable[[list], object] = _concatenate,
+    ):
+        self._parts = parts
+        self._attribute = attribute
+        self._combine = combine
+
+    def _candidates(self, term: Term) -> list:
+        return [part for part in self._parts if _may_contain(part, term)]
+
+    def __getitem__(self, term: Term):
+        return self._combine(
+            [getattr(part, self._attribute)[term] for part in self._candidates(term)]
+        )
+
+    def __contains__(self, term) -> bool:
+        return isinstance(term, str) and any(
+            term in part.terms for part in self._candidates(term)
+        )
+
+    def __iter__(self) -> Iterator[Term]:
+        # Terms of each part are sorted.
+        merged = heapq.merge(*(iter(part.terms) for part in self._parts))
+        return (term for term, _ in groupby(merged))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class ChainedDocIDs(Sequence):
+    """Sorted doc IDs of several indexes, read from their own doc IDs.
+
+    Doc IDs of a part are greater than those of the previous parts, so this
+    is their concatenation, without copying them.
+    """
+
+    def __init__(self, parts: list):
+        self._doc_ids = [part.doc_ids for part in parts if len(part.doc_ids)]
+        # Position of the first doc ID of each part, and the total length.
+        self._starts = [0]
+        for doc_ids in self._doc_ids:
+            self._starts.append(self._starts[-1] + len(doc_ids))
+
+    def __len__(self) -> int:
+        return self._starts[-1]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            return list(self._chain(start, stop))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        part = bisect_right(self._starts, i) - 1
+        return self._doc_ids[part][i - self._starts[part]]
+
+    def _chain(self, start: int, stop: int) -> Iterator[int]:
+        for doc_ids, offset in zip(self._doc_ids, self._starts):
+            if offset >= stop:
+                break
+            if offset + len(doc_ids) > start:
+                yield from doc_ids[max(start - offset, 0) : stop - offset]
+
+    def __iter__(self) -> Iterator[int]:
+        return chain.from_iterable(self._doc_ids)
+
+    def __contains__(self, doc_id) -> bool:
+        for doc_ids in self._doc_ids:
+            if doc_id <= doc_ids[-1]:
+                i = bisect_left(doc_ids, doc_id)
+                return i < len(doc_ids) and doc_ids[i] == doc_id
+        return False
+
+
+class ChainedSkips(ChainedView):
+    """Skip pointers of posting lists combined over several indexes.
+
+    Skip pointers of a part are only valid for the combined posting list if
+    no other part contains the term: otherwise, there are none.
+    """
+
+    def __init__(self, parts: list):
+        super().__init__(parts, "skips")
+
+    def __getitem__(self, term: Term):
+        parts = [part for part in self._candidates(term) if part.df[term]]
+        if len(parts) == 1 and parts[0].skips is not None:
+            return parts[0].skips[term]
+        return []
+
+
+class ChainedKGrams:
+    """K-gram indexes combined over several indexes.
+
+    Wildcard patterns (and similar terms) are expanded in each part, and the
+    expanded terms of the parts are merged.
+    """
+
+    def __init__(self, parts: list):
+        self._parts = parts
+
+    def build(self):
+        for part in self._parts:
+            part.kgrams.build()
+
+    def expand(self, pattern: str) -> List[Term]:
+        merged = heapq.merge(*(part.kgrams.expand(pattern) for part in self._parts))
+        return [term for term, _ in groupby(merged)]
+
+    def similar(self, term: Term, max_distance: int) -> Dict[Term, int]:
+        similar = {}
+        for part in self._parts:
+            similar.update(part.kgrams.similar(term, max_distance))
+        return dict(sorted(similar.items()))
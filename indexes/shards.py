@@ -0,0 +1,331 @@
+"""Sharded indexes, for searching parts of a collection in parallel.
+
+The collection is split by doc ID range into shards (see
+`Collection.partitions()`), each of which is an independent index file,
+stored in the collection's shards directory next to a JSON manifest:
+
+```json
+{
+    "num_documents": 3204,
+    "shards": [{"name": "0.idx", "num_documents": 1602}, ...]
+}
+```
+
+Scores of the vector model depend on statistics of the whole collection,
+i.e. document frequencies and the number of documents. So that rankings are
+the same as those of an unsharded index, each shard has a `.df` file with
+the document frequency of each of its terms in the whole collection, which
+shard indexes use in place of their own (see `ShardIndex`), including to
+compute document norms.
+
+Requests are fanned out to the shards by a pool of processes (see
+`ShardedIndex.map()`). Shards are in doc ID order: the results of a boolean
+request are the concatenation of the results of each shard, and the best
+documents of a vector request are among the best ones of each shard.
+"""
+import heapq
+import json
+import os
+import shutil
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, groupby
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional
+
+from data_collections import Collection
+from datatypes import Term
+
+from .disk import DEFAULT_CODEC, FrequencyView, IndexFile, IndexFileWriter
+from .entry import TermDictionary
+from .index import DEFAULT_BLOCK_SIZE, Index
+from .segments import _lexicon_entries
+from .sort import group_entries, sort_term_ids
+from .storage import SectionFile, SectionFileWriter, fingerprint
+
+MANIFEST = "manifest.json"
+
+
+def _df_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".df"
+
+
+def _build_shard(
+    collection: Collection,
+    parts: List[Any],
+    path: str,
+    block_size: int,
+    codec: str,
+    positions: bool,
+    temp_dir: str,
+) -> int:
+    stream = chain.from_iterable(
+        collection.partition_positions(part) for part in parts
+    )
+    if not positions:
+        stream = ((token, doc_id) for token, doc_id, _ in stream)
+    terms = TermDictionary()
+    entries = sort_term_ids(
+        stream, terms, block_size=block_size, temp_dir=temp_dir
+    )
+    with IndexFileWriter(
+        path, codec=codec, positions=positions, collection=collection.name
+    ) as writer:
+        for term_id, postings in group_entries(entries, positions):
+            writer.add(terms[term_id], *postings)
+    return len(IndexFile(path).doc_ids)
+
+
+class _CollectionFrequencyView(FrequencyView):
+    # Document frequencies in the whole collection: those of the terms of a
+    # shard are stored in its `.df` file, and those of other terms (e.g. of
+    # a request) are summed over the other shards.
+
+    def __init__(self, lexicon, values: memoryview, others: List[IndexFile]):
+        super().__init__(lexicon, values)
+        self._others = others
+
+    def __getitem__(self, term: Term) -> int:
+        term_id = self._lexicon.lookup(term)
+        if term_id is None:
+            return sum(other.df[term] for other in self._others)
+        return self.values[term_id]
+
+
+class ShardIndex(Index):
+    """Index of a shard.
+
+    Document frequencies and the number of documents are those of the whole
+    collection, as stored in the `.df` file of the shard (and, for terms
+    which are not in the shard, in the other shards of the manifest).
+    """
+
+    @classmethod
+    def open(cls, path: str, collection: Collection = None) -> "ShardIndex":
+        index = super().open(path, collection)
+        directory = os.path.dirname(path)
+        others = []
+        if os.path.isfile(os.path.join(directory, MANIFEST)):
+            with open(os.path.join(directory, MANIFEST)) as f:
+                names = [shard["name"] for shard in json.load(f)["shards"]]
+            others = [
+                IndexFile(os.path.join(directory, name))
+                for name in names
+                if name != os.path.basename(path)
+            ]
+        df_file = SectionFile(_df_path(path))
+        index.df = _CollectionFrequencyView(
+            index.file.lexicon, df_file.array("df", "I"), others
+        )
+        index._num_documents = df_file.meta["num_documents"]
+        return index
+
+    @property
+    def num_documents(self) -> int:
+        """Number of documents in the whole collection."""
+        return self._num_documents
+
+
+class Shards:
+    """Shards of a collection's index.
+
+    Parameters
+    ----------
+    collection : Collection
+    """
+
+    def __init__(self, collection: Collection):
+        self.collection = collection
+        self.path = collection.index_shards
+        self.manifest_path = os.path.join(self.path, MANIFEST)
+
+    @property
+    def exist(self) -> bool:
+        return os.path.isfile(self.manifest_path)
+
+    def read_manifest(self) -> dict:
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def shard_paths(self) -> List[str]:
+        """Return the paths of the shards, in doc ID order."""
+        return [
+            os.path.join(self.path, shard["name"])
+            for shard in self.read_manifest()["shards"]
+        ]
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def build(
+        self,
+        n: int,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        codec: str = DEFAULT_CODEC,
+        positions: bool = False,
+        workers: int = None,
+    ):
+        """Build `n` shards, replacing existing ones.
+
+        Shards are built in parallel, by `workers` processes (defaults to
+        one per shard). There may be fewer than `n` shards if the collection
+        cannot be split into `n` parts.
+        """
+        parts = self.collection.partitions(n)
+        # Partitions are in doc ID order, and may be more than requested
+        # (e.g. one per directory): group consecutive ones.
+        groups = [
+            parts[i * len(parts) // n : (i + 1) * len(parts) // n]
+            for i in range(n)
+        ]
+        groups = [group for group in groups if group]
+        print(f"Building {len(groups)} shards of {self.collection.name}…")
+
+        self.clear()
+        os.makedirs(self.path)
+        names = [f"{i}.idx" for i in range(len(groups))]
+        with ProcessPoolExecutor(max_workers=workers or len(groups)) as executor:
+            futures = [
+                executor.submit(
+                    _build_shard,
+                    self.collection,
+                    group,
+                    os.path.join(self.path, name),
+                    block_size,
+                    codec,
+                    positions,
+                    os.path.join(self.path, f"tmp-{i}"),
+                )
+                for i, (name, group) in enumerate(zip(names, groups))
+            ]
+            sizes = [future.result() for future in futures]
+
+        paths = [os.path.join(self.path, name) for name in names]
+        self._write_df(paths, sum(sizes))
+
+        print("Computing document statistics and k-gram indexes…")
+        for path in paths:
+            shard = ShardIndex.open(path)
+            shard.statistics.compute()
+            shard.kgrams.build()
+
+        manifest = {
+            "num_documents": sum(sizes),
+            "shards": [
+                {"name": name, "num_documents": size}
+                for name, size in zip(names, sizes)
+            ],
+        }
+        # The manifest is written last: shards are only used once complete.
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    @staticmethod
+    def _write_df(paths: List[str], num_documents: int):
+        # Sum the document frequencies of each term over all shards, by
+        # streaming their lexicons in term order.
+        files = [IndexFile(path) for path in paths]
+        local = [f.file.array("df", "I") for f in files]
+        dfs = [array("I", bytes(4 * len(f.lexicon))) for f in files]
+        lexicons = [_lexicon_entries(f, i) for i, f in enumerate(files)]
+        for _, group in groupby(heapq.merge(*lexicons), key=itemgetter(0)):
+            group = [(i, term_id) for _, i, term_id in group]
+            df = sum(local[i][term_id] for i, term_id in group)
+            for i, term_id in group:
+                dfs[i][term_id] = df
+
+        for path, df in zip(paths, dfs):
+            meta = {"num_documents": num_documents}
+            with SectionFileWriter(_df_path(path), meta=meta) as writer:
+                writer.add_section("df", df)
+
+
+# Shard indexes opened by the current (worker) process, by path.
+_OPEN_SHARDS: Dict[str, ShardIndex] = {}
+
+
+def _call(path: str, collection: Collection, function: Callable, args: tuple):
+    index = _OPEN_SHARDS.get(path)
+    if index is None:
+        index = _OPEN_SHARDS[path] = ShardIndex.open(path, collection)
+    return function(index, *args)
+
+
+class ShardedIndex:
+    """Shards of a collection's index, searched by a pool of processes.
+
+    Example
+    -------
+
+    ```python
+    with ShardedIndex(Shards(collection)) as index:
+        results = index.map(search, request)
+    ```
+
+    Parameters
+    ----------
+    shards : Shards
+    workers : int, optional
+        Number of worker processes. Defaults to one per shard.
+    """
+
+    def __init__(self, shards: Shards, workers: int = None):
+        manifest = shards.read_manifest()
+        self.shards = shards
+        self.collection = shards.collection
+        self.paths = shards.shard_paths()
+        self.num_documents: int = manifest["num_documents"]
+        self.workers = workers or len(self.paths)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Requests may be sent from several threads, e.g. by the server.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_cache(
+        cls, collection: Collection, **kwargs
+    ) -> Optional["ShardedIndex"]:
+        """Return the shards of a collection's index, if they exist."""
+        shards = Shards(collection)
+        if not shards.exist:
+            return None
+        print(f"Using {collection.name} index shards…")
+        return cls(shards, **kwargs)
+
+    def fingerprint(self) -> Optional[list]:
+        # The manifest is re-written each time shards are built.
+        return fingerprint(self.shards.manifest_path)
+
+    def map(self, function: Callable, *args) -> list:
+        """Call `function(shard_index, *args)` for each shard, in parallel.
+
+        `function` and `args` must be picklable, e.g. `function` must be
+        defined at the top level of a module. Shard indexes are opened once
+        per worker process.
+
+        Returns
+        -------
+        results : list
+            The result of each shard, in doc ID order.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        futures = [
+            self._executor.submit(_call, path, self.collection, function, args)
+            for path in self.paths
+        ]
+        return [future.result() for future in futures]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
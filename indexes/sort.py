@@ -1,43 +1,165 @@
+import heapq
 import os
 import shutil
-from itertools import count
-from typing import Generator, List, Optional
+from array import array
+from itertools import chain, count, groupby, islice
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
+
+from datatypes import Position, PostingList, Term
 from utils import find_files, grouped, multi_open
 
-from .entry import Entry
+from .entry import TermDictionary
+
+# Size of the buffers of block files. Up to `batch_size` blocks are read
+# at once when merging, so read buffers are kept smaller.
+READ_BUFFER_SIZE = 2 ** 16
+WRITE_BUFFER_SIZE = 2 ** 20
+
+# Number of records read at once from binary runs.
+READ_CHUNK_SIZE = 2 ** 14
+RECORD_DTYPE = np.dtype(np.uint32)
+
+# A token followed by integers, e.g. `(token, doc_id)` or
+# `(token, doc_id, position)`. In binary runs, the token is a term ID.
+Record = Tuple
 
+# Posting list of a term: doc IDs, frequencies, and positions if any.
+Postings = Tuple[PostingList, List[int], Optional[List[List[Position]]]]
 
-def sort_external(entries: List[Entry], **kwargs) -> List[Entry]:
-    with ExternalSorter(**kwargs) as sorter:
+
+def group_entries(
+    entries: Iterable[tuple], positions: bool
+) -> Iterator[Tuple[Term, Postings]]:
+    """Group sorted entries into posting lists.
+
+    Posting lists are yielded with the first item of their entries, i.e. a
+    token or a term ID. A token occurring multiple times in a document
+    yields one entry per occurrence: these are counted to get term
+    frequencies.
+    """
+    for token, group in groupby(entries, key=itemgetter(0)):
+        doc_ids = []
+        frequencies = []
+        doc_positions = []
+        for doc_id, records in groupby(group, key=itemgetter(1)):
+            doc_ids.append(doc_id)
+            if positions:
+                term_positions = [position for _, _, position in records]
+                frequencies.append(len(term_positions))
+                doc_positions.append(term_positions)
+            else:
+                frequencies.append(sum(1 for _ in records))
+        yield token, (doc_ids, frequencies, doc_positions or None)
+
+
+def sort_term_ids(
+    entries: Iterable[Record], terms: TermDictionary, **kwargs
+) -> Iterator[Record]:
+    """Sort entries as integer records, and stream the sorted result.
+
+    Tokens are interned in `terms`, and entries are sorted using binary
+    runs (see `BinarySorter`). Records are yielded with term IDs in place of
+    tokens: by then, terms have been sorted (see `TermDictionary.sort()`),
+    so records are in the same order as sorted entries, and `terms[term_id]`
+    is the token of a record.
+
+    Temporary files are removed once the result has been consumed.
+    """
+    with BinarySorter(terms, **kwargs) as sorter:
         for entry in entries:
             sorter.add(entry)
-        return sorter.merge()
-
+        sorter.finish()
+        yield from sorter.merge()
+
+
+def _read_run(f, width: int, labels: np.ndarray = None) -> Iterator[Record]:
+    size = READ_CHUNK_SIZE * width * RECORD_DTYPE.itemsize
+    while True:
+        data = f.read(size)
+        if not data:
+            return
+        chunk = np.frombuffer(data, dtype=RECORD_DTYPE).reshape(-1, width)
+        if labels is not None:
+            chunk = chunk.copy()
+            chunk[:, 0] = labels[chunk[:, 0]]
+        yield from map(tuple, chunk.tolist())
+
+
+def write_run(f, records: Iterable[Record]):
+    """Write sorted records to a binary run, which `read_runs()` can read."""
+    values = chain.from_iterable(records)
+    chunk_size = WRITE_BUFFER_SIZE // RECORD_DTYPE.itemsize
+    while True:
+        buffer = array(RECORD_DTYPE.char, islice(values, chunk_size))
+        if not buffer:
+            break
+        buffer.tofile(f)
+
+
+def read_runs(
+    paths: List[str], width: int, labels: Sequence[np.ndarray] = None
+) -> Iterator[Record]:
+    """Merge sorted binary runs, and stream the sorted result.
+
+    Parameters
+    ----------
+    paths : list of str
+    width : int
+        Number of integers per record.
+    labels : list of arrays, optional
+        For each run, the term IDs to use in place of the term IDs of the run.
+        These must preserve the order of term IDs.
+    """
+    if labels is None:
+        labels = [None] * len(paths)
+    with multi_open(paths, mode="rb", buffering=READ_BUFFER_SIZE) as files:
+        yield from heapq.merge(
+            *(_read_run(f, width, run_labels) for f, run_labels in zip(files, labels))
+        )
 
-def _read_block(f) -> Generator[Entry, None, None]:
-    for line in filter(None, map(str.strip, f)):
-        yield Entry.from_line(line)
 
+class BinarySorter:
+    """External sort of entries as packed integer records.
 
-class ExternalSorter:
-    """Helper to perform an external sort on index entries.
+    Tokens are replaced with term IDs (see `TermDictionary`), and records are
+    buffered in an array of unsigned 32-bit integers. Blocks are sorted with
+    NumPy and written as binary runs, so that sorting and merging compare
+    integers rather than strings, and runs are never formatted nor parsed.
 
     Example
     -------
 
     ```python
-    with ExternalSorter() as sorter:
+    terms = TermDictionary()
+    with BinarySorter(terms, block_size=10000) as sorter:
         for entry in entries:
             sorter.add(entry)
-        results = sorter.merge()
+        sorter.finish()
+        for term_id, doc_id in sorter.merge():
+            token = terms[term_id]
+            ...
     ```
+
+    Parameters
+    ----------
+    terms : TermDictionary
+    block_size : int
+        Number of entries per block.
+    temp_dir : str, optional
+        Where blocks are stored.
     """
 
-    def __init__(self, block_size: int, temp_dir: str = "tmp"):
+    def __init__(
+        self, terms: TermDictionary, block_size: int, temp_dir: str = "tmp"
+    ):
+        self.terms = terms
         self.block_size = block_size
-        self._buffer: List[Entry] = []
         self.temp_path = temp_dir
+        self.width: Optional[int] = None
+        self._buffer = array(RECORD_DTYPE.char)
         self._counter = None
 
     def __enter__(self):
@@ -49,93 +171,78 @@ class ExternalSorter:
         print("Cleaning up…")
         shutil.rmtree(self.temp_path, ignore_errors=True)
 
-    def add(self, entry: Entry):
+    def _block_paths(self) -> List[str]:
+        return [path for _, path in find_files(self.temp_path)]
+
+    def add(self, entry: Record):
         """Push a new entry to the buffer.
 
         May trigger a flush to disk.
 
         Parameters
         ----------
-        entry : Entry
+        entry : tuple
+            A token followed by integers. All entries must have the same
+            width.
         """
-        if len(self._buffer) > self.block_size:
+        if self.width is None:
+            self.width = len(entry)
+        if len(self._buffer) >= self.block_size * self.width:
             self.flush()
-        self._buffer.append(entry)
+        self._buffer.append(self.terms.add(entry[0]))
+        self._buffer.extend(entry[1:])
 
     def flush(self):
-        """Flush the buffer to a new block file."""
+        """Sort the buffer, and write it to a new block file."""
         block_path = os.path.join(self.temp_path, str(next(self._counter)))
 
-        entries = sorted(self._buffer)
-
-        with open(block_path, "w") as f:
-            f.writelines([entry.to_line() + "\n" for entry in entries])
+        records = np.frombuffer(self._buffer, dtype=RECORD_DTYPE)
+        records = records.reshape(-1, self.width)
+        # Sort by the first column, then by the second one, etc.
+        order = np.lexsort(records.T[::-1])
+        records[order].tofile(block_path)
 
         print(f"Flushed: {block_path}")
 
-        self._buffer = []
+        self._buffer = array(RECORD_DTYPE.char)
 
-    def _merge(self, out: str, *block_paths: str) -> None:
-        print("merging", block_paths, "into", out)
+    def finish(self):
+        """Flush the last block, and renumber terms in lexicon order.
 
-        with multi_open(block_paths) as files, open(out, "w") as out_file:
-            blocks = [_read_block(f) for f in files]
-
-            # A list of pointers to the next entry to be merged from
-            # each (sorted) block.
-            # `None` means that the block has been merged completely.
-            entry_pointers: List[Optional[Entry]] = [
-                next(block, None) for block in blocks
-            ]
-
-            while any(entry_pointers):
-                # Find entry of "smallest" entry in terms of token and docID.
-                idx, smallest = min(
-                    (i, entry)
-                    for i, entry in enumerate(entry_pointers)
-                    if entry is not None
-                )
-
-                # Write it to the output file.
-                out_file.write(smallest.to_line())
-
-                # Advance the entry pointer in the corresponding block.
-                entry_pointers[idx] = next(blocks[idx], None)
-
-        for block_path in block_paths:
-            os.remove(block_path)
-
-    def merge(self, batch_size: int = 100, _step: int = 0) -> List[Entry]:
-        """Merge blocks into a single final list of entries.
-
-        Blocks are batched in groups and merged recursively.
-
-        Parameters
-        ----------
-        batch_size : int, optional
-            The number of blocks in a merge batch. Defaults to 100.
-        _step : int, optional
-            Private parameter corresponding to the current processing stage.
+        Term IDs of blocks are updated, and blocks are sorted again.
+        """
+        if self._buffer:
+            self.flush()
+        labels = self.terms.sort()
+        for block_path in self._block_paths():
+            records = np.fromfile(block_path, dtype=RECORD_DTYPE)
+            records = records.reshape(-1, self.width)
+            records[:, 0] = labels[records[:, 0]]
+            # Records of a term are already sorted, and stay in order.
+            order = np.argsort(records[:, 0], kind="stable")
+            records[order].tofile(block_path)
+
+    def merge(self, batch_size: int = 100) -> Iterator[Record]:
+        """Merge blocks into a single stream of sorted records.
+
+        Blocks are batched in groups and merged into new blocks until at
+        most `batch_size` blocks remain. These are then merged on the fly
+        while the result is consumed, so the sorted records are never
+        written to disk (nor loaded in memory) as a whole. `finish()` must
+        be called first.
         """
-        block_paths = [path for _, path in find_files(self.temp_path)]
-
-        if len(block_paths) == 1:
-            # Only one block remaining => we're done.
-            # Read the entries from it.
-            last_block_path = block_paths[0]
-            with open(last_block_path) as f:
-                return list(_read_block(f))
-
-        # Otherwise, batch blocks together and merge each of them into a
-        # new block.
-        for idx, batch in enumerate(grouped(batch_size, block_paths)):
-            # The last `batch` may be end-padded with nones if the
-            # number of items in `block_paths` is not a multiple of
-            # `batch_size`.
-            batch = filter(None, batch)
-
-            out_path = os.path.join(self.temp_path, f"{_step}-{idx}")
-            self._merge(out_path, *batch)
-
-        # Merge the new blocks recursively.
-        return self.merge(batch_size=batch_size, _step=_step + 1)
+        block_paths = self._block_paths()
+
+        step = 0
+        while len(block_paths) > batch_size:
+            for idx, batch in enumerate(grouped(batch_size, block_paths)):
+                batch = list(filter(None, batch))
+                out_path = os.path.join(self.temp_path, f"{step}-{idx}")
+                with open(out_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+                    write_run(f, read_runs(batch, self.width))
+                for block_path in batch:
+                    os.remove(block_path)
+            step += 1
+            block_paths = self._block_paths()
+
+        yield from read_runs(block_paths, self.width)
@@ -0,0 +1,225 @@
+"""Single-Pass In-Memory Indexing (SPIMI).
+
+Unlike BSBI (see `sort`), entries are never sorted: each block is a
+dictionary mapping terms to posting lists, which grow as the collection is
+read. Doc IDs come in increasing order, so posting lists are sorted by
+construction, and only the terms of a block are sorted when it is written
+to disk. Blocks are then merged term by term.
+
+Block files have one line per term, e.g. `term 1:2 4:1` (doc IDs and
+frequencies), or `term 1:0,3 4:7` (doc IDs and positions) for positional
+indexes.
+"""
+import heapq
+import os
+import shutil
+from itertools import count, groupby
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from datatypes import DocID, Position, PostingList, Term
+from utils import find_files, grouped, multi_open
+
+from .sort import READ_BUFFER_SIZE, WRITE_BUFFER_SIZE, Postings
+
+
+class _TermPostings:
+    # Growing posting list of a term in a block.
+
+    __slots__ = ("doc_ids", "frequencies", "positions")
+
+    def __init__(self, positions: bool):
+        self.doc_ids: PostingList = []
+        self.frequencies: List[int] = []
+        self.positions: Optional[List[List[Position]]] = [] if positions else None
+
+    def add(self, doc_id: DocID, position: Position):
+        if not self.doc_ids or self.doc_ids[-1] != doc_id:
+            self.doc_ids.append(doc_id)
+            self.frequencies.append(0)
+            if self.positions is not None:
+                self.positions.append([])
+        self.frequencies[-1] += 1
+        if self.positions is not None:
+            self.positions[-1].append(position)
+
+    def postings(self) -> Postings:
+        return self.doc_ids, self.frequencies, self.positions
+
+
+def _format_line(term: Term, postings: Postings) -> str:
+    doc_ids, frequencies, positions = postings
+    if positions is None:
+        values = frequencies
+    else:
+        values = (",".join(map(str, p)) for p in positions)
+    pairs = " ".join(f"{doc_id}:{value}" for doc_id, value in zip(doc_ids, values))
+    return f"{term} {pairs}\n"
+
+
+def _parse_line(line: str, positions: bool) -> Tuple[Term, Postings]:
+    term, *pairs = line.split()
+    doc_ids = []
+    frequencies = []
+    doc_positions = [] if positions else None
+    for pair in pairs:
+        doc_id, value = pair.split(":")
+        doc_ids.append(int(doc_id))
+        if positions:
+            term_positions = list(map(int, value.split(",")))
+            doc_positions.append(term_positions)
+            frequencies.append(len(term_positions))
+        else:
+            frequencies.append(int(value))
+    return term, (doc_ids, frequencies, doc_positions)
+
+
+def _concatenate(parts: Iterable[Postings]) -> Postings:
+    # Posting lists of a term in consecutive blocks, i.e. in doc ID order.
+    doc_ids = []
+    frequencies = []
+    positions = None
+    for part_doc_ids, part_frequencies, part_positions in parts:
+        doc_ids.extend(part_doc_ids)
+        frequencies.extend(part_frequencies)
+        if part_positions is not None:
+            if positions is None:
+                positions = []
+            positions.extend(part_positions)
+    return doc_ids, frequencies, positions
+
+
+class SPIMIBuilder:
+    """Helper to build posting lists using the SPIMI algorithm.
+
+    Example
+    -------
+
+    ```python
+    with SPIMIBuilder(block_size=10000) as builder:
+        for token, doc_id, position in collection.positions():
+            builder.add(token, doc_id, position)
+        for term, (doc_ids, frequencies, positions) in builder.merge():
+            ...
+    ```
+
+    Parameters
+    ----------
+    block_size : int
+        Number of entries (i.e. tokens) per block. Blocks are only flushed
+        between two documents, so that the postings of a document are all
+        in the same block.
+    positions : bool, optional
+        Whether to keep the positions of terms.
+    temp_dir : str, optional
+        Where block files are stored.
+    """
+
+    def __init__(
+        self, block_size: int, positions: bool = False, temp_dir: str = "tmp"
+    ):
+        self.block_size = block_size
+        self.positions = positions
+        self.temp_path = temp_dir
+        self._block: Dict[Term, _TermPostings] = {}
+        self._block_entries = 0
+        self._last_doc_id: Optional[DocID] = None
+        self._counter = None
+
+    def __enter__(self):
+        os.makedirs(self.temp_path, exist_ok=True)
+        self._counter = count(1)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        print("Cleaning up…")
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+
+    def add(self, term: Term, doc_id: DocID, position: Position = 0):
+        """Add an occurrence of a term to the current block.
+
+        Doc IDs must be added in increasing order. May trigger a flush to disk.
+        """
+        if doc_id != self._last_doc_id:
+            if self._block_entries >= self.block_size:
+                self.flush()
+            self._last_doc_id = doc_id
+        postings = self._block.get(term)
+        if postings is None:
+            postings = self._block[term] = _TermPostings(self.positions)
+        postings.add(doc_id, position)
+        self._block_entries += 1
+
+    def flush(self):
+        """Write the current block to a new block file."""
+        # Zero-padded, so that block files are listed in creation order.
+        block_path = os.path.join(self.temp_path, f"{next(self._counter):08d}")
+        block = self._block
+        with open(block_path, "w", buffering=WRITE_BUFFER_SIZE) as f:
+            f.writelines(
+                _format_line(term, block[term].postings()) for term in sorted(block)
+            )
+        print(f"Flushed: {block_path}")
+        self._block = {}
+        self._block_entries = 0
+
+    def _read_block(self, f, block_number: int) -> Iterator[tuple]:
+        for line in f:
+            term, postings = _parse_line(line, self.positions)
+            yield term, block_number, postings
+
+    def _merge_files(self, block_paths: List[str]) -> Iterator[Tuple[Term, Postings]]:
+        # Blocks are numbered in doc ID order, so that the posting lists of a
+        # term in different blocks are concatenated in the right order.
+        with multi_open(block_paths, buffering=READ_BUFFER_SIZE) as files:
+            blocks = [self._read_block(f, i) for i, f in enumerate(files)]
+            merged = heapq.merge(*blocks, key=itemgetter(0, 1))
+            for term, group in groupby(merged, key=itemgetter(0)):
+                yield term, _concatenate(postings for _, _, postings in group)
+
+    def merge(self, batch_size: int = 100) -> Iterator[Tuple[Term, Postings]]:
+        """Merge blocks into a single stream of posting lists.
+
+        As with `BinarySorter.merge()`, blocks are merged by batches until
+        at most `batch_size` blocks remain, which are merged on the fly.
+
+        Yields
+        ------
+        term, (doc_ids, frequencies, positions) : tuple
+            Posting lists in term order. `positions` is `None` unless the
+            builder keeps positions.
+        """
+        if self._block:
+            self.flush()
+
+        block_paths = sorted(path for _, path in find_files(self.temp_path))
+
+        step = 0
+        while len(block_paths) > batch_size:
+            for idx, batch in enumerate(grouped(batch_size, block_paths)):
+                batch = list(filter(None, batch))
+                out_path = os.path.join(self.temp_path, f"{step}-{idx:08d}")
+                with open(out_path, "w", buffering=WRITE_BUFFER_SIZE) as f:
+                    f.writelines(
+                        _format_line(term, postings)
+                        for term, postings in self._merge_files(batch)
+                    )
+                for block_path in batch:
+                    os.remove(block_path)
+            step += 1
+            block_paths = sorted(path for _, path in find_files(self.temp_path))
+
+        yield from self._merge_files(block_paths)
+
+
+def spimi(
+    stream: Iterable[tuple], block_size: int, positions: bool = False, **kwargs
+) -> Iterator[Tuple[Term, Postings]]:
+    """Build posting lists out of a stream of `(token, doc_id, position)`.
+
+    Temporary files are removed once the result has been consumed.
+    """
+    with SPIMIBuilder(block_size, positions=positions, **kwargs) as builder:
+        for token, doc_id, position in stream:
+            builder.add(token, doc_id, position)
+        yield from builder.merge()
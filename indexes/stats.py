@@ -0,0 +1,203 @@
+"""Per-document statistics, precomputed at index time.
+
+Statistics are sums over the terms of each document, e.g. its length or the
+norm of its vector under a weighting scheme. They are computed in a single
+pass over the posting lists, stored as arrays indexed by doc ID, and
+persisted next to the index file.
+
+New statistics are added by registering a `DocumentStatistic`:
+
+```python
+register_statistic(MyStatistic())
+```
+
+Statistics which are specific to a model (e.g. the norms of the vector
+model's weighting schemes) are not registered, but passed explicitly when
+building the index (see `index.build_index()`), or computed on first use
+(see `DocumentStatistics.fetch()`).
+"""
+import os
+from array import array
+from typing import Dict, Iterable, Iterator, Mapping, Sequence, Set, Union
+
+from .storage import SectionFile, SectionFileWriter, StorageError, fingerprint
+
+
+class DocumentStatistic:
+    """Base per-document statistic class.
+
+    The value of a statistic for a document is
+    `finalize(sum(contribution(tf, df, N) for each term of the document))`.
+    """
+
+    name: str
+
+    def contribution(self, tf: int, df: int, num_documents: int) -> float:
+        """Return the contribution of a term to a document.
+
+        Parameters
+        ----------
+        tf : int
+            Frequency of the term in the document.
+        df : int
+            Document frequency of the term.
+        num_documents : int
+            Number of documents in the collection.
+        """
+        raise NotImplementedError
+
+    def finalize(self, total: float) -> float:
+        """Transform the sum of contributions into the final value."""
+        return total
+
+
+class Length(DocumentStatistic):
+    """Number of tokens in a document."""
+
+    name = "length"
+
+    def contribution(self, tf: int, df: int, num_documents: int) -> float:
+        return tf
+
+
+class UniqueTerms(DocumentStatistic):
+    """Number of distinct terms in a document."""
+
+    name = "unique_terms"
+
+    def contribution(self, tf: int, df: int, num_documents: int) -> float:
+        return 1
+
+
+STATISTICS: Dict[str, DocumentStatistic] = {}
+
+
+def register_statistic(statistic: DocumentStatistic) -> DocumentStatistic:
+    """Register a statistic, so that it is computed when building indexes."""
+    STATISTICS[statistic.name] = statistic
+    return statistic
+
+
+for _statistic in (Length(), UniqueTerms()):
+    register_statistic(_statistic)
+
+
+class DocumentStatistics(Mapping):
+    """Per-document statistics of an index.
+
+    Maps statistic names to arrays indexed by doc ID. Statistics that have
+    not been computed yet are computed on first access and, for indexes
+    stored on disk, persisted next to the index file.
+
+    Parameters
+    ----------
+    index : Index
+    index_path : str, optional
+        Path to the index file, if the index is stored on disk.
+    version : list, optional
+        Identifies the version of the index statistics are computed for.
+        Defaults to the fingerprint of the index file.
+    """
+
+    def __init__(self, index, index_path: str = None, version: list = None):
+        self._index = index
+        self._index_path = index_path
+        self._version = version
+        self._values: Dict[str, Sequence[float]] = {}
+        if index_path is not None:
+            self.path = os.path.splitext(index_path)[0] + ".stats"
+            self._load()
+
+    def _load(self):
+        try:
+            stats_file = SectionFile(self.path)
+        except (FileNotFoundError, StorageError):
+            return
+        # Statistics of a previous build of the index are stale.
+        if stats_file.meta.get("index") != self.version:
+            return
+        for name in stats_file.sections:
+            self._values[name] = stats_file.array(name, "d")
+
+    def _save(self):
+        with SectionFileWriter(self.path, meta={"index": self.version}) as writer:
+            for name, values in self._values.items():
+                writer.add_section(name, array("d", values))
+
+    @property
+    def version(self) -> list:
+        if self._version is not None:
+            return self._version
+        return fingerprint(self._index_path)
+
+    @property
+    def computed(self) -> Set[str]:
+        """Names of the statistics which are available without computation."""
+        return set(self._values)
+
+    def compute(self, statistics: Iterable[Union[str, DocumentStatistic]] = None):
+        """Compute (and persist) statistics which are not available yet.
+
+        Parameters
+        ----------
+        statistics : list, optional
+            Statistics, or names of registered statistics. Defaults to all
+            registered statistics.
+        """
+        if statistics is None:
+            statistics = list(STATISTICS)
+        statistics = [
+            STATISTICS[statistic] if isinstance(statistic, str) else statistic
+            for statistic in statistics
+        ]
+        statistics = [
+            statistic for statistic in statistics if statistic.name not in self._values
+        ]
+        if not statistics:
+            return
+
+        index = self._index
+        num_documents = index.num_documents
+        size = max(index.doc_ids, default=-1) + 1
+        totals = [[0.0] * size for _ in statistics]
+
+        for term in index.postings:
+            postings = index.postings[term]
+            frequencies = index.frequencies[term]
+            # Not the length of the posting list: shards use the document
+            # frequencies of the whole collection (see `shards`).
+            df = index.df[term]
+            for statistic, total in zip(statistics, totals):
+                contribution = statistic.contribution
+                for doc_id, tf in zip(postings, frequencies):
+                    total[doc_id] += contribution(tf, df, num_documents)
+
+        for statistic, total in zip(statistics, totals):
+            finalize = statistic.finalize
+            self._values[statistic.name] = array(
+                "d", (finalize(value) for value in total)
+            )
+
+        if self._index_path is not None:
+            self._save()
+
+    def fetch(self, statistic: DocumentStatistic) -> Sequence[float]:
+        """Return the values of a statistic, which need not be registered,
+        computing them if they are not available yet.
+        """
+        if statistic.name not in self._values:
+            self.compute([statistic])
+        return self._values[statistic.name]
+
+    def __getitem__(self, name: str) -> Sequence[float]:
+        if name not in self._values:
+            if name not in STATISTICS:
+                raise KeyError(name)
+            self.compute([name])
+        return self._values[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(set(STATISTICS) | set(self._values))
+
+    def __len__(self) -> int:
+        return len(set(STATISTICS) | set(self._values))
@@ -0,0 +1,199 @@
+"""Memory-mapped section files.
+
+A section file is a container of named binary sections, used to store
+indexes on disk. Its layout is:
+
+    +--------+-----------+-----+-----------+-----+--------+
+    | header | section 1 | ... | section n | TOC | footer |
+    +--------+-----------+-----+-----------+-----+--------+
+
+- The header holds magic bytes and the container version.
+- Sections are raw bytes, aligned on 8 bytes so that they can be cast
+to arrays of machine integers without copying.
+- The TOC (table of contents) is a small JSON object holding the offset
+and length of each section, as well as free-form metadata.
+- The footer holds the offset and length of the TOC, so that it can be
+found by reading the end of the file only.
+
+Files are written to a temporary location and renamed once complete,
+so that a partially written file is never opened.
+"""
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Optional
+
+MAGIC = b"CSIRSECT"
+VERSION = 1
+ALIGNMENT = 8
+
+_HEADER = struct.Struct("<8sI4x")
+_FOOTER = struct.Struct("<QQ8s")
+
+
+class StorageError(Exception):
+    pass
+
+
+def fingerprint(path: str) -> list:
+    """Return a fingerprint of a file, which changes when it is rewritten.
+
+    The fingerprint is JSON-serializable, so that it can be stored along
+    data derived from the file.
+    """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class SectionFileWriter:
+    """Write a section file.
+
+    Example
+    -------
+
+    ```python
+    with SectionFileWriter(path, meta={"name": "cacm"}) as writer:
+        writer.add_section("doc_ids", array("I", [1, 2, 3]))
+        writer.begin_section("postings")
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.end_section()
+    ```
+    """
+
+    def __init__(self, path: str, meta: Dict[str, Any] = None):
+        self.path = path
+        self.meta: Dict[str, Any] = dict(meta or {})
+        self._temp_path = f"{path}.tmp"
+        self._file = None
+        self._sections: Dict[str, list] = {}
+        self._current: Optional[str] = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self._temp_path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self._file.close()
+            os.remove(self._temp_path)
+            return
+        self.close()
+
+    def _align(self):
+        padding = -self._file.tell() % ALIGNMENT
+        self._file.write(b"\0" * padding)
+
+    def begin_section(self, name: str):
+        """Start a new section. Data is then appended using `write()`."""
+        if self._current is not None:
+            raise StorageError(f"Section {self._current!r} is still open")
+        if name in self._sections:
+            raise StorageError(f"Duplicate section: {name!r}")
+        self._align()
+        self._current = name
+        self._sections[name] = [self._file.tell(), 0]
+
+    def write(self, data):
+        """Append data to the current section."""
+        if self._current is None:
+            raise StorageError("No section is open")
+        self._file.write(data)
+
+    def end_section(self):
+        """Close the current section."""
+        if self._current is None:
+            raise StorageError("No section is open")
+        offset = self._sections[self._current][0]
+        self._sections[self._current][1] = self._file.tell() - offset
+        self._current = None
+
+    def add_section(self, name: str, data):
+        """Write a complete section at once."""
+        self.begin_section(name)
+        self.write(data)
+        self.end_section()
+
+    def close(self):
+        if self._current is not None:
+            self.end_section()
+        self._align()
+        toc = json.dumps({"sections": self._sections, "meta": self.meta})
+        toc_offset = self._file.tell()
+        toc_bytes = toc.encode()
+        self._file.write(toc_bytes)
+        self._file.write(_FOOTER.pack(toc_offset, len(toc_bytes), MAGIC))
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+
+class SectionFile:
+    """Read-only, memory-mapped view of a section file.
+
+    Opening a section file only reads its table of contents: sections are
+    paged in by the OS when they are accessed.
+
+    Parameters
+    ----------
+    path : str
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise StorageError(f"{path} is empty")
+
+        if len(self._mmap) < _HEADER.size + _FOOTER.size:
+            raise StorageError(f"{path} is truncated")
+
+        magic, version = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise StorageError(f"{path} is not a section file")
+        if version != VERSION:
+            raise StorageError(
+                f"{path} has version {version}, expected {VERSION}"
+            )
+
+        toc_offset, toc_length, magic = _FOOTER.unpack_from(
+            self._mmap, len(self._mmap) - _FOOTER.size
+        )
+        if magic != MAGIC:
+            raise StorageError(f"{path} is truncated")
+
+        toc = json.loads(self._mmap[toc_offset : toc_offset + toc_length])
+        self._sections: Dict[str, list] = toc["sections"]
+        self.meta: Dict[str, Any] = toc["meta"]
+        self._view = memoryview(self._mmap)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    @property
+    def sections(self) -> Dict[str, int]:
+        """Mapping of section names to their size in bytes."""
+        return {name: length for name, (_, length) in self._sections.items()}
+
+    def section(self, name: str) -> memoryview:
+        """Return a zero-copy view on a section."""
+        try:
+            offset, length = self._sections[name]
+        except KeyError:
+            raise StorageError(f"{self.path} has no section {name!r}")
+        return self._view[offset : offset + length]
+
+    def array(self, name: str, typecode: str) -> memoryview:
+        """Return a zero-copy view on a section as an array of numbers.
+
+        Parameters
+        ----------
+        name : str
+        typecode : str
+            A `struct` format character, e.g. `"I"` or `"Q"`.
+        """
+        return self.section(name).cast(typecode)
@@ -1,2 +1,2 @@
-from .search import Q
+from .search import NEAR, P, Q, search_shards
 from .cli import cli
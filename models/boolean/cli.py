@@ -1,32 +1,137 @@
+from itertools import islice
+from typing import Optional
+
 import click
 
 from cli_utils import CollectionType
 from data_collections import Collection
 from indexes import build_index
+from indexes.shards import ShardedIndex, ShardIndex
+from models.cache import ResultCache
+from server.client import Client, ServerError
 
 from .cli_utils import BooleanQueryType
-from .search import Q
+from .search import Q, search_shards
 
 
 @click.command()
 @click.argument("collection", type=CollectionType())
 @click.argument("query", type=BooleanQueryType())
-def cli(collection: Collection, query: Q):
+@click.option(
+    "--explain",
+    is_flag=True,
+    default=False,
+    help="Show the execution plan, with estimated sizes and costs.",
+)
+@click.option(
+    "--limit",
+    "-n",
+    type=int,
+    default=None,
+    help="Maximum number of results to show.  [default: all]",
+)
+@click.option(
+    "--offset",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Number of results to skip.",
+)
+@click.option(
+    "--server",
+    default=None,
+    help="Send the request to a query server (see `python -m server`), "
+    "e.g. http://127.0.0.1:8765 or unix:/path/to/socket.",
+)
+def cli(
+    collection: Collection,
+    query: Q,
+    explain: bool,
+    limit: Optional[int],
+    offset: int,
+    server: Optional[str],
+):
     """Request a collection using the boolean model.
 
     The query must be a valid Python expression comprised of terms wrapped
     in a `Q` object, and combined using the `|` (OR), `&` (AND) or `~` (NOT)
     operators.
 
+    Phrases can be matched using `P`, and terms close to each other using
+    `NEAR`. Both require an index built with `--positions`.
+
+    Terms of `Q` may contain wildcards, e.g. `Q('comput*')` or `Q('*graph*')`,
+    which match any string.
+
+    Misspelled terms can be matched using `Q('algoritm', fuzzy=2)`, which also
+    matches terms within 2 edits.
+
+    Intersections are evaluated from the least to the most frequent term, and
+    `a & ~b` is evaluated as a difference. Use `--explain` to see the plan.
+
+    Results are computed one at a time as they are shown, one per line. Use
+    `--limit` and `--offset` to show a page of results. Complete results are
+    cached.
+
+    If the index has been built with `--shards`, shards are searched in
+    parallel, and complete results are always computed.
+
+    With `--server`, the request is sent to a query server, which keeps the
+    index loaded.
+
     Examples:
 
         "Q('research')" => research
         "Q('algorithm') | Q('artificial')" => algorithm OR artificial
         "Q('France') & ~Q('Paris')" => France AND NOT Paris
+        "P('operating system')" => "operating system"
+        "NEAR('search', 'algorithm', 3)" => search NEAR/3 algorithm
+        "Q('comput*')" => compute OR computer OR computing...
+        "Q('algoritm', fuzzy=2)" => algorithm OR algorithms...
     """
-    index = build_index(collection)
+    if server is not None:
+        if explain:
+            raise click.UsageError("--explain is not supported with --server.")
+        try:
+            with Client(server) as client:
+                response = client.boolean(
+                    collection.name, repr(query), limit=limit, offset=offset
+                )
+        except (OSError, ServerError) as exc:
+            raise click.ClickException(f"{server}: {exc}")
+        for doc_id in response["results"]:
+            click.echo(doc_id)
+        click.echo(f"Server latency: {response['latency'] * 1000:.2f}ms", err=True)
+        return
+
+    sharded = ShardedIndex.from_cache(collection)
+    index = sharded or build_index(collection)
+
+    if explain:
+        if sharded is not None:
+            click.echo("Plan (first shard):")
+            plan = query.plan(ShardIndex.open(sharded.paths[0], collection))
+        else:
+            click.echo("Plan:")
+            plan = query.plan(index)
+        click.echo(plan.explain(depth=1))
 
     click.echo(f"Executing {query}...")
-    results = query(index)
+    cache = ResultCache.open(index)
+    key = f"boolean:{query.canonical()}"
+    results = cache.get(key)
+    if results is None and sharded is not None:
+        results = cache.put(key, search_shards(query, sharded))
+        cache.save()
+        sharded.close()
+    if results is None and limit is None:
+        results = cache.put(key, query(index))
+        cache.save()
+    if results is None:
+        # Only compute the requested page.
+        results = query.iter(index)
 
-    click.echo(results)
+    stop = None if limit is None else offset + limit
+    for doc_id in islice(results, offset, stop):
+        click.echo(doc_id)
+    click.echo(f"Result cache: {cache}", err=True)
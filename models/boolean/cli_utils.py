@@ -4,7 +4,7 @@ import operator
 import click
 from simpleeval import SimpleEval
 
-from .search import Q
+from .search import NEAR, P, Q
 
 
 class ParseError(Exception):
@@ -17,11 +17,11 @@ class BooleanQueryType(click.ParamType):
 
     def __init__(self):
         super().__init__()
-        # Create a sandboxed evaluator allowing to use the Q object,
-        # and the "|", "&" and "~" operators.
+        # Create a sandboxed evaluator allowing to use the Q, P and NEAR
+        # objects, and the "|", "&" and "~" operators.
         # See: https://github.com/danthedeckie/simpleeval
         self.evaluator = SimpleEval(
-            functions={"Q": Q},
+            functions={"Q": Q, "P": P, "NEAR": NEAR},
             operators={
                 ast.BitOr: operator.or_,
                 ast.BitAnd: operator.and_,
@@ -0,0 +1,189 @@
+"""Lazy posting cursors, used to evaluate boolean requests document-at-a-time.
+
+A cursor iterates over the sorted doc IDs matched by a (sub-)request. It is
+positioned on a current doc ID (`doc_id`), and moved forward using:
+
+- `next()`, which moves to the next doc ID;
+- `advance_to(target)`, which moves to the first doc ID greater or equal to
+`target`, possibly skipping many of them.
+
+Both return the new current doc ID, or `END` once the cursor is exhausted.
+Cursors over requests combine the cursors of their operands, so doc IDs are
+computed one at a time and intermediate results are never materialized.
+"""
+from bisect import bisect_left
+from typing import Iterator, List, Optional, Sequence
+
+from datatypes import DocID
+
+# Doc ID of exhausted cursors, greater than any actual doc ID.
+END = 2 ** 63 - 1
+
+
+class Cursor:
+    """Base cursor class.
+
+    Cursors are not positioned until `next()` or `advance_to()` is called.
+    """
+
+    doc_id: DocID = -1
+
+    def next(self) -> DocID:
+        """Move to the next doc ID, and return it."""
+        raise NotImplementedError
+
+    def advance_to(self, target: DocID) -> DocID:
+        """Move to the first doc ID greater or equal to `target`, and return it.
+
+        The cursor does not move if it is already positioned on such a doc ID.
+        """
+        doc_id = self.doc_id
+        while doc_id < target:
+            doc_id = self.next()
+        return doc_id
+
+    def __iter__(self) -> Iterator[DocID]:
+        doc_id = self.next()
+        while doc_id != END:
+            yield doc_id
+            doc_id = self.next()
+
+
+class ListCursor(Cursor):
+    """Cursor over a sorted list of doc IDs, e.g. a posting list.
+
+    `advance_to()` uses a galloping search from the current position or, if
+    the list has skip pointers, a binary search on the skip pointers.
+
+    Parameters
+    ----------
+    postings : list of int
+    skips : list of int, optional
+        Skip pointers of the list (see `indexes.disk.skip_pointers()`).
+    skip_interval : int, optional
+    """
+
+    def __init__(
+        self,
+        postings: Sequence[DocID],
+        skips: Optional[Sequence[DocID]] = None,
+        skip_interval: int = None,
+    ):
+        self.postings = postings
+        self.skips = skips
+        self.skip_interval = skip_interval
+        self.position = -1
+        self.doc_id = -1
+
+    def _move(self, position: int) -> DocID:
+        self.position = position
+        if position < len(self.postings):
+            self.doc_id = self.postings[position]
+        else:
+            self.doc_id = END
+        return self.doc_id
+
+    def next(self) -> DocID:
+        if self.doc_id == END:
+            return END
+        return self._move(self.position + 1)
+
+    def advance_to(self, target: DocID) -> DocID:
+        if self.doc_id >= target:
+            return self.doc_id
+        postings = self.postings
+        size = len(postings)
+        start = self.position + 1
+        if self.skips:
+            block = bisect_left(self.skips, target, start // self.skip_interval)
+            start = max(start, block * self.skip_interval)
+            end = min((block + 1) * self.skip_interval, size)
+        else:
+            bound = 1
+            while start + bound < size and postings[start + bound] < target:
+                bound *= 2
+            end = min(start + bound + 1, size)
+        return self._move(bisect_left(postings, target, start, end))
+
+
+class AndCursor(Cursor):
+    """Cursor over the doc IDs matched by all of its operands.
+
+    Operands are advanced in turn to the largest of their doc IDs until they
+    agree, so the least frequent operands (which come first) drive the
+    others, which skip most of their doc IDs.
+    """
+
+    def __init__(self, operands: List[Cursor]):
+        self.operands = operands
+        self.doc_id = -1
+
+    def _align(self, target: DocID) -> DocID:
+        while target != END:
+            for operand in self.operands:
+                doc_id = operand.advance_to(target)
+                if doc_id != target:
+                    target = doc_id
+                    break
+            else:
+                break
+        self.doc_id = target
+        return target
+
+    def next(self) -> DocID:
+        if self.doc_id == END:
+            return END
+        return self._align(self.doc_id + 1)
+
+    def advance_to(self, target: DocID) -> DocID:
+        if self.doc_id >= target:
+            return self.doc_id
+        return self._align(target)
+
+
+class OrCursor(Cursor):
+    """Cursor over the doc IDs matched by any of its operands."""
+
+    def __init__(self, operands: List[Cursor]):
+        self.operands = operands
+        self.doc_id = -1
+
+    def next(self) -> DocID:
+        if self.doc_id == END:
+            return END
+        return self.advance_to(self.doc_id + 1)
+
+    def advance_to(self, target: DocID) -> DocID:
+        if self.doc_id >= target:
+            return self.doc_id
+        self.doc_id = min(operand.advance_to(target) for operand in self.operands)
+        return self.doc_id
+
+
+class DifferenceCursor(Cursor):
+    """Cursor over the doc IDs of `left` which are not matched by `right`.
+
+    The complement of a request is the difference between a cursor over all
+    doc IDs of the index and the cursor of the request.
+    """
+
+    def __init__(self, left: Cursor, right: Cursor):
+        self.left = left
+        self.right = right
+        self.doc_id = -1
+
+    def _skip_excluded(self, doc_id: DocID) -> DocID:
+        while doc_id != END and self.right.advance_to(doc_id) == doc_id:
+            doc_id = self.left.next()
+        self.doc_id = doc_id
+        return doc_id
+
+    def next(self) -> DocID:
+        if self.doc_id == END:
+            return END
+        return self._skip_excluded(self.left.next())
+
+    def advance_to(self, target: DocID) -> DocID:
+        if self.doc_id >= target:
+            return self.doc_id
+        return self._skip_excluded(self.left.advance_to(target))
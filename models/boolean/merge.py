@@ -0,0 +1,181 @@
+"""Merge joins on posting lists.
+
+Posting lists are sorted lists of distinct doc IDs, so they are combined
+by walking both lists at once, in `O(len(left) + len(right))`, without
+building sets nor sorting the result.
+
+When one list is much shorter than the other, intersections search the
+doc IDs of the short list in the long one instead, in
+`O(len(short) * log(len(long) / len(short)))`: see `gallop_intersect()` and
+`skip_intersect()`.
+"""
+import heapq
+from bisect import bisect_left
+from typing import List, Optional, Sequence
+
+from datatypes import DocID, PostingList
+
+# Minimum ratio between the lengths of two posting lists for their
+# intersection to search one in the other instead of merging them.
+GALLOP_RATIO = 4
+
+
+def intersect(
+    left: Sequence[DocID],
+    right: Sequence[DocID],
+    skips: Optional[Sequence[DocID]] = None,
+    skip_interval: int = None,
+) -> PostingList:
+    """Return doc IDs that are in both `left` and `right`.
+
+    The algorithm is chosen based on the lengths of the lists: lists of
+    similar lengths are merged, otherwise doc IDs of the shorter list are
+    searched in the longer one. Skip pointers are used when there are less
+    doc IDs to search than blocks to skip.
+
+    Parameters
+    ----------
+    left : list of int
+    right : list of int
+    skips : list of int, optional
+        Skip pointers of `right`, i.e. the last doc ID of each block of
+        `skip_interval` doc IDs.
+    skip_interval : int, optional
+    """
+    if len(left) * GALLOP_RATIO <= len(right):
+        if skips and len(left) * skip_interval <= len(right):
+            return skip_intersect(left, right, skips, skip_interval)
+        return gallop_intersect(left, right)
+    if len(right) * GALLOP_RATIO <= len(left):
+        return gallop_intersect(right, left)
+    return merge_intersect(left, right)
+
+
+def merge_intersect(
+    left: Sequence[DocID], right: Sequence[DocID]
+) -> PostingList:
+    """Intersect posting lists by walking both of them."""
+    result = []
+    i, j = 0, 0
+    while i < len(left) and j < len(right):
+        left_doc, right_doc = left[i], right[j]
+        if left_doc == right_doc:
+            result.append(left_doc)
+            i += 1
+            j += 1
+        elif left_doc < right_doc:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def gallop_intersect(
+    small: Sequence[DocID], large: Sequence[DocID]
+) -> PostingList:
+    """Intersect posting lists by searching doc IDs of `small` in `large`.
+
+    Each doc ID is searched from the position of the previous one, using an
+    exponential (galloping) search followed by a binary search, so that
+    close doc IDs are found in a few steps.
+    """
+    result = []
+    position = 0
+    size = len(large)
+    for doc_id in small:
+        bound = 1
+        while position + bound < size and large[position + bound] < doc_id:
+            bound *= 2
+        end = min(position + bound + 1, size)
+        position = bisect_left(large, doc_id, position, end)
+        if position == size:
+            break
+        if large[position] == doc_id:
+            result.append(doc_id)
+            position += 1
+    return result
+
+
+def skip_intersect(
+    small: Sequence[DocID],
+    large: Sequence[DocID],
+    skips: Sequence[DocID],
+    skip_interval: int,
+) -> PostingList:
+    """Intersect posting lists using the skip pointers of `large`.
+
+    The block of `large` which may contain a doc ID is found by a binary
+    search on the skip pointers, so only one block of `large` is read per
+    doc ID of `small`.
+    """
+    result = []
+    block = 0
+    position = 0
+    size = len(large)
+    for doc_id in small:
+        block = bisect_left(skips, doc_id, block)
+        if block == len(skips):
+            break
+        start = max(position, block * skip_interval)
+        end = min((block + 1) * skip_interval, size)
+        # The block contains a doc ID greater or equal to `doc_id`.
+        position = bisect_left(large, doc_id, start, end)
+        if large[position] == doc_id:
+            result.append(doc_id)
+            position += 1
+    return result
+
+
+def union(left: Sequence[DocID], right: Sequence[DocID]) -> PostingList:
+    """Return doc IDs that are in `left` or `right`."""
+    result = []
+    i, j = 0, 0
+    while i < len(left) and j < len(right):
+        left_doc, right_doc = left[i], right[j]
+        if left_doc == right_doc:
+            result.append(left_doc)
+            i += 1
+            j += 1
+        elif left_doc < right_doc:
+            result.append(left_doc)
+            i += 1
+        else:
+            result.append(right_doc)
+            j += 1
+    result.extend(left[i:])
+    result.extend(right[j:])
+    return result
+
+
+def union_many(postings: List[Sequence[DocID]]) -> PostingList:
+    """Return doc IDs that are in any of the posting lists.
+
+    This is a k-way merge, which costs `O(log k)` per doc ID.
+    """
+    if len(postings) == 1:
+        return list(postings[0])
+    if len(postings) == 2:
+        return union(*postings)
+    result = []
+    for doc_id in heapq.merge(*postings):
+        if not result or result[-1] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+def difference(left: Sequence[DocID], right: Sequence[DocID]) -> PostingList:
+    """Return doc IDs that are in `left` but not in `right`."""
+    result = []
+    i, j = 0, 0
+    while i < len(left) and j < len(right):
+        left_doc, right_doc = left[i], right[j]
+        if left_doc == right_doc:
+            i += 1
+            j += 1
+        elif left_doc < right_doc:
+            result.append(left_doc)
+            i += 1
+        else:
+            j += 1
+    result.extend(left[i:])
+    return result
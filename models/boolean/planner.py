@@ -0,0 +1,191 @@
+"""Execution plans of boolean requests.
+
+A request (see `search`) is compiled into a tree of plan nodes by
+`Query.plan()`. Each node carries an estimate of the number of documents it
+yields (`size`), and of the number of doc IDs read to compute it, including
+its children (`cost`). Estimates are based on document frequencies, and are
+used to order the operands of intersections.
+
+Plans are either executed as a whole using merge joins on sorted posting
+lists (see `merge`), or lazily, one document at a time, using cursors (see
+`cursors`). The former is faster when all results are needed, while the
+latter does not build intermediate results, and yields the first results
+in constant memory.
+"""
+from typing import List, Optional, Sequence
+
+from datatypes import DocID
+from indexes import Index
+
+from .cursors import AndCursor, Cursor, DifferenceCursor, ListCursor, OrCursor
+from .merge import difference, intersect, union_many
+
+
+class Plan:
+    """Base plan node class."""
+
+    size: int
+    cost: int
+
+    @property
+    def children(self) -> List["Plan"]:
+        return []
+
+    def label(self) -> str:
+        return self.__class__.__name__
+
+    def execute(self, index: Index) -> Sequence[DocID]:
+        """Return the sorted doc IDs matched by this plan."""
+        raise NotImplementedError
+
+    def skips(self, index: Index) -> Optional[Sequence[DocID]]:
+        """Return the skip pointers of the result of `execute()`, if any."""
+        return None
+
+    def cursor(self, index: Index) -> Cursor:
+        """Return a cursor over the doc IDs matched by this plan."""
+        raise NotImplementedError
+
+    def explain(self, depth: int = 0) -> str:
+        """Return a description of the plan, one node per line."""
+        lines = [f"{'  ' * depth}{self.label()} (size={self.size}, cost={self.cost})"]
+        lines.extend(child.explain(depth + 1) for child in self.children)
+        return "\n".join(lines)
+
+
+class Scan(Plan):
+    """Read the posting list of a leaf request (`Q`, `P` or `NEAR`)."""
+
+    def __init__(self, query, size: int):
+        self.query = query
+        self.size = size
+        self.cost = size
+
+    def label(self) -> str:
+        return f"Scan {self.query!r}"
+
+    def execute(self, index: Index) -> Sequence[DocID]:
+        return self.query._postings(index)
+
+    def skips(self, index: Index) -> Optional[Sequence[DocID]]:
+        return self.query._skips(index)
+
+    def cursor(self, index: Index) -> Cursor:
+        return ListCursor(
+            self.execute(index), self.skips(index), index.skip_interval
+        )
+
+
+class Intersect(Plan):
+    """Intersect posting lists, from the smallest to the largest one.
+
+    Intermediate results are at most as large as the smallest posting list,
+    and evaluation stops as soon as one of them is empty. As intermediate
+    results get smaller, they are searched in the next posting list rather
+    than merged with it (small-versus-small intersection).
+    """
+
+    def __init__(self, children: List[Plan]):
+        self._children = sorted(children, key=lambda child: child.size)
+        self.size = self._children[0].size
+        self.cost = sum(child.cost + child.size for child in self._children)
+
+    @property
+    def children(self) -> List[Plan]:
+        return self._children
+
+    def execute(self, index: Index) -> Sequence[DocID]:
+        result = self._children[0].execute(index)
+        for child in self._children[1:]:
+            if not result:
+                break
+            result = intersect(
+                result,
+                child.execute(index),
+                skips=child.skips(index),
+                skip_interval=index.skip_interval,
+            )
+        return result
+
+    def cursor(self, index: Index) -> Cursor:
+        return AndCursor([child.cursor(index) for child in self._children])
+
+
+class Union(Plan):
+    """Merge posting lists, removing duplicates."""
+
+    def __init__(self, children: List[Plan], num_documents: int):
+        self._children = children
+        # Upper bound: posting lists may overlap.
+        self.size = min(sum(child.size for child in children), num_documents)
+        self.cost = sum(child.cost + child.size for child in children)
+
+    @property
+    def children(self) -> List[Plan]:
+        return self._children
+
+    def execute(self, index: Index) -> Sequence[DocID]:
+        return union_many([child.execute(index) for child in self._children])
+
+    def cursor(self, index: Index) -> Cursor:
+        return OrCursor([child.cursor(index) for child in self._children])
+
+
+class Difference(Plan):
+    """Remove the documents matched by `right` from those matched by `left`.
+
+    This is how `a & ~b` is evaluated, so that the complement of `b` is never
+    built.
+    """
+
+    def __init__(self, left: Plan, right: Plan):
+        self.left = left
+        self.right = right
+        self.size = left.size
+        self.cost = left.cost + right.cost + left.size + right.size
+
+    @property
+    def children(self) -> List[Plan]:
+        return [self.left, self.right]
+
+    def execute(self, index: Index) -> Sequence[DocID]:
+        left = self.left.execute(index)
+        if not left:
+            return left
+        return difference(left, self.right.execute(index))
+
+    def cursor(self, index: Index) -> Cursor:
+        return DifferenceCursor(self.left.cursor(index), self.right.cursor(index))
+
+
+class Complement(Plan):
+    """Return all documents not matched by a plan.
+
+    This reads every doc ID of the index, and is only used when a negation
+    cannot be rewritten as a difference (e.g. `~a` or `a | ~b`).
+    """
+
+    def __init__(self, child: Plan, num_documents: int):
+        self.child = child
+        self.size = max(num_documents - child.size, 0)
+        self.cost = child.cost + child.size + num_documents
+
+    @property
+    def children(self) -> List[Plan]:
+        return [self.child]
+
+    def execute(self, index: Index) -> Sequence[DocID]:
+        return difference(_all_documents(index), self.child.execute(index))
+
+    def cursor(self, index: Index) -> Cursor:
+        return DifferenceCursor(
+            ListCursor(_all_documents(index)), self.child.cursor(index)
+        )
+
+
+def _all_documents(index: Index) -> Sequence[DocID]:
+    # Doc IDs of indexes opened from disk are a sorted array, which is not
+    # loaded in memory.
+    if isinstance(index.doc_ids, (set, frozenset)):
+        return sorted(index.doc_ids)
+    return index.doc_ids
@@ -0,0 +1,85 @@
+"""Positional merge joins, used by phrase and proximity queries.
+
+Positional posting lists are lists of `(doc_id, positions)` pairs sorted
+by doc ID, with positions sorted too, so both levels are merged linearly.
+"""
+from typing import Iterator, List, Tuple
+
+from datatypes import DocID, PositionalPostingList, Position
+
+
+def _common_documents(
+    left: PositionalPostingList, right: PositionalPostingList
+) -> Iterator[Tuple[DocID, List[Position], List[Position]]]:
+    """Merge two positional posting lists on their doc IDs."""
+    i, j = 0, 0
+    while i < len(left) and j < len(right):
+        left_doc, right_doc = left[i][0], right[j][0]
+        if left_doc == right_doc:
+            yield left_doc, left[i][1], right[j][1]
+            i += 1
+            j += 1
+        elif left_doc < right_doc:
+            i += 1
+        else:
+            j += 1
+
+
+def _shifted_matches(
+    left: List[Position], right: List[Position], distance: int
+) -> List[Position]:
+    """Return positions `q` of `right` such that `q - distance` is in `left`."""
+    matches = []
+    i, j = 0, 0
+    while i < len(left) and j < len(right):
+        target = left[i] + distance
+        if right[j] == target:
+            matches.append(right[j])
+            i += 1
+            j += 1
+        elif right[j] < target:
+            j += 1
+        else:
+            i += 1
+    return matches
+
+
+def _within(left: List[Position], right: List[Position], k: int) -> bool:
+    """Return whether some positions of `left` and `right` are at most `k` apart."""
+    i, j = 0, 0
+    while i < len(left) and j < len(right):
+        if abs(left[i] - right[j]) <= k:
+            return True
+        if left[i] < right[j]:
+            i += 1
+        else:
+            j += 1
+    return False
+
+
+def phrase_join(
+    left: PositionalPostingList, right: PositionalPostingList, distance: int = 1
+) -> PositionalPostingList:
+    """Join two positional posting lists on consecutive positions.
+
+    Returns the documents where a position of `right` follows a position of
+    `left` by exactly `distance`, along with the matching positions of
+    `right`, so that joins can be chained for phrases of any length.
+    """
+    result = []
+    for doc_id, left_positions, right_positions in _common_documents(left, right):
+        matches = _shifted_matches(left_positions, right_positions, distance)
+        if matches:
+            result.append((doc_id, matches))
+    return result
+
+
+def proximity_join(
+    left: PositionalPostingList, right: PositionalPostingList, k: int
+) -> List[DocID]:
+    """Return the documents where two terms occur at most `k` positions apart."""
+    return [
+        doc_id
+        for doc_id, left_positions, right_positions in _common_documents(left, right)
+        if _within(left_positions, right_positions, k)
+    ]
@@ -1,70 +1,352 @@
-"""Boolean request model implementation."""
-from typing import List, Callable
+"""Boolean request model implementation.
 
-from datatypes import PostingList, Term
+Requests are trees of `Query` objects, built by combining leaf requests
+(`Q`, `P` and `NEAR`) with the `&`, `|` and `~` operators. When called
+with an index, a request is compiled into an execution plan (see `planner`)
+which is then executed. Results can also be iterated over lazily using
+`Query.iter()`.
+"""
+from typing import Iterator, List, Optional
+
+from datatypes import DocID, PostingList, Term
 from indexes import Index
+from indexes.kgrams import is_wildcard
+from indexes.shards import ShardedIndex
 
-Operation = Callable[[PostingList, Index], PostingList]
+from .planner import Complement, Difference, Intersect, Plan, Scan, Union
+from .positional import phrase_join, proximity_join
 
 
-class Q:
-    """Represents a boolean request, which can be combined with others."""
+def _union_expanded(postings: List[PostingList]) -> PostingList:
+    """Return doc IDs that are in any of the posting lists of the terms an
+    expanded term (e.g. a wildcard) stands for.
+
+    Expansions may match thousands of terms, for which collecting doc IDs in
+    a set and sorting it (in C) is much faster than the k-way merge of
+    `merge.union_many()`, whose loop runs in the interpreter.
+    """
+    if len(postings) == 1:
+        return list(postings[0])
+    return sorted(set().union(*postings))
 
-    def __init__(self, term: Term):
-        self.term = term
-        self.operations: List[Operation] = []
 
-    def __and__(self, other: "Q") -> "Q":
+class Query:
+    """Base boolean request class."""
+
+    def __and__(self, other: "Query") -> "Query":
         """Intersect with another request.
 
         Example
         -------
         >>> Q("a") & Q("b")
         """
+        if not isinstance(other, Query):
+            return NotImplemented
+        return And(self, other)
 
-        def intersect(left: PostingList, index: Index) -> PostingList:
-            right = other(index)
-            return sorted(set(left) & set(right))
-
-        self.operations.append(intersect)
-
-        return self
-
-    def __or__(self, other: "Q") -> "Q":
+    def __or__(self, other: "Query") -> "Query":
         """Join with another request.
 
         Example
         -------
         >>> Q("a") | Q("b")
         """
+        if not isinstance(other, Query):
+            return NotImplemented
+        return Or(self, other)
 
-        def union(left: PostingList, index: Index) -> PostingList:
-            right = other(index)
-            return sorted(set(left) | set(right))
-
-        self.operations.append(union)
-        return self
-
-    def __invert__(self) -> "Q":
+    def __invert__(self) -> "Query":
         """Negate the request.
 
         Example
         -------
         >>> ~Q("a")
         """
+        return Not(self)
+
+    def plan(self, index: Index) -> Plan:
+        """Return the execution plan of this request against an index."""
+        raise NotImplementedError
+
+    def canonical(self) -> str:
+        """Return a canonical form of the request.
+
+        Equivalent requests, e.g. `Q("a") & Q("b")` and `Q("b") & Q("a")`,
+        have the same canonical form. Used as a key to cache results.
+        """
+        return repr(self)
 
-        def not_(left: PostingList, index: Index) -> PostingList:
-            return sorted(set(index.doc_ids) - set(left))
+    def iter(self, index: Index) -> Iterator[DocID]:
+        """Iterate over matching doc IDs, computing them one at a time.
 
-        self.operations.append(not_)
-        return self
+        Example
+        -------
+        >>> from itertools import islice
+        >>> first_10 = list(islice((Q("a") | ~Q("b")).iter(index), 10))
+        """
+        return iter(self.plan(index).cursor(index))
 
     def __call__(self, index: Index) -> PostingList:
-        postings = index.postings[self.term]
-        for operation in self.operations:
-            postings = operation(postings, index)
+        return list(self.plan(index).execute(index))
+
+
+class Q(Query):
+    """Represents a single-term boolean request.
+
+    The term may be a wildcard pattern, where `*` matches any string, e.g.
+    `Q("comput*")` or `Q("*graph*")`. It is expanded into the terms of the
+    index which match it using the k-gram index (see `indexes.kgrams`), and
+    matches documents which contain any of them.
+
+    Parameters
+    ----------
+    term : str
+    fuzzy : int, optional
+        If given, also match terms within this edit distance of `term`,
+        e.g. `Q("algoritm", fuzzy=2)` matches "algorithm". Candidate terms
+        are also found using the k-gram index.
+    """
+
+    def __init__(self, term: Term, fuzzy: int = 0):
+        if fuzzy and is_wildcard(term):
+            raise ValueError("Wildcard terms cannot be fuzzy")
+        self.term = term
+        self.fuzzy = fuzzy
+
+    def _expands(self) -> bool:
+        # Whether the term stands for several terms of the index.
+        return bool(self.fuzzy) or is_wildcard(self.term)
+
+    def _terms(self, index: Index) -> List[Term]:
+        if self.fuzzy:
+            return list(index.kgrams.similar(self.term, self.fuzzy))
+        if is_wildcard(self.term):
+            return index.kgrams.expand(self.term)
+        return [self.term]
+
+    def estimate(self, index: Index) -> int:
+        """Return an estimate of the number of matching documents."""
+        if not self._expands():
+            return index.df[self.term]
+        # Upper bound: posting lists may overlap.
+        total = sum(index.df[term] for term in self._terms(index))
+        return min(total, index.num_documents)
+
+    def _postings(self, index: Index) -> PostingList:
+        """Return the (sorted) doc IDs matching this request."""
+        if not self._expands():
+            return index.postings[self.term]
+        return _union_expanded([index.postings[term] for term in self._terms(index)])
+
+    def _skips(self, index: Index) -> Optional[PostingList]:
+        """Return the skip pointers of `_postings()`, if the index has some."""
+        if index.skips is None or self._expands():
+            return None
+        return index.skips[self.term]
+
+    def plan(self, index: Index) -> Plan:
+        return Scan(self, self.estimate(index))
+
+    def __repr__(self) -> str:
+        if self.fuzzy:
+            return f"{self.__class__.__name__}({self.term!r}, fuzzy={self.fuzzy})"
+        return f"{self.__class__.__name__}({self.term!r})"
+
+
+class And(Query):
+    """Represents the intersection of requests.
+
+    Nested intersections are flattened, e.g. `(a & b) & c` has 3 operands.
+    """
+
+    def __init__(self, *operands: Query):
+        self.operands: List[Query] = []
+        for operand in operands:
+            if isinstance(operand, And):
+                self.operands.extend(operand.operands)
+            else:
+                self.operands.append(operand)
+
+    def plan(self, index: Index) -> Plan:
+        included = [op for op in self.operands if not isinstance(op, Not)]
+        excluded = [op.operand for op in self.operands if isinstance(op, Not)]
+        if not included:
+            # De Morgan's law: `~a & ~b` is `~(a | b)`.
+            return Not(Or(*excluded)).plan(index)
+
+        plan = _intersect([operand.plan(index) for operand in included])
+        if excluded:
+            # `a & ~b & ~c` is evaluated as `a - (b | c)`.
+            plan = Difference(plan, Or(*excluded).plan(index))
+        return plan
+
+    def canonical(self) -> str:
+        return _canonical_operands(self.operands, " & ")
+
+    def __repr__(self) -> str:
+        return "(" + " & ".join(map(repr, self.operands)) + ")"
+
+
+class Or(Query):
+    """Represents the union of requests.
+
+    Nested unions are flattened, e.g. `(a | b) | c` has 3 operands.
+    """
+
+    def __init__(self, *operands: Query):
+        self.operands: List[Query] = []
+        for operand in operands:
+            if isinstance(operand, Or):
+                self.operands.extend(operand.operands)
+            else:
+                self.operands.append(operand)
+
+    def plan(self, index: Index) -> Plan:
+        plans = [operand.plan(index) for operand in self.operands]
+        if len(plans) == 1:
+            return plans[0]
+        return Union(plans, index.num_documents)
+
+    def canonical(self) -> str:
+        return _canonical_operands(self.operands, " | ")
+
+    def __repr__(self) -> str:
+        return "(" + " | ".join(map(repr, self.operands)) + ")"
+
+
+class Not(Query):
+    """Represents the negation of a request."""
+
+    def __init__(self, operand: Query):
+        self.operand = operand
+
+    def __invert__(self) -> Query:
+        # Double negations cancel out.
+        return self.operand
+
+    def plan(self, index: Index) -> Plan:
+        return Complement(self.operand.plan(index), index.num_documents)
+
+    def canonical(self) -> str:
+        return f"~{self.operand.canonical()}"
+
+    def __repr__(self) -> str:
+        return f"~{self.operand!r}"
+
+
+def _canonical_operands(operands: List[Query], separator: str) -> str:
+    # Operators are commutative and idempotent: sort operands and remove
+    # duplicates.
+    canonicals = sorted({operand.canonical() for operand in operands})
+    if len(canonicals) == 1:
+        return canonicals[0]
+    return "(" + separator.join(canonicals) + ")"
+
+
+def _intersect(plans: List[Plan]) -> Plan:
+    return plans[0] if len(plans) == 1 else Intersect(plans)
+
+
+def _tokenize(index: Index, text: str) -> List[Term]:
+    if index.collection is not None:
+        return list(index.collection.tokenize(text))
+    return text.lower().split()
+
+
+def _check_positions(index: Index):
+    if not index.has_positions:
+        raise ValueError(
+            "This query requires a positional index. "
+            "Re-build the index using `--positions`."
+        )
+
+
+class P(Q):
+    """Represents a phrase request.
+
+    Matches documents where the terms of the phrase occur consecutively.
+    The phrase is tokenized the same way as the collection.
+
+    Example
+    -------
+    >>> P("operating system") & ~Q("unix")
+    """
+
+    def estimate(self, index: Index) -> int:
+        terms = _tokenize(index, self.term)
+        return min((index.df[term] for term in terms), default=0)
+
+    def canonical(self) -> str:
+        return f"P({' '.join(self.term.split())!r})"
+
+    def _skips(self, index: Index) -> Optional[PostingList]:
+        return None
+
+    def _postings(self, index: Index) -> PostingList:
+        _check_positions(index)
+        terms = _tokenize(index, self.term)
+        if not terms:
+            return []
+        matches = index.positions[terms[0]]
+        for term in terms[1:]:
+            matches = phrase_join(matches, index.positions[term])
+        return [doc_id for doc_id, _ in matches]
+
+
+class NEAR(Q):
+    """Represents a proximity request.
+
+    Matches documents where two terms occur at most `k` positions apart
+    (in any order).
+
+    Example
+    -------
+    >>> NEAR("operating", "system", 3)
+    """
+
+    def __init__(self, left: Term, right: Term, k: int):
+        super().__init__(f"{left} {right}")
+        self.left = left
+        self.right = right
+        self.k = k
+
+    def estimate(self, index: Index) -> int:
+        terms = _tokenize(index, self.left) + _tokenize(index, self.right)
+        return min((index.df[term] for term in terms), default=0)
+
+    def _skips(self, index: Index) -> Optional[PostingList]:
+        return None
+
+    def _postings(self, index: Index) -> PostingList:
+        _check_positions(index)
+        left = _tokenize(index, self.left)
+        right = _tokenize(index, self.right)
+        if len(left) > 1 or len(right) > 1:
+            raise ValueError("NEAR() operands must be single terms")
+        if not left or not right:
+            # E.g. a stop word.
+            return []
+        return proximity_join(
+            index.positions[left[0]], index.positions[right[0]], self.k
+        )
+
+    def canonical(self) -> str:
+        # Terms may occur in any order.
+        left, right = sorted([self.left, self.right])
+        return f"NEAR({left!r}, {right!r}, {self.k})"
+
+    def __repr__(self) -> str:
+        return f"NEAR({self.left!r}, {self.right!r}, {self.k})"
+
+
+def _shard_results(index: Index, query: Query) -> PostingList:
+    return query(index)
+
 
-        return postings
+def search_shards(query: Query, index: ShardedIndex) -> PostingList:
+    """Run a request against the shards of an index, in parallel.
 
-    def __str__(self) -> str:
-        return f"<Q {self.operations}>"
+    Shards are in doc ID order, so their results are concatenated.
+    """
+    results = index.map(_shard_results, query)
+    return [doc_id for shard_results in results for doc_id in shard_results]
@@ -0,0 +1,185 @@
+"""Cache of request results, shared by the boolean and vector models.
+
+Results are stored under a canonical form of the request, so that equivalent
+requests share an entry: see `boolean.Query.canonical()` and
+`vector.request_key()`.
+
+The cache is bounded by the (approximate) memory size of its entries, and
+the least recently used entries are evicted first. The budget is read from
+the `RESULT_CACHE_BYTES` environment variable (0 disables the cache).
+
+Caches of indexes stored on disk are persisted next to the index, and are
+invalidated when the index file changes. Caches of other indexes (built in
+memory, or loaded from the legacy JSON format) are not persisted.
+"""
+import json
+import os
+import sys
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from data_collections import CACHE
+from datatypes import DocID
+from indexes import Index
+
+DEFAULT_MAX_BYTES = 16 * 2 ** 20
+
+Results = List[DocID]
+
+
+def _size(key: str, results: Results) -> int:
+    # Memory used by an entry, including the doc IDs.
+    return (
+        sys.getsizeof(key)
+        + sys.getsizeof(results)
+        + sum(map(sys.getsizeof, results))
+    )
+
+
+class ResultCache:
+    """LRU cache of request results, bounded by their size in memory.
+
+    Example
+    -------
+
+    ```python
+    cache = ResultCache.open(index)
+    results = cache.get_or_compute(key, lambda: query(index))
+    cache.save()
+    ```
+
+    Parameters
+    ----------
+    index : Index
+        The index requests are run against.
+    max_bytes : int, optional
+        Memory budget of the cache. Defaults to the `RESULT_CACHE_BYTES`
+        environment variable, or 16MiB.
+    path : str, optional
+        Where the cache is persisted by `save()`, if any.
+    """
+
+    def __init__(self, index: Index, max_bytes: int = None, path: str = None):
+        if max_bytes is None:
+            max_bytes = int(os.getenv("RESULT_CACHE_BYTES", DEFAULT_MAX_BYTES))
+        self.index = index
+        self.max_bytes = max_bytes
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries: Dict[str, Results] = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._fingerprint = self._index_fingerprint()
+        if path is not None:
+            self._load()
+
+    @classmethod
+    def open(cls, index: Index, **kwargs) -> "ResultCache":
+        """Return the persistent cache of an index's collection."""
+        path = None
+        if index.collection is not None:
+            path = os.path.join(CACHE, f"{index.collection.name}_results.json")
+        return cls(index, path=path, **kwargs)
+
+    def _index_fingerprint(self) -> Optional[list]:
+        return self.index.fingerprint()
+
+    def _check(self):
+        # Results computed against a previous build of the index are stale.
+        current = self._index_fingerprint()
+        if current != self._fingerprint:
+            self.clear()
+            self._fingerprint = current
+
+    def _load(self):
+        # Without a fingerprint (e.g. for a legacy JSON index), persisted
+        # results could not be told stale.
+        if self._fingerprint is None:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("index") != self._fingerprint:
+            return
+        for key, results in data["entries"]:
+            self._store(key, results)
+
+    def save(self):
+        """Persist the cache, if it has a path and the index a fingerprint."""
+        if self.path is None or self._fingerprint is None:
+            return
+        data = {"index": self._fingerprint, "entries": list(self._entries.items())}
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+    def _store(self, key: str, results: Results):
+        if key in self._entries:
+            self.size -= self._sizes.pop(key)
+            del self._entries[key]
+        size = _size(key, results)
+        if size > self.max_bytes:
+            return
+        while self.size + size > self.max_bytes:
+            evicted, _ = self._entries.popitem(last=False)
+            self.size -= self._sizes.pop(evicted)
+        self._entries[key] = results
+        self._sizes[key] = size
+        self.size += size
+
+    def get(self, key: str) -> Optional[Results]:
+        """Return the cached results of a request, or `None`."""
+        self._check()
+        results = self._entries.get(key)
+        if results is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return results
+
+    def put(self, key: str, results: Results) -> Results:
+        """Cache the results of a request, and return them."""
+        self._check()
+        results = list(results)
+        self._store(key, results)
+        return results
+
+    def get_or_compute(self, key: str, compute: Callable[[], Results]) -> Results:
+        """Return the cached results of a request, computing them if needed."""
+        results = self.get(key)
+        if results is None:
+            results = self.put(key, compute())
+        return results
+
+    def clear(self):
+        """Remove all entries."""
+        self._entries.clear()
+        self._sizes.clear()
+        self.size = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Hit and miss counters, and the number and size of entries."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self.size,
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"{self.hits} hits, {self.misses} misses, "
+            f"{len(self._entries)} entries ({self.size / 1024:.1f}KiB)"
+        )
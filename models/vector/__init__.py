@@ -1,2 +1,9 @@
 from .cli import cli
-from .search import vector_search
+from .engine import VectorEngine
+from .search import (
+    correct_request,
+    request_key,
+    search_shards,
+    vector_scores,
+    vector_search,
+)
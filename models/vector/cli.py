@@ -1,14 +1,18 @@
-from typing import Type
+from typing import Optional, Type
 
 import click
 
 from cli_utils import CollectionType
 from data_collections import Collection
 from indexes import build_index
+from indexes.shards import ShardedIndex
+from models.cache import ResultCache
+from server.client import Client, ServerError
 
 from .cli_utils import WeightingSchemeClassType
-from .schemes import SCHEMES, WeightingScheme, TfIdfSimple
-from .search import vector_search
+from .engine import VectorEngine
+from .schemes import NORMS, SCHEMES, WeightingScheme, TfIdfSimple
+from .search import correct_request, request_key, search_shards, vector_search
 
 
 @click.command()
@@ -23,17 +27,86 @@ from .search import vector_search
     default=TfIdfSimple.name,
     show_default=True,
 )
+@click.option(
+    "--engine",
+    type=click.Choice(["python", "numpy"]),
+    default="python",
+    show_default=True,
+    help="Score postings one at a time, or using NumPy arrays.",
+)
+@click.option(
+    "--fuzzy",
+    is_flag=True,
+    help="Correct misspelled terms using the closest terms of the index.",
+)
+@click.option(
+    "--server",
+    default=None,
+    help="Send the request to a query server (see `python -m server`), "
+    "e.g. http://127.0.0.1:8765 or unix:/path/to/socket.",
+)
 def cli(
-    collection: Collection, query: str, topk: int, wcs: Type[WeightingScheme]
+    collection: Collection,
+    query: str,
+    topk: int,
+    wcs: Type[WeightingScheme],
+    engine: str,
+    fuzzy: bool,
+    server: Optional[str],
 ):
-    """Search a collection using the vector model."""
-    index = build_index(collection)
+    """Search a collection using the vector model.
+
+    If the index has been built with `--shards`, shards are searched in
+    parallel.
+
+    With `--fuzzy`, request terms which are not in the index are replaced by
+    the closest term of the index (within 1 edit for terms of up to 5
+    characters, 2 edits otherwise).
+
+    With `--server`, the request is sent to a query server, which keeps the
+    index loaded.
+    """
+    if server is not None:
+        try:
+            with Client(server) as client:
+                response = client.vector(
+                    collection.name,
+                    query,
+                    k=topk,
+                    wcs=wcs.name,
+                    engine=engine,
+                    fuzzy=fuzzy,
+                )
+        except (OSError, ServerError) as exc:
+            raise click.ClickException(f"{server}: {exc}")
+        click.echo(click.style(f"Results: {response['results']}", fg="green"))
+        click.echo(f"Server latency: {response['latency'] * 1000:.2f}ms")
+        return
+
+    sharded = ShardedIndex.from_cache(collection)
+    index = sharded or build_index(collection, statistics=NORMS)
 
     click.echo(f"Weighting scheme: {wcs.name}")
 
     click.echo("Query: ", nl=False)
     click.echo(click.style(query, fg="blue"))
+    if fuzzy:
+        query = correct_request(query, index)
+        click.echo("Corrected query: ", nl=False)
+        click.echo(click.style(query, fg="blue"))
+
+    def search():
+        if sharded is not None:
+            return search_shards(query, sharded, k=topk, wcs=wcs, engine=engine)
+        if engine == "numpy":
+            return VectorEngine(index, wcs=wcs).search(query, k=topk)
+        return vector_search(query, index, k=topk, wcs=wcs)
 
-    results = vector_search(query, index, k=topk, wcs=wcs)
+    cache = ResultCache.open(index)
+    results = cache.get_or_compute(request_key(query, wcs, topk), search)
+    cache.save()
+    if sharded is not None:
+        sharded.close()
 
     click.echo(click.style(f"Results: {results}", fg="green"))
+    click.echo(f"Result cache: {cache}")
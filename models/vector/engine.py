@@ -0,0 +1,270 @@
+"""Vectorized vector search engine, backed by NumPy arrays.
+
+The index is loaded as a term-document matrix in CSR (Compressed Sparse Row)
+format: the weights of the documents of term `t` (i.e. row `t`) are
+`data[indptr[t]:indptr[t + 1]]`, and their doc IDs are
+`indices[indptr[t]:indptr[t + 1]]`.
+
+For indexes stored with the `raw` codec, `indices` is a zero-copy view of the
+memory-mapped posting lists.
+"""
+from array import array
+from collections import Counter
+from typing import Callable, Iterable, List, Optional, Tuple, Type
+
+import numpy as np
+
+from analysis import get_analyzer
+from datatypes import DocID, Term
+from indexes import Index
+
+from .schemes import SchemeNorm, TfIdfSimple, WeightingScheme
+
+# Maximum number of cells of the (queries x documents) score matrix computed
+# at once when scoring a batch of queries.
+MAX_BATCH_CELLS = 2 ** 23
+
+
+def _apply(function: Callable[[int], float], values: np.ndarray) -> np.ndarray:
+    # Apply a scalar function to an array of small integers, by calling it
+    # once per distinct value.
+    distinct, inverse = np.unique(values, return_inverse=True)
+    weights = np.array([function(int(value)) for value in distinct], np.float32)
+    return weights[inverse].reshape(values.shape)
+
+
+class VectorEngine:
+    """Vector-space search over a term-document matrix.
+
+    Scores are the same as those of `vector_search`, but computed using
+    array operations instead of one posting at a time.
+
+    Parameters
+    ----------
+    index : Index
+    wcs : class, optional
+        A weighting scheme class. Defaults to `TfIdfSimple`.
+    """
+
+    def __init__(self, index: Index, wcs: Type[WeightingScheme] = None):
+        if wcs is None:
+            wcs = TfIdfSimple
+        self.index = index
+        self.wcs = wcs
+        self._analyzer = get_analyzer()
+
+        self._lookup, indptr, indices, tfs, df = self._load(index)
+        self.indptr = indptr
+        self.indices = indices
+        self.num_documents = max(index.doc_ids, default=-1) + 1
+
+        num_documents = index.num_documents
+        # Lengths of posting lists, and document frequencies of terms. They
+        # only differ for shards (see `indexes.shards`), which use those of
+        # the whole collection.
+        self.lengths = np.diff(indptr)
+        self.df = df
+        self.df_weights = _apply(
+            lambda df: wcs.df_weight(df, num_documents), self.df
+        )
+        self.data = _apply(wcs.tf_weight, tfs)
+        self.data *= np.repeat(self.df_weights, self.lengths)
+
+        self.norms = np.ones(self.num_documents, np.float32)
+        if wcs.normalized:
+            norms = np.asarray(index.statistics.fetch(SchemeNorm(wcs)))
+            self.norms[: len(norms)] = norms
+            self.norms[self.norms == 0] = 1
+
+    @staticmethod
+    def _load(index: Index) -> Tuple[Callable[[Term], Optional[int]], ...]:
+        # Return a term lookup function, the `indptr`, `indices` and
+        # frequencies arrays of the matrix, and the df of each row.
+        index_file = index.file
+        if index_file is not None and index_file.meta["codec"] == "raw":
+            # Posting lists and frequencies are stored as arrays of 32-bit
+            # integers: map them directly.
+            offsets = index_file.file.array("postings.offsets", "Q")
+            indptr = np.asarray(offsets).astype(np.int64)
+            indices = np.frombuffer(index_file.file.section("postings"), np.uint32)
+            tfs = np.frombuffer(index_file.file.section("frequencies"), np.uint32)
+            df = np.asarray(index.df.values)
+            return index_file.lexicon.lookup, indptr // 4, indices, tfs, df
+
+        terms = sorted(index.postings)
+        term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        indptr = array("Q", [0])
+        indices = array("I")
+        tfs = array("I")
+        df = array("I")
+        for term in terms:
+            indices.extend(index.postings[term])
+            tfs.extend(index.frequencies[term])
+            indptr.append(len(indices))
+            df.append(index.df[term])
+        return (
+            term_ids.get,
+            np.frombuffer(indptr, np.uint64).astype(np.int64),
+            np.frombuffer(indices, np.uint32),
+            np.frombuffer(tfs, np.uint32),
+            np.frombuffer(df, np.uint32),
+        )
+
+    def query_vector(self, request: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Return the rows, weights and norm of a request vector.
+
+        Returns
+        -------
+        rows : array of int
+            Term IDs (rows of the matrix) of request terms found in the index.
+        weights : array of float
+            Weight of each of these terms in the request.
+        norm : float
+            Euclidean norm of the request vector.
+        """
+        return self._query_vector(self._analyzer.analyze(request))
+
+    def _query_vector(
+        self, terms: List[Term]
+    ) -> Tuple[np.ndarray, np.ndarray, float]:
+        wcs = self.wcs
+        rows, weights = [], []
+        norm = 0.0
+        for term, occurrences in Counter(terms).items():
+            row = self._lookup(term)
+            if row is None:
+                # Shards may not have the term, but other shards may.
+                df = self.index.df.get(term, 0)
+            else:
+                df = int(self.df[row])
+            w_i_q = wcs.tf_weight(occurrences) * wcs.df_weight(
+                df, self.index.num_documents
+            )
+            norm += occurrences * w_i_q ** 2
+            if row is not None and w_i_q:
+                rows.append(row)
+                weights.append(occurrences * w_i_q)
+        return (
+            np.array(rows, np.int64),
+            np.array(weights, np.float32),
+            float(np.sqrt(norm)),
+        )
+
+    def _ranges(self, rows: np.ndarray) -> np.ndarray:
+        # Positions in `indices` and `data` of the postings of some rows.
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(lengths.sum())
+
+    def score(self, request: str) -> np.ndarray:
+        """Return the score of every document for a request.
+
+        Returns
+        -------
+        scores : array of float
+            Scores indexed by doc ID. Documents which do not match any
+            request term have a score of 0.
+        """
+        rows, weights, norm = self.query_vector(request)
+        scores = np.zeros(self.num_documents, np.float32)
+        for row, weight in zip(rows, weights):
+            start, end = self.indptr[row], self.indptr[row + 1]
+            # Doc IDs are distinct within a posting list, so this is a
+            # plain scatter.
+            scores[self.indices[start:end]] += self.data[start:end] * weight
+        return scores / (self.norms * (norm or 1))
+
+    def score_many(self, requests: List[str]) -> np.ndarray:
+        """Return the scores of every document for a batch of requests.
+
+        This is the product of the (sparse) matrix of request vectors and the
+        term-document matrix, computed in a single scatter-add.
+
+        Returns
+        -------
+        scores : 2D array of float
+            Scores of shape `(len(requests), num_documents)`.
+        """
+        positions, rows, weights, norms = [], [], [], []
+        # Requests are analyzed as a batch.
+        queries = self._analyzer.analyze_many(requests)
+        for query_id, terms in enumerate(queries):
+            query_rows, query_weights, norm = self._query_vector(terms)
+            ranges = self._ranges(query_rows)
+            positions.append(ranges)
+            rows.append(np.full(len(ranges), query_id, np.int64))
+            weights.append(np.repeat(query_weights, self.lengths[query_rows]))
+            norms.append(norm or 1)
+
+        positions = np.concatenate(positions or [np.empty(0, np.int64)])
+        cells = np.concatenate(rows or [np.empty(0, np.int64)]) * self.num_documents
+        cells += self.indices[positions]
+        products = self.data[positions] * np.concatenate(
+            weights or [np.empty(0, np.float32)]
+        )
+        scores = np.bincount(
+            cells, weights=products, minlength=len(requests) * self.num_documents
+        )
+        scores = scores.reshape(len(requests), self.num_documents).astype(np.float32)
+        return scores / (self.norms * np.array(norms, np.float32)[:, None])
+
+    def search(self, request: str, k: int = 10) -> List[DocID]:
+        """Perform a vector-space search.
+
+        Parameters
+        ----------
+        request : str
+        k : int, optional
+            Maximum number of documents to return. Defaults to 10.
+        """
+        return top_k(self.score(request), k)
+
+    def search_many(
+        self, requests: Iterable[str], k: int = 10, scores: bool = False
+    ) -> list:
+        """Perform a vector-space search for each request of a batch.
+
+        Requests are scored in chunks, so that the score matrix holds at
+        most `MAX_BATCH_CELLS` cells.
+
+        Parameters
+        ----------
+        requests : iterable of str
+        k : int, optional
+            Maximum number of documents to return per request.
+        scores : bool, optional
+            Whether to return (doc ID, score) pairs rather than doc IDs.
+        """
+        requests = list(requests)
+        chunk_size = max(1, MAX_BATCH_CELLS // max(1, self.num_documents))
+        results = []
+        for start in range(0, len(requests), chunk_size):
+            chunk_scores = self.score_many(requests[start : start + chunk_size])
+            for row in chunk_scores:
+                doc_ids = top_k(row, k)
+                if scores:
+                    results.append(list(zip(doc_ids, row[doc_ids].tolist())))
+                else:
+                    results.append(doc_ids)
+        return results
+
+
+def top_k(scores: np.ndarray, k: int) -> List[DocID]:
+    """Select the `k` best scored documents out of an array of scores.
+
+    Documents with a score of 0 are ignored. As in `search.top_k`, ties are
+    broken by increasing doc ID.
+    """
+    if k <= 0:
+        return []
+    candidates = np.flatnonzero(scores)
+    values = scores[candidates]
+    if k < len(candidates):
+        # Keep documents scored at least as high as the k-th best one, so
+        # that ties at the boundary are resolved by doc ID below.
+        threshold = np.partition(values, len(values) - k)[len(values) - k]
+        selected = values >= threshold
+        candidates, values = candidates[selected], values[selected]
+    order = np.lexsort((candidates, -values))[:k]
+    return candidates[order].tolist()
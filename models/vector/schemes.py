@@ -1,25 +1,39 @@
 """Vector search weighting schemes."""
 
-from collections import defaultdict
-from typing import Dict, List, Union, Type
+from typing import Dict, List, Optional, Sequence, Type, Union
 from math import sqrt, log10
 
-from data_collections import Collection
-from datatypes import DocID, PostingList, Term
+from analysis import get_analyzer
+from datatypes import DocID, Term
 from indexes import Index
+from indexes.stats import DocumentStatistic
 
 
 class WeightingScheme:
-    """Base weighting scheme class."""
+    """Base weighting scheme class.
+
+    The weight of a term in a document is `tf(term, doc) * df(term)`.
+    Schemes with `normalized = True` divide scores by the norm of document
+    vectors, which is precomputed at index time (see `SchemeNorm`).
+    """
 
     name: str
+    normalized: bool = False
 
     def __init__(self, index: Index, query: List[str]):
         self.index = index
         self.query = query
-        self.weights: List[Dict[DocID, float]] = [
-            defaultdict(float) for _ in query
-        ]
+        self._norms: Optional[Sequence[float]] = None
+
+    @staticmethod
+    def tf_weight(count: int) -> float:
+        """Return the tf factor for a given number of occurrences."""
+        raise NotImplementedError
+
+    @staticmethod
+    def df_weight(df: int, num_documents: int) -> float:
+        """Return the df factor for a given document frequency."""
+        raise NotImplementedError
 
     def norm(self, doc_id: DocID) -> float:
         """Return a document's normalization factor.
@@ -32,9 +46,15 @@ class WeightingScheme:
         -------
         norm : float
         """
-        raise NotImplementedError
-
-    def tf(self, term: Term, doc: Union[DocID, str]) -> float:
+        if not self.normalized:
+            return 1
+        if self._norms is None:
+            self._norms = self.index.statistics.fetch(SchemeNorm(type(self)))
+        return self._norms[doc_id] or 1
+
+    def tf(
+        self, term: Term, doc: Union[DocID, str], count: int = None
+    ) -> float:
         """Return the frequency of a term in a document.
 
         Parameters
@@ -43,12 +63,21 @@ class WeightingScheme:
         doc : str or int
             Either a string (for non-indexed documents) or a document ID
             (for indexed documents).
+        count : int, optional
+            Number of occurrences of the term in the document, if already
+            known (e.g. read from the index alongside a posting list).
 
         Returns
         -------
         tf : float
         """
-        raise NotImplementedError
+        if count is None:
+            if isinstance(doc, str):
+                # Reuse the tokenize algorithm.
+                count = get_analyzer().analyze(doc).count(term)
+            else:
+                count = self.index.tf(term, doc)
+        return self.tf_weight(count)
 
     def df(self, term: Term) -> float:
         """Return the document frequency of a term.
@@ -61,21 +90,23 @@ class WeightingScheme:
         -------
         df : float
         """
-        raise NotImplementedError
+        return self.df_weight(self.index.df[term], self.index.num_documents)
 
-    def __call__(self, term: Term, doc_id: DocID) -> float:
-        """Compute the weight of a term relative to a document.
+    def __call__(self, term: Term, doc_id: DocID, count: int = None) -> float:
+        """Compute the (unnormalized) weight of a term relative to a document.
 
         Parameters
         ----------
         term : str
         doc_id : int
+        count : int, optional
+            Number of occurrences of the term in the document, if known.
 
         Returns
         -------
         weight : float
         """
-        return self.norm(doc_id) * self.df(term) * self.tf(term, doc_id)
+        return self.df(term) * self.tf(term, doc_id, count)
 
 
 class TfIdfSimple(WeightingScheme):
@@ -83,19 +114,12 @@ class TfIdfSimple(WeightingScheme):
 
     name = "simple"
 
-    def norm(self, doc_id: DocID) -> float:
-        return 1
+    @staticmethod
+    def tf_weight(count: int) -> float:
+        return count
 
-    def tf(self, term: Term, doc: Union[DocID, str]) -> float:
-        if isinstance(doc, str):
-            # Reuse the tokenize algorithm.
-            tokens = Collection().tokenize(doc)
-            return sum(1 for token in tokens if token == term)
-
-        doc_ids: PostingList = self.index.postings[term]
-        return sum(1 for doc_id in doc_ids if doc_id == doc)
-
-    def df(self, term: Term) -> float:
+    @staticmethod
+    def df_weight(df: int, num_documents: int) -> float:
         return 1
 
 
@@ -103,18 +127,34 @@ class TfIdfComplex(TfIdfSimple):
     """A more complex tf-idf weighting scheme."""
 
     name = "complex"
+    normalized = True
 
-    def norm(self, doc_id: DocID) -> float:
-        d2 = sum(weights[doc_id] for weights in self.weights)
-        return 1 / sqrt(d2) if d2 else 1
+    @staticmethod
+    def tf_weight(count: int) -> float:
+        return 1 + log10(count) if count > 0 else 0
 
-    def tf(self, term: Term, doc: Union[DocID, str]) -> float:
-        tf = super().tf(term, doc)
-        return 1 + log10(tf) if tf > 0 else 0
+    @staticmethod
+    def df_weight(df: int, num_documents: int) -> float:
+        return 1 / df if df else 0
 
-    def df(self, term: Term) -> float:
-        df_t = self.index.df[term]
-        return 1 / df_t if df_t else 0
+
+class SchemeNorm(DocumentStatistic):
+    """Euclidean norm of document vectors under a weighting scheme."""
+
+    def __init__(self, wcs: Type[WeightingScheme]):
+        self.wcs = wcs
+        self.name = self.name_for(wcs)
+
+    @staticmethod
+    def name_for(wcs) -> str:
+        return f"norm:{wcs.name}"
+
+    def contribution(self, tf: int, df: int, num_documents: int) -> float:
+        weight = self.wcs.tf_weight(tf) * self.wcs.df_weight(df, num_documents)
+        return weight * weight
+
+    def finalize(self, total: float) -> float:
+        return sqrt(total)
 
 
 SCHEMES: Dict[str, Type[WeightingScheme]] = {}
@@ -122,3 +162,8 @@ SCHEMES: Dict[str, Type[WeightingScheme]] = {}
 for _wcs in (TfIdfSimple, TfIdfComplex):
     SCHEMES[_wcs.name] = _wcs
 
+# Norms of the normalized schemes, to precompute when building an index
+# (see `indexes.build_index()`).
+NORMS: List[SchemeNorm] = [
+    SchemeNorm(wcs) for wcs in SCHEMES.values() if wcs.normalized
+]
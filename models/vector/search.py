@@ -1,17 +1,166 @@
 """Vector search algorithm implementation."""
+from collections import Counter
 from heapq import nlargest
-from typing import Dict, List, Type
+from itertools import chain
+from typing import Dict, List, Tuple, Type, Union
 from math import sqrt
 
-from data_collections import Collection
-from datatypes import DocID
+from analysis import get_analyzer
+from datatypes import DocID, Term
 from indexes import Index
+from indexes.shards import ShardedIndex
 
+from .engine import VectorEngine
+from .engine import top_k as engine_top_k
 from .schemes import WeightingScheme, TfIdfSimple
 
 
+def top_k(scores: Dict[DocID, float], k: int) -> List[DocID]:
+    """Select the `k` best scored documents.
+
+    Documents are ranked by decreasing score, and ties are broken by
+    increasing doc ID so that results are deterministic.
+    This uses a heap of size `k`, i.e. `O(n log k)` for `n` scores.
+    """
+    best = nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+    return [doc_id for doc_id, _ in best]
+
+
+def request_key(
+    request: str, wcs: Type[WeightingScheme], k: int, fuzzy: bool = False
+) -> str:
+    """Return a canonical form of a vector request.
+
+    Results only depend on the bag of terms of the request, the weighting
+    scheme, `k` and whether terms are corrected. Used as a key to cache
+    results.
+    """
+    terms = Counter(get_analyzer().analyze(request))
+    bag = " ".join(f"{term}:{count}" for term, count in sorted(terms.items()))
+    prefix = "vector-fuzzy" if fuzzy else "vector"
+    return f"{prefix}:{wcs.name}:{k}:{bag}"
+
+
+def max_edit_distance(term: Term) -> int:
+    """Return the edit distance allowed to correct a term.
+
+    Short terms have many neighbours, so they are corrected less.
+    """
+    if len(term) <= 2:
+        return 0
+    return 1 if len(term) <= 5 else 2
+
+
+def _similar_terms(
+    index: Index, terms: List[Term]
+) -> Dict[Term, Dict[Term, Tuple[int, int]]]:
+    # Terms of the index close to each request term which is not in the
+    # collection, with their edit distance and document frequency.
+    similar = {}
+    for term in terms:
+        if index.df.get(term, 0):
+            continue
+        candidates = index.kgrams.similar(term, max_edit_distance(term))
+        similar[term] = {
+            candidate: (distance, index.df[candidate])
+            for candidate, distance in candidates.items()
+        }
+    return similar
+
+
+def correct_request(request: str, index: Union[Index, ShardedIndex]) -> str:
+    """Replace the terms of a request which are not in the index by their
+    closest term in the index.
+
+    Candidate terms are found using the k-gram index (see
+    `indexes.kgrams.KGramIndex.similar()`). Ties are broken by decreasing
+    document frequency. Terms without any close term are kept.
+
+    Returns
+    -------
+    request : str
+        The tokens of the corrected request, separated by spaces.
+    """
+    terms = get_analyzer().analyze(request)
+    if isinstance(index, ShardedIndex):
+        similar: Dict[Term, Dict[Term, Tuple[int, int]]] = {}
+        for shard_similar in index.map(_similar_terms, sorted(set(terms))):
+            for term, candidates in shard_similar.items():
+                similar.setdefault(term, {}).update(candidates)
+    else:
+        similar = _similar_terms(index, sorted(set(terms)))
+
+    corrections = {}
+    for term, candidates in similar.items():
+        if candidates:
+            corrections[term] = min(
+                candidates,
+                key=lambda c: (candidates[c][0], -candidates[c][1], c),
+            )
+    return " ".join(corrections.get(term, term) for term in terms)
+
+
+def vector_scores(
+    request: str, index: Index, wcs: Type[WeightingScheme] = None
+) -> Dict[DocID, float]:
+    """Score the documents matching at least one term of a request.
+
+    Scoring is done term-at-a-time: documents get an accumulator the first
+    time they appear in the posting list of a request term, so that only
+    documents matching at least one term are scored.
+
+    Parameters
+    ----------
+    request : str
+        A request as a string of words.
+    index : Index
+        A search index.
+    wcs : class, optional
+        A weighting scheme class. Defaults to `TfIdfSimple`.
+
+    Returns
+    -------
+    scores : dict
+        Mapping of doc IDs to scores.
+    """
+    if wcs is None:
+        wcs = TfIdfSimple
+
+    w = wcs(index=index, query=get_analyzer().analyze(request))
+    tf_weight = w.tf_weight
+
+    # Sparse accumulators, for matching documents only.
+    scores: Dict[DocID, float] = {}
+    # Squared norm of the request vector.
+    norm_q = 0.0
+
+    for term, occurrences in Counter(w.query).items():
+        df = w.df(term)
+        w_i_q = tf_weight(occurrences) * df
+        norm_q += occurrences * w_i_q ** 2
+        if not w_i_q:
+            continue
+
+        postings = zip(index.postings[term], index.frequencies[term])
+        for doc_id, count in postings:
+            w_i_d = df * tf_weight(count)
+            scores[doc_id] = scores.get(doc_id, 0) + occurrences * w_i_d * w_i_q
+
+    norm_q = sqrt(norm_q)
+
+    # Document norms are precomputed at index time.
+    for doc_id in scores:
+        scores[doc_id] /= w.norm(doc_id) * norm_q or 1
+
+    return scores
+
+
 def vector_search(
-    request: str, index: Index, k: int = 10, wcs: Type[WeightingScheme] = None
+    request: str,
+    index: Index,
+    k: int = 10,
+    wcs: Type[WeightingScheme] = None,
+    fuzzy: bool = False,
 ) -> List[DocID]:
     """Perform a vector-space search.
 
@@ -25,29 +174,72 @@ def vector_search(
         Maximum number of documents to return. Defaults to 10.
     wcs : class, optional
         A weighting scheme class. Defaults to `TfIdfSimple`.
+    fuzzy : bool, optional
+        If `True`, misspelled request terms are corrected first (see
+        `correct_request()`).
+
+    Returns
+    -------
+    doc_ids : list of int
+        IDs of at most `k` matching documents, best first (see
+        `vector_scores()`).
     """
-    if wcs is None:
-        wcs = TfIdfSimple
+    if fuzzy:
+        request = correct_request(request, index)
+    return top_k(vector_scores(request, index, wcs=wcs), k)
 
-    scores: Dict[DocID, float] = {doc_id: 0 for doc_id in index.doc_ids}
-    # Weights of request terms
-    wq: List[float] = []
-    w = wcs(index=index, query=list(Collection().tokenize(request)))
 
-    for term_id, term in enumerate(w.query):
-        w_i_q = w.weights[term_id][request] = w.tf(term, request) * w.df(term)
-        wq.append(w_i_q)
+# Engines of the shards opened by the current (worker) process.
+_SHARD_ENGINES: Dict[tuple, VectorEngine] = {}
 
-        for doc_id in index.postings[term]:
-            w_i_dj = w(term, doc_id)
-            w.weights[term_id][doc_id] = w_i_dj
-            scores[doc_id] += w_i_dj * w_i_q
 
-    norm_q = sum(w_i_q ** 2 for w_i_q in wq)
+def _shard_top_k(
+    index: Index, request: str, k: int, wcs: Type[WeightingScheme], engine: str
+) -> List[Tuple[DocID, float]]:
+    # Best documents of a shard, with their scores.
+    if engine == "numpy":
+        key = (index.file.file.path, wcs)
+        if key not in _SHARD_ENGINES:
+            _SHARD_ENGINES[key] = VectorEngine(index, wcs=wcs)
+        scores = _SHARD_ENGINES[key].score(request)
+        best = engine_top_k(scores, k)
+    else:
+        scores = vector_scores(request, index, wcs=wcs)
+        best = top_k(scores, k)
+    return [(doc_id, float(scores[doc_id])) for doc_id in best]
 
-    for doc_id in index.doc_ids:
-        if scores[doc_id]:
-            scores[doc_id] /= sqrt(w.norm(doc_id)) * sqrt(norm_q) or 1
 
-    top_k: list = nlargest(k, scores.items(), key=lambda item: item[1])
-    return [doc_id for doc_id, _ in top_k]
+def search_shards(
+    request: str,
+    index: ShardedIndex,
+    k: int = 10,
+    wcs: Type[WeightingScheme] = None,
+    engine: str = "python",
+    fuzzy: bool = False,
+) -> List[DocID]:
+    """Perform a vector-space search against the shards of an index.
+
+    Shards are searched in parallel, using the document frequencies of the
+    whole collection, and their `k` best documents are merged: results are
+    the same as with an unsharded index.
+
+    Parameters
+    ----------
+    request : str
+    index : ShardedIndex
+    k : int, optional
+    wcs : class, optional
+    engine : str, optional
+        Either `"python"` (see `vector_scores()`) or `"numpy"` (see
+        `VectorEngine`).
+    fuzzy : bool, optional
+        If `True`, misspelled request terms are corrected first, using the
+        terms of all shards (see `correct_request()`).
+    """
+    if wcs is None:
+        wcs = TfIdfSimple
+    if fuzzy:
+        request = correct_request(request, index)
+    results = index.map(_shard_top_k, request, k, wcs, engine)
+    # Shards have distinct doc IDs.
+    return top_k(dict(chain.from_iterable(results)), k)
@@ -1,8 +1,16 @@
 import os
-from typing import Set
+from typing import Dict, FrozenSet, Tuple
 
+# Stop words already read, by path, modification time and size of the file.
+_STOP_WORDS: Dict[Tuple[str, int, int], FrozenSet[str]] = {}
 
-def load_stop_words() -> Set[str]:
-    with open(os.getenv("DATA_STOP_WORDS_PATH"), "r") as f:
-        # Use a set for constant-time lookup
-        return {l.strip() for l in f}
+
+def load_stop_words() -> FrozenSet[str]:
+    path = os.getenv("DATA_STOP_WORDS_PATH")
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _STOP_WORDS:
+        with open(path, "r") as f:
+            # Use a set for constant-time lookup
+            _STOP_WORDS[key] = frozenset(l.strip() for l in f)
+    return _STOP_WORDS[key]
@@ -0,0 +1,323 @@
+"""Query server, which keeps indexes resident in memory.
+
+Requests are served over HTTP, on a TCP or a Unix socket, by an asyncio
+event loop. Searching is CPU-bound, so it is done off the event loop: by a
+pool of worker processes, each of which opens the indexes once (they are
+memory-mapped, so this is cheap, and their pages are shared), or for
+sharded indexes by the process pool of the shards (see `indexes.shards`).
+
+Endpoints (`GET` requests, with parameters in the query string):
+
+- `/boolean?collection=CACM&query=Q('a') & ~Q('b')&limit=10&offset=0`
+- `/vector?collection=CACM&query=a b&k=10&wcs=simple&engine=python&fuzzy=1`
+- `/stats`: number of requests and latency of each endpoint, and result
+cache statistics.
+
+Responses are JSON objects, e.g. `{"results": [1, 5], "latency": 0.0012}`,
+where `latency` is the time spent by the server on the request, in seconds.
+Results are cached in the same way as by the command line (see
+`models.cache`).
+"""
+import asyncio
+import json
+import os
+import signal
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from typing import Callable, Dict, List, Tuple, Type
+from urllib.parse import parse_qsl, urlsplit
+
+import click
+
+from data_collections import Collection
+from datatypes import DocID
+from indexes import Index, build_index
+from indexes.shards import ShardedIndex
+from models.boolean import Q
+from models.boolean.search import Query
+from models.boolean import search_shards as boolean_search_shards
+from models.boolean.cli_utils import BooleanQueryType
+from models.cache import ResultCache
+from models.vector import (
+    VectorEngine,
+    correct_request,
+    request_key,
+    search_shards,
+    vector_search,
+)
+from models.vector.schemes import NORMS, SCHEMES, TfIdfSimple, WeightingScheme
+
+from .client import DEFAULT_HOST, DEFAULT_PORT
+
+ENGINES = ["python", "numpy"]
+
+# Indexes and vector engines of the current worker process, by collection
+# name.
+_INDEXES: Dict[str, Index] = {}
+_ENGINES: Dict[Tuple[str, Type[WeightingScheme]], VectorEngine] = {}
+
+
+def _open_indexes(collections: List[Collection]):
+    for collection in collections:
+        _INDEXES[collection.name] = Index.from_cache(collection)
+
+
+def _boolean(name: str, query: Q) -> List[DocID]:
+    return query(_INDEXES[name])
+
+
+def _vector(
+    name: str,
+    request: str,
+    k: int,
+    wcs: Type[WeightingScheme],
+    engine: str,
+    fuzzy: bool,
+) -> List[DocID]:
+    index = _INDEXES[name]
+    if fuzzy:
+        request = correct_request(request, index)
+    if engine == "numpy":
+        key = (name, wcs)
+        if key not in _ENGINES:
+            _ENGINES[key] = VectorEngine(index, wcs=wcs)
+        return _ENGINES[key].search(request, k=k)
+    return vector_search(request, index, k=k, wcs=wcs)
+
+
+class RequestError(Exception):
+    """Invalid request, answered with an error status."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _int(params: Dict[str, str], name: str, default: int = None) -> int:
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RequestError(f"{name} must be an integer")
+
+
+class Server:
+    """Serve requests against the indexes of some collections.
+
+    Indexes are loaded (or built) once, when the server is created.
+
+    Parameters
+    ----------
+    collections : list of Collection
+    workers : int, optional
+        Number of processes used to search indexes which are not sharded.
+        Defaults to the number of CPUs.
+    """
+
+    def __init__(self, collections: List[Collection], workers: int = None):
+        self.indexes: Dict[str, object] = {}
+        self.caches: Dict[str, ResultCache] = {}
+        for collection in collections:
+            index = ShardedIndex.from_cache(collection) or build_index(
+                collection, statistics=NORMS
+            )
+            self.indexes[collection.name] = index
+            self.caches[collection.name] = ResultCache.open(index)
+
+        resident = [
+            collection
+            for collection in collections
+            if not isinstance(self.indexes[collection.name], ShardedIndex)
+        ]
+        self.workers = ProcessPoolExecutor(
+            max_workers=workers, initializer=_open_indexes, initargs=(resident,)
+        )
+        # Sharded indexes are searched by their own process pool: threads
+        # only wait for it.
+        self.threads = ThreadPoolExecutor()
+        self._parse_boolean = BooleanQueryType().convert
+        # Number of requests, total and maximum latency of each endpoint.
+        self.latencies: Dict[str, List[float]] = {}
+
+    def _index(self, params: Dict[str, str]) -> Tuple[str, object]:
+        name = params.get("collection", "").lower()
+        if name not in self.indexes:
+            raise RequestError(f"Unknown collection: {name!r}", status=404)
+        return name, self.indexes[name]
+
+    async def _search(
+        self, name: str, key: str, local: Callable, sharded: Callable
+    ) -> List[DocID]:
+        # Return cached results, or compute them off the event loop.
+        cache = self.caches[name]
+        results = cache.get(key)
+        if results is None:
+            loop = asyncio.get_running_loop()
+            if isinstance(self.indexes[name], ShardedIndex):
+                results = await loop.run_in_executor(self.threads, sharded)
+            else:
+                results = await loop.run_in_executor(self.workers, local)
+            results = cache.put(key, results)
+        return results
+
+    async def boolean(self, params: Dict[str, str]) -> dict:
+        name, index = self._index(params)
+        try:
+            query = self._parse_boolean(params.get("query", ""), None, None)
+        except click.BadParameter as exc:
+            raise RequestError(f"Invalid query: {exc.message}")
+        # E.g. `1`, which is a valid expression.
+        if not isinstance(query, Query):
+            raise RequestError("Invalid query: not a boolean request")
+        limit = _int(params, "limit")
+        offset = _int(params, "offset", 0)
+
+        results = await self._search(
+            name,
+            f"boolean:{query.canonical()}",
+            partial(_boolean, name, query),
+            partial(boolean_search_shards, query, index),
+        )
+        stop = None if limit is None else offset + limit
+        return {"results": results[offset:stop], "count": len(results)}
+
+    async def vector(self, params: Dict[str, str]) -> dict:
+        name, index = self._index(params)
+        request = params.get("query", "")
+        k = _int(params, "k", 10)
+        try:
+            wcs = SCHEMES[params.get("wcs", TfIdfSimple.name)]
+        except KeyError:
+            raise RequestError(f"Unknown weighting scheme: {params['wcs']}")
+        engine = params.get("engine", "python")
+        if engine not in ENGINES:
+            raise RequestError(f"Unknown engine: {engine}")
+        fuzzy = bool(_int(params, "fuzzy", 0))
+
+        results = await self._search(
+            name,
+            request_key(request, wcs, k, fuzzy),
+            partial(_vector, name, request, k, wcs, engine, fuzzy),
+            partial(search_shards, request, index, k, wcs, engine, fuzzy),
+        )
+        return {"results": results}
+
+    async def stats(self, params: Dict[str, str]) -> dict:
+        endpoints = {
+            path: {"requests": count, "mean": total / count, "max": longest}
+            for path, (count, total, longest) in self.latencies.items()
+        }
+        caches = {name: cache.stats for name, cache in self.caches.items()}
+        return {"endpoints": endpoints, "caches": caches}
+
+    def _record(self, path: str, latency: float):
+        count, total, longest = self.latencies.get(path, (0, 0.0, 0.0))
+        self.latencies[path] = [count + 1, total + latency, max(longest, latency)]
+
+    async def _dispatch(self, method: str, target: str) -> Tuple[int, dict]:
+        url = urlsplit(target)
+        handlers = {
+            "/boolean": self.boolean,
+            "/vector": self.vector,
+            "/stats": self.stats,
+        }
+        if url.path not in handlers:
+            return 404, {"error": f"Not found: {url.path}"}
+        if method != "GET":
+            return 405, {"error": f"Method not allowed: {method}"}
+        try:
+            return 200, await handlers[url.path](dict(parse_qsl(url.query)))
+        except RequestError as exc:
+            return exc.status, {"error": str(exc)}
+        except ValueError as exc:
+            # E.g. a phrase query against a non-positional index.
+            return 400, {"error": str(exc)}
+        except Exception as exc:
+            # Answer anyway, rather than dropping the connection.
+            traceback.print_exc()
+            return 500, {"error": f"Internal error: {exc!r}"}
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        # Connections are kept alive until the client closes them.
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    header, _, value = line.decode("latin-1").partition(":")
+                    headers[header.strip().lower()] = value.strip()
+
+                start = time.perf_counter()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    method, target, version = "", "", "HTTP/1.0"
+                    status, data = 400, {"error": "Malformed request"}
+                else:
+                    status, data = await self._dispatch(method, target)
+                latency = time.perf_counter() - start
+                path = urlsplit(target).path
+                if status == 200:
+                    self._record(path, latency)
+                data["latency"] = latency
+
+                body = json.dumps(data).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "\r\n".encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+                print(f"{method} {path} {status} {latency * 1000:.2f}ms")
+
+                if version == "HTTP/1.0" or headers.get("connection") == "close":
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(
+        self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix: str = None
+    ):
+        """Serve requests on a TCP socket, or on a Unix socket if `unix` is
+        given, until cancelled (e.g. on `SIGTERM`)."""
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, asyncio.current_task().cancel
+        )
+        if unix is not None:
+            server = await asyncio.start_unix_server(self._handle, path=unix)
+            print(f"Serving on {unix}")
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+            print(f"Serving on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if unix is not None:
+                os.remove(unix)
+
+    def close(self):
+        """Persist result caches, and stop worker processes."""
+        for cache in self.caches.values():
+            cache.save()
+        self.workers.shutdown()
+        self.threads.shutdown()
+        for index in self.indexes.values():
+            if isinstance(index, ShardedIndex):
+                index.close()
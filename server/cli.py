@@ -0,0 +1,47 @@
+import asyncio
+from typing import Optional
+
+import click
+from dotenv import load_dotenv
+
+from cli_utils import CollectionType
+
+from .app import Server
+from .client import DEFAULT_HOST, DEFAULT_PORT
+
+load_dotenv()
+
+
+@click.command()
+@click.argument("collections", nargs=-1, required=True, type=CollectionType())
+@click.option("--host", default=DEFAULT_HOST, show_default=True)
+@click.option("--port", "-p", default=DEFAULT_PORT, type=int, show_default=True)
+@click.option(
+    "--unix",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Listen on a Unix socket instead of a TCP port.",
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of search processes.  [default: number of CPUs]",
+)
+def cli(
+    collections: tuple, host: str, port: int, unix: Optional[str], workers: int
+):
+    """Serve boolean and vector requests against COLLECTIONS.
+
+    Indexes are loaded once, and requests are served concurrently over HTTP.
+    Use the `--server` option of `models.boolean` and `models.vector` to
+    send requests to the server.
+    """
+    server = Server(list(collections), workers=workers)
+    try:
+        asyncio.run(server.serve(host=host, port=port, unix=unix))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,104 @@
+"""Client of the query server (see `app`).
+
+It only depends on the standard library, so that it is cheap to import.
+"""
+import http.client
+import json
+import socket
+from typing import Optional
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_ADDRESS = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+
+class ServerError(Exception):
+    """The server answered a request with an error."""
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    # HTTP connection over a Unix socket.
+
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class Client:
+    """Send requests to a query server.
+
+    The connection is kept alive between requests.
+
+    Parameters
+    ----------
+    address : str
+        Either an HTTP URL, e.g. `http://127.0.0.1:8765`, or the path of a
+        Unix socket prefixed with `unix:`, e.g. `unix:/tmp/cs-ir.sock`.
+    """
+
+    def __init__(self, address: str = DEFAULT_ADDRESS):
+        if address.startswith("unix:"):
+            self._connection = _UnixConnection(address[len("unix:") :])
+        else:
+            url = urlsplit(address)
+            self._connection = http.client.HTTPConnection(
+                url.hostname or DEFAULT_HOST, url.port or DEFAULT_PORT
+            )
+
+    def get(self, path: str, **params) -> dict:
+        """Send a request, and return the decoded response.
+
+        Parameters whose value is `None` are not sent.
+        """
+        query = urlencode({k: v for k, v in params.items() if v is not None})
+        self._connection.request("GET", f"{path}?{query}")
+        response = self._connection.getresponse()
+        data = json.loads(response.read())
+        if response.status != 200:
+            raise ServerError(data.get("error", response.reason))
+        return data
+
+    def boolean(
+        self, collection: str, query: str, limit: Optional[int] = None, offset: int = 0
+    ) -> dict:
+        """Run a boolean request, e.g. `"Q('a') & ~Q('b')"`."""
+        return self.get(
+            "/boolean", collection=collection, query=query, limit=limit, offset=offset
+        )
+
+    def vector(
+        self,
+        collection: str,
+        query: str,
+        k: int = 10,
+        wcs: str = None,
+        engine: str = None,
+        fuzzy: bool = False,
+    ) -> dict:
+        """Run a vector request."""
+        return self.get(
+            "/vector",
+            collection=collection,
+            query=query,
+            k=k,
+            wcs=wcs,
+            engine=engine,
+            fuzzy=1 if fuzzy else None,
+        )
+
+    def stats(self) -> dict:
+        return self.get("/stats")
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
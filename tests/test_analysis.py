@@ -0,0 +1,70 @@
+import pickle
+
+import pytest
+
+from analysis import Analyzer, get_analyzer, s_stemmer
+from resources import load_stop_words
+
+
+@pytest.fixture(name="stop_words_path", autouse=True)
+def fixture_stop_words(tmp_path, monkeypatch):
+    path = tmp_path / "stop_words.txt"
+    path.write_text("the\nof\n")
+    monkeypatch.setenv("DATA_STOP_WORDS_PATH", str(path))
+    return path
+
+
+def test_analyze():
+    analyzer = Analyzer()
+    assert analyzer.analyze("The Art of Computer-Programming, 2nd ed.") == [
+        "the",
+        "art",
+        "of",
+        "computer",
+        "programming",
+        "2nd",
+        "ed",
+    ]
+    assert analyzer.analyze("  --  ") == []
+
+
+def test_stop_words_and_stemming():
+    analyzer = Analyzer(stop_words={"the", "of"}, stemmer="s")
+    assert analyzer.analyze("The queries of documents") == ["query", "document"]
+
+
+@pytest.mark.parametrize(
+    "token, stem",
+    [
+        ("queries", "query"),
+        ("status", "status"),
+        ("indexes", "indexe"),
+        ("does", "doe"),
+        ("documents", "document"),
+        ("class", "class"),
+        ("corpus", "corpus"),
+        ("s", "s"),
+    ],
+)
+def test_s_stemmer(token, stem):
+    assert s_stemmer(token) == stem
+
+
+def test_analyze_many():
+    analyzer = Analyzer(stop_words={"the"}, stemmer="s")
+    texts = ["The graphs", "", "sorting the lists of lists"]
+    assert analyzer.analyze_many(texts) == [analyzer.analyze(t) for t in texts]
+
+
+def test_shared_analyzers(stop_words_path):
+    analyzer = get_analyzer(stop_words=True)
+    assert get_analyzer(stop_words=True) is analyzer
+    assert get_analyzer() is not analyzer
+    assert load_stop_words() is load_stop_words()
+    assert analyzer.analyze("the art of programming") == ["art", "programming"]
+    # Analyzers are shared across processes too.
+    assert pickle.loads(pickle.dumps(analyzer)) is analyzer
+
+    # Stop words are read again when the file changes.
+    stop_words_path.write_text("art\n")
+    assert get_analyzer(stop_words=True).analyze("the art") == ["the"]
@@ -1,7 +1,20 @@
+import random
+
 import pytest
 
 from indexes import Index
-from models.boolean import Q
+from models.boolean import NEAR, P, Q
+from indexes.disk import skip_pointers
+from indexes.kgrams import edit_distance
+from models.boolean.cursors import END, ListCursor
+from models.boolean.merge import (
+    difference,
+    gallop_intersect,
+    intersect,
+    skip_intersect,
+    union_many,
+)
+from models.boolean.planner import Complement, Difference, Intersect
 
 
 @pytest.fixture(name="index")
@@ -35,3 +48,215 @@ def test_complex_queries(index):
     assert (Q("a") & ~Q("b"))(index) == [1, 3]
     assert ((Q("a") | Q("b")) & ~Q("a"))(index) == [2]
     assert (Q("b") | (Q("b") & Q("a")))(index) == [0, 2]
+
+
+def test_merge_joins():
+    assert intersect([0, 2, 4, 6], [1, 2, 3, 6, 7]) == [2, 6]
+    assert difference([0, 2, 4, 6], [1, 2, 3, 6, 7]) == [0, 4]
+    assert union_many([[0, 4], [1, 4, 5], [4, 9]]) == [0, 1, 4, 5, 9]
+    assert union_many([[0, 2, 4, 6], [1, 2, 3, 6, 7]]) == [0, 1, 2, 3, 4, 6, 7]
+
+
+@pytest.mark.parametrize("ratio", [1, 10, 1000])
+def test_intersect_algorithms(ratio):
+    rng = random.Random(ratio)
+    large = sorted(rng.sample(range(100000), 5000))
+    small = sorted(rng.sample(large, 5) + rng.sample(range(100000), 5000 // ratio))
+    small = sorted(set(small))
+    expected = sorted(set(small) & set(large))
+    skips = skip_pointers(large, 16)
+
+    assert gallop_intersect(small, large) == expected
+    assert skip_intersect(small, large, skips, 16) == expected
+    assert intersect(small, large, skips, 16) == expected
+    assert intersect(large, small) == expected
+
+
+def test_intersect_with_skips(tmp_path):
+    index = Index(
+        postings={"a": list(range(0, 3000, 3)), "b": [3, 4, 2997]},
+        doc_ids=set(range(3000)),
+        terms={"a", "b"},
+        df={"a": 1000, "b": 3},
+    )
+    path = str(tmp_path / "index.idx")
+    index.save(path)
+    index = Index.open(path)
+
+    assert len(index.skips["a"]) == 8
+    assert list(index.skips["b"]) == []
+    assert (Q("a") & Q("b"))(index) == [3, 2997]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        Q("a"),
+        Q("a") & Q("b"),
+        Q("a") | Q("b"),
+        ~Q("a"),
+        Q("a") & ~Q("b"),
+        (Q("a") | Q("b")) & ~Q("a"),
+        ~Q("a") | Q("b"),
+        ~Q("a") & ~Q("b"),
+    ],
+)
+def test_iter(index, query):
+    assert list(query.iter(index)) == query(index)
+
+
+def test_list_cursor():
+    postings = list(range(0, 1000, 2))
+    for skips in (None, skip_pointers(postings, 16)):
+        cursor = ListCursor(postings, skips, 16)
+        assert cursor.next() == 0
+        assert cursor.advance_to(501) == 502
+        assert cursor.advance_to(400) == 502
+        assert cursor.next() == 504
+        assert cursor.advance_to(998) == 998
+        assert cursor.next() == END
+        assert cursor.advance_to(2000) == END
+
+
+def test_plan(index):
+    # Intersections are flattened and ordered by document frequency.
+    plan = (Q("a") & (Q("b") & Q("a"))).plan(index)
+    assert isinstance(plan, Intersect)
+    assert [child.query.term for child in plan.children] == ["b", "a", "a"]
+
+    # Negations are evaluated as differences.
+    plan = (Q("a") & ~Q("b")).plan(index)
+    assert isinstance(plan, Difference)
+    assert not isinstance(plan.right, Complement)
+
+    assert "Scan Q('b') (size=2, cost=2)" in plan.explain()
+
+
+@pytest.fixture(name="words_index")
+def fixture_words_index():
+    postings = {
+        "compute": [1, 4],
+        "computer": [0, 2],
+        "graph": [2],
+        "graphics": [3, 4],
+        "paragraph": [1],
+        "tree": [0, 3],
+    }
+    return Index(
+        postings=postings,
+        doc_ids=set(range(5)),
+        terms=set(postings),
+        df={term: len(doc_ids) for term, doc_ids in postings.items()},
+    )
+
+
+@pytest.mark.parametrize(
+    "pattern, terms",
+    [
+        ("comput*", ["compute", "computer"]),
+        ("*graph*", ["graph", "graphics", "paragraph"]),
+        ("*aph", ["graph", "paragraph"]),
+        ("g*s", ["graphics"]),
+        ("c*r", ["computer"]),
+        ("p*a*h", ["paragraph"]),
+        ("*", ["compute", "computer", "graph", "graphics", "paragraph", "tree"]),
+        ("x*", []),
+    ],
+)
+def test_wildcard_expansion(words_index, tmp_path, pattern, terms):
+    assert words_index.kgrams.expand(pattern) == terms
+    path = str(tmp_path / "index.idx")
+    words_index.save(path)
+    index = Index.open(path)
+    assert index.kgrams.expand(pattern) == terms
+    # The k-gram index is persisted next to the index file.
+    index.kgrams.build()
+    assert Index.open(path).kgrams.expand(pattern) == terms
+    assert Index.open(path).kgrams.built
+
+
+def test_wildcard(words_index):
+    assert Q("comput*")(words_index) == [0, 1, 2, 4]
+    assert (Q("*graph*") & ~Q("comput*"))(words_index) == [3]
+    assert Q("x*")(words_index) == []
+    assert Q("*graph*").estimate(words_index) == 4
+    assert list(Q("comput*").iter(words_index)) == [0, 1, 2, 4]
+
+
+@pytest.mark.parametrize(
+    "a, b, distance",
+    [
+        ("graph", "graph", 0),
+        ("grap", "graph", 1),
+        ("grahp", "graph", 2),
+        ("kitten", "sitting", 3),
+        ("", "abc", 3),
+        ("tree", "paragraph", 8),
+    ],
+)
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b, 10) == edit_distance(b, a, 10) == distance
+    assert edit_distance(a, b, 1) == min(distance, 2)
+
+
+def test_fuzzy(words_index):
+    assert words_index.kgrams.similar("grapj", 2) == {"graph": 1}
+    assert Q("computr", fuzzy=1)(words_index) == [0, 1, 2, 4]
+    assert Q("tree", fuzzy=1)(words_index) == [0, 3]
+    assert Q("graphic", fuzzy=1)(words_index) == [3, 4]
+    assert Q("xyz", fuzzy=2)(words_index) == []
+    assert repr(Q("graph", fuzzy=2)) == "Q('graph', fuzzy=2)"
+    with pytest.raises(ValueError):
+        Q("graph*", fuzzy=1)
+
+
+def test_kgram_caches(words_index):
+    kgrams = words_index.kgrams
+    # Results are cached, but callers may modify them.
+    kgrams.similar("grapj", 2).clear()
+    assert kgrams.similar("grapj", 2) == {"graph": 1}
+    kgrams.expand("g*").append("tree")
+    assert kgrams.expand("g*") == ["graph", "graphics"]
+    # Expansions and similar terms are cached separately.
+    assert kgrams.similar("grapj", 2) == {"graph": 1}
+
+
+@pytest.fixture(name="positional_index")
+def fixture_positional_index():
+    positions = {
+        "operating": [(0, [0, 5]), (1, [3]), (2, [0])],
+        "system": [(0, [1]), (1, [0]), (2, [4])],
+        "unix": [(0, [2])],
+    }
+    return Index(
+        postings={
+            term: [doc_id for doc_id, p in pairs for _ in p]
+            for term, pairs in positions.items()
+        },
+        doc_ids={0, 1, 2},
+        terms=set(positions),
+        df={term: len(pairs) for term, pairs in positions.items()},
+        positions=positions,
+    )
+
+
+def test_phrase(positional_index):
+    assert P("operating system")(positional_index) == [0]
+    assert P("operating system unix")(positional_index) == [0]
+    assert P("system operating")(positional_index) == []
+
+
+def test_near(positional_index):
+    assert NEAR("operating", "system", 1)(positional_index) == [0]
+    assert NEAR("operating", "system", 3)(positional_index) == [0, 1]
+    assert NEAR("system", "operating", 4)(positional_index) == [0, 1, 2]
+
+
+def test_positional_operators_combine(positional_index):
+    assert (P("operating system") | Q("system"))(positional_index) == [0, 1, 2]
+    assert (NEAR("operating", "system", 4) & ~Q("unix"))(positional_index) == [1, 2]
+
+
+def test_positional_query_requires_positions(index):
+    with pytest.raises(ValueError):
+        P("a b")(index)
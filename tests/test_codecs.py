@@ -0,0 +1,40 @@
+import pytest
+
+from indexes.codecs import CODECS, gaps
+
+
+@pytest.fixture(name="codec", params=list(CODECS))
+def fixture_codec(request):
+    return CODECS[request.param]
+
+
+@pytest.mark.parametrize(
+    "values", [[], [0], [1, 2, 3], [127, 128, 129, 16383, 16384], [2 ** 31, 0]]
+)
+def test_roundtrip(codec, values):
+    assert list(codec.decode(memoryview(codec.encode(values)))) == values
+
+
+def test_postings_roundtrip(codec):
+    postings = [0, 1, 1, 5, 1000, 1001, 70000]
+    data = memoryview(codec.encode_postings(postings))
+    assert list(codec.decode_postings(data)) == postings
+
+
+def test_vbyte_decode_one():
+    vbyte = CODECS["vbyte"]
+    data = vbyte.encode([5, 300, 0])
+    assert vbyte.decode_one(data, 0) == (5, 1)
+    assert vbyte.decode_one(data, 1) == (300, 3)
+    assert vbyte.decode_one(data, 3) == (0, 4)
+
+
+def test_gaps():
+    assert gaps([3, 5, 5, 10]) == [3, 2, 0, 5]
+
+
+def test_compression():
+    postings = list(range(0, 10000, 3))
+    raw = len(CODECS["raw"].encode_postings(postings))
+    for name in ("vbyte", "gamma", "delta"):
+        assert len(CODECS[name].encode_postings(postings)) < raw / 3
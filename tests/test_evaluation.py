@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import data_collections
+from data_collections import CACM
+from evaluation.measures import (
+    average_precision,
+    interpolated_precision,
+    ndcg_at,
+    precision_at,
+    r_precision,
+    recall_at,
+    relevance,
+)
+from evaluation.runs import cached_run, read_run, run_path, run_queries, write_run
+from indexes import Index
+
+
+@pytest.fixture(name="collection")
+def fixture_collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_collections, "CACHE", str(tmp_path))
+    stop_words = tmp_path / "stop_words.txt"
+    stop_words.write_text("the\n")
+    monkeypatch.setenv("DATA_STOP_WORDS_PATH", str(stop_words))
+    texts = ["graph tree", "tree sort", "graph", "sort sort", "tree"]
+    lines = []
+    for doc_id, text in enumerate(texts, 1):
+        lines += [f".I {doc_id}", ".T", text, ".X", "1 5 1"]
+    path = tmp_path / "cacm.all"
+    path.write_text("\n".join(lines) + "\n")
+    monkeypatch.setenv("DATA_CACM_PATH", str(path))
+    collection = CACM()
+    Index.build(collection)
+    return collection
+
+
+def test_measures():
+    rankings = {1: [3, 1, 4, 2], 2: [5], 3: []}
+    answers = {1: {1, 2}, 2: {5, 6, 7}, 3: {1}}
+    relevant, num_relevant, num_retrieved = relevance(rankings, answers, depth=4)
+    assert relevant.tolist() == [
+        [False, True, False, True],
+        [True, False, False, False],
+        [False, False, False, False],
+    ]
+    assert num_relevant.tolist() == [2, 3, 1]
+    assert num_retrieved.tolist() == [4, 1, 0]
+
+    assert precision_at(relevant, num_retrieved, 2).tolist() == [0.5, 1, 0]
+    assert recall_at(relevant, num_relevant, 2).tolist() == [0.5, 1 / 3, 0]
+    assert r_precision(relevant, num_relevant).tolist() == [0.5, 1 / 3, 0]
+    assert np.allclose(
+        average_precision(relevant, num_relevant), [(1 / 2 + 2 / 4) / 2, 1 / 3, 0]
+    )
+    ideal = 1 + 1 / np.log2(3)
+    assert np.allclose(
+        ndcg_at(relevant, num_relevant, 4),
+        [(1 / np.log2(3) + 1 / np.log2(5)) / ideal, 1 / (ideal + 1 / np.log2(4)), 0],
+    )
+    precisions = interpolated_precision(relevant, num_relevant, nb_levels=3)
+    assert np.allclose(precisions, [[0.5, 0.5, 0.5], [1, 0, 0], [0, 0, 0]])
+
+
+def test_run_file(tmp_path):
+    run = {2: [(4, 0.5), (1, 0.25)], 1: [(3, 1.0)]}
+    path = str(tmp_path / "test.run")
+    write_run(path, run)
+    assert (tmp_path / "test.run").read_text().splitlines()[0] == (
+        "1 Q0 3 1 1.0 cs-ir"
+    )
+    assert read_run(path) == run
+
+
+def test_run_queries(collection):
+    queries = {1: "graph", 2: "tree sort", 3: "sort"}
+    run = run_queries(collection, queries, depth=2)
+    assert [[doc_id for doc_id, _ in run[i]] for i in sorted(run)] == [
+        [1, 3],
+        [2, 4],
+        [4, 2],
+    ]
+    assert run_queries(collection, queries, depth=2, workers=2) == run
+
+
+def test_cached_run(collection, capsys):
+    queries = {1: "graph", 2: "tree sort"}
+    run = cached_run(collection, queries, depth=3)
+    assert "Running" in capsys.readouterr().out
+
+    # A shallower run is cut from the cached one.
+    assert cached_run(collection, queries, depth=1) == {
+        query_id: ranking[:1] for query_id, ranking in run.items()
+    }
+    assert "Using run" in capsys.readouterr().out
+    assert read_run(run_path(collection, "simple")) == run
+
+    # The run is cached for a single set of queries.
+    cached_run(collection, {1: "graph"}, depth=1)
+    assert "Running" in capsys.readouterr().out
@@ -0,0 +1,116 @@
+import pytest
+
+from indexes import Index
+from indexes.codecs import CODECS
+from indexes.lexicon import Lexicon, LexiconWriter
+from indexes.storage import StorageError
+
+
+@pytest.fixture(name="index")
+def fixture_index():
+    return Index(
+        postings={"a": [0, 1, 3], "b": [0, 2], "été": [1]},
+        doc_ids={0, 1, 2, 3},
+        terms={"a", "b", "été"},
+        df={"a": 3, "b": 2, "été": 1},
+    )
+
+
+@pytest.mark.parametrize("codec", list(CODECS))
+def test_save_and_open(index, tmp_path, codec):
+    path = str(tmp_path / "index.idx")
+    index.save(path, codec=codec)
+
+    loaded = Index.open(path)
+    assert list(loaded.postings["a"]) == [0, 1, 3]
+    assert list(loaded.postings["été"]) == [1]
+    assert list(loaded.postings["unknown"]) == []
+    assert loaded.df["b"] == 2
+    assert loaded.df["unknown"] == 0
+    assert list(loaded.doc_ids) == [0, 1, 2, 3]
+    assert list(loaded.terms) == ["a", "b", "été"]
+    assert "b" in loaded.terms and "c" not in loaded.terms
+
+
+def test_json_export(index, tmp_path):
+    path = str(tmp_path / "index.json")
+    index.save(str(tmp_path / "index.idx"))
+    Index.open(str(tmp_path / "index.idx")).to_json(path)
+
+    loaded = Index.from_json(path)
+    assert loaded.postings["a"] == [0, 1, 3]
+    assert loaded.postings["unknown"] == []
+    assert loaded.doc_ids == {0, 1, 2, 3}
+
+
+def test_truncated_file(index, tmp_path):
+    path = tmp_path / "index.idx"
+    index.save(str(path))
+    path.write_bytes(path.read_bytes()[:-4])
+
+    with pytest.raises(StorageError):
+        Index.open(str(path))
+
+
+def test_positions(tmp_path):
+    positions = {"a": [(0, [1, 4]), (3, [0])], "b": [(2, [300])]}
+    index = Index(
+        postings={"a": [0, 0, 3], "b": [2]},
+        doc_ids={0, 2, 3},
+        terms={"a", "b"},
+        df={"a": 3, "b": 1},
+        positions=positions,
+    )
+    path = str(tmp_path / "index.idx")
+    index.save(path, codec="vbyte")
+
+    loaded = Index.open(path)
+    assert loaded.has_positions
+    assert loaded.positions["a"] == positions["a"]
+    assert loaded.positions["b"] == positions["b"]
+    assert loaded.positions["unknown"] == []
+
+
+def test_frequencies(tmp_path):
+    # Posting lists with repeated doc IDs are collapsed into frequencies.
+    index = Index(
+        postings={"a": [0, 0, 0, 2], "b": [1]},
+        doc_ids={0, 1, 2},
+        terms={"a", "b"},
+        df={"a": 2, "b": 1},
+    )
+    assert index.postings["a"] == [0, 2]
+    assert index.frequencies["a"] == [3, 1]
+
+    path = str(tmp_path / "index.idx")
+    index.save(path, codec="gamma")
+
+    loaded = Index.open(path)
+    assert list(loaded.postings["a"]) == [0, 2]
+    assert list(loaded.frequencies["a"]) == [3, 1]
+    assert loaded.df["a"] == 2
+    assert loaded.tf("a", 0) == 3
+    assert loaded.tf("a", 1) == 0
+    assert loaded.tf("unknown", 0) == 0
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 16])
+def test_front_coded_lexicon(block_size):
+    terms = sorted(
+        {"a", "ab", "abc", "abd", "b", "ba", "été", "x" * 300, "zz", "zzz"}
+    )
+    writer = LexiconWriter(block_size)
+    for term in terms:
+        writer.add(term.encode())
+    lexicon = Lexicon(memoryview(writer.data), writer.finish(), len(terms), block_size)
+    # Lengths are encoded with the posting lists' variable-byte code.
+    head = terms[0].encode()
+    assert writer.data[: len(head) + 1] == CODECS["vbyte"].encode([len(head)]) + head
+
+    assert len(lexicon) == len(terms)
+    assert list(lexicon) == terms
+    assert [lexicon.term(term_id) for term_id in range(len(terms))] == terms
+    assert [lexicon.lookup(term) for term in terms] == list(range(len(terms)))
+    for missing in ["", "0", "aa", "abe", "c", "zzzz"]:
+        assert lexicon.lookup(missing) is None
+        assert missing not in lexicon
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from data_collections import CACM
+from indexes.entry import TermDictionary
+from indexes.parallel import sort_parallel
+from utils import split_lines
+
+
+@pytest.fixture(name="collection")
+def fixture_collection(tmp_path, monkeypatch):
+    rng = random.Random(0)
+    lines = []
+    for doc_id in range(1, 51):
+        words = " ".join(rng.choice("abcdefgh") for _ in range(rng.randint(1, 20)))
+        lines += [f".I {doc_id}", ".T", words, ".W", words, ".X", "1 5 1"]
+    path = tmp_path / "cacm.all"
+    path.write_text("\n".join(lines) + "\n")
+    stop_words = tmp_path / "stop_words.txt"
+    stop_words.write_text("a\n")
+    monkeypatch.setenv("DATA_CACM_PATH", str(path))
+    monkeypatch.setenv("DATA_STOP_WORDS_PATH", str(stop_words))
+    return CACM()
+
+
+def test_partitions(collection):
+    parts = collection.partitions(4)
+    assert len(parts) == 4
+
+    streams = [list(collection.partition_positions(part)) for part in parts]
+    assert sum(streams, []) == list(collection.positions())
+
+
+def test_split_lines(tmp_path):
+    # Groups of 3 lines of 2 bytes, i.e. 6 bytes.
+    path = tmp_path / "lines.txt"
+    path.write_text("".join(f"{i // 3}\n" for i in range(30)))
+    ranges = split_lines(str(path), 4, lambda line, previous: line != previous)
+
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0 and ranges[-1][1] == 60
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start and start % 6 == 0
+
+
+@pytest.mark.parametrize("positions", [False, True])
+def test_sort_parallel(collection, tmp_path, positions):
+    if positions:
+        expected = sorted(collection.positions())
+    else:
+        expected = sorted(collection)
+
+    terms = TermDictionary()
+    result = sort_parallel(
+        collection,
+        terms,
+        workers=3,
+        block_size=10,
+        positions=positions,
+        temp_dir=str(tmp_path / "sort"),
+    )
+
+    assert [(terms[term_id], *rest) for term_id, *rest in result] == expected
+    assert not (tmp_path / "sort").exists()
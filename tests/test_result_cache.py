@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from indexes import Index
+from models.boolean import NEAR, Q
+from models.cache import ResultCache
+
+
+@pytest.fixture(name="index")
+def fixture_index():
+    return Index(
+        postings={"a": [0, 1, 3], "b": [0, 2]},
+        doc_ids={0, 1, 2, 3},
+        terms={"a", "b"},
+        df={"a": 3, "b": 2},
+    )
+
+
+def test_hits_and_misses(index):
+    cache = ResultCache(index)
+    assert cache.get("a") is None
+    assert cache.get_or_compute("a", lambda: [0, 1]) == [0, 1]
+    assert cache.get_or_compute("a", lambda: [2]) == [0, 1]
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 2
+
+
+def test_lru_eviction(index):
+    cache = ResultCache(index, max_bytes=10 ** 6)
+    cache.put("a", list(range(10)))
+    cache.max_bytes = cache.size * 2
+    cache.put("b", list(range(10)))
+    cache.get("a")
+    cache.put("c", list(range(10)))
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.size <= cache.max_bytes
+
+
+def test_persistence_and_invalidation(index, tmp_path):
+    index_path = str(tmp_path / "index.idx")
+    index.save(index_path)
+    index = Index.open(index_path)
+    path = str(tmp_path / "results.json")
+
+    cache = ResultCache(index, path=path)
+    cache.put("a", [0, 1, 3])
+    cache.save()
+    assert ResultCache(index, path=path).get("a") == [0, 1, 3]
+
+    # Re-building the index invalidates results.
+    os.utime(index_path, ns=(0, 0))
+    assert ResultCache(index, path=path).get("a") is None
+    assert cache.get("a") is None
+
+
+def test_no_persistence_without_fingerprint(index, tmp_path):
+    # E.g. a legacy JSON index, whose changes could not be detected.
+    path = str(tmp_path / "results.json")
+    cache = ResultCache(index, path=path)
+    cache.put("a", [0, 1, 3])
+    cache.save()
+    assert not os.path.exists(path)
+
+    with open(path, "w") as f:
+        f.write('{"index": null, "entries": [["a", [2]]]}')
+    assert ResultCache(index, path=path).get("a") is None
+
+
+def test_canonical_boolean_requests():
+    assert (Q("a") & Q("b")).canonical() == (Q("b") & (Q("a") & Q("b"))).canonical()
+    assert (Q("a") | ~~Q("a")).canonical() == Q("a").canonical()
+    assert NEAR("a", "b", 2).canonical() == NEAR("b", "a", 2).canonical()
+    assert (Q("a") & ~Q("b")).canonical() != (~Q("a") & Q("b")).canonical()
@@ -0,0 +1,139 @@
+import os
+import random
+
+import pytest
+
+import data_collections
+from data_collections import CACM
+from indexes import Index
+from indexes.bloom import BloomFilter
+from indexes.index import SegmentedIndex
+from indexes.segments import Segments
+from models.boolean import Q
+
+WORDS = ["graph", "tree", "sort", "matrix", "parallel", "compiler"]
+
+
+def write_documents(path, doc_ids, extra="", seed=0):
+    rng = random.Random(seed)
+    lines = []
+    for doc_id in doc_ids:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 10)))
+        lines += [f".I {doc_id}", ".T", f"{text} {extra}", ".X", "1 5 1"]
+    path.write_text("\n".join(lines) + "\n")
+
+
+@pytest.fixture(name="collection")
+def fixture_collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_collections, "CACHE", str(tmp_path))
+    stop_words = tmp_path / "stop_words.txt"
+    stop_words.write_text("the\n")
+    monkeypatch.setenv("DATA_STOP_WORDS_PATH", str(stop_words))
+    path = tmp_path / "cacm.all"
+    write_documents(path, range(1, 21))
+    monkeypatch.setenv("DATA_CACM_PATH", str(path))
+    collection = CACM()
+    Index.build(collection, positions=True)
+    return collection
+
+
+def test_bloom_filter():
+    terms = [f"term{i}" for i in range(1000)]
+    bloom = BloomFilter.from_terms(terms, capacity=len(terms))
+    assert all(term in bloom for term in terms)
+    false_positives = sum(f"other{i}" in bloom for i in range(1000))
+    assert false_positives < 50
+
+    loaded = BloomFilter(bloom.num_bits, bloom.num_hashes, bloom.to_bytes())
+    assert all(term in loaded for term in terms)
+
+
+def test_add_and_merge(collection, tmp_path):
+    segments = Segments(collection)
+    for i in range(3):
+        path = tmp_path / f"new{i}.all"
+        doc_ids = range(21 + 2 * i, 23 + 2 * i)
+        write_documents(path, doc_ids, f"new{i}", seed=i + 1)
+        segments.add([str(path)])
+
+    assert segments.merge() == 1
+    levels = [s["level"] for s in segments.read_manifest()["segments"]]
+    assert levels == [1, 0]
+
+    index = Index.from_cache(collection)
+    assert isinstance(index, SegmentedIndex)
+    assert index.num_documents == 26
+    assert list(index.doc_ids) == list(range(1, 27))
+    assert index.doc_ids[19:23] == [20, 21, 22, 23]
+    assert index.doc_ids[-1] == 26 and 22 in index.doc_ids
+    assert (~Q("new1"))(index) == [*range(1, 23), 25, 26]
+    assert list(index.postings["new1"]) == [23, 24]
+    assert index.df["new2"] == 2
+    assert "new0" in index.terms and "unknown" not in index.terms
+    # The segment of "new0" is skipped using its Bloom filter.
+    assert index.parts[2].file.bloom is not None
+    assert "new0" not in index.parts[2].file.bloom
+    assert index.kgrams.expand("new*") == ["new0", "new1", "new2"]
+    assert Q("new*")(index) == list(range(21, 27))
+
+    segmented = {
+        term: (list(index.postings[term]), list(index.frequencies[term]))
+        for term in index.terms
+    }
+    positions = {term: index.positions[term] for term in index.terms}
+    lengths = list(index.statistics["length"])
+
+    # Index the same documents from scratch, which drops segments.
+    full_path = tmp_path / "full.all"
+    full_path.write_text(
+        "".join(
+            path.read_text()
+            for path in [tmp_path / "cacm.all"]
+            + [tmp_path / f"new{i}.all" for i in range(3)]
+        )
+    )
+    collection.filename = str(full_path)
+    full = Index.build(collection, positions=True)
+
+    assert not isinstance(full, SegmentedIndex)
+    assert segmented == {
+        term: (list(full.postings[term]), list(full.frequencies[term]))
+        for term in full.terms
+    }
+    assert positions == {term: full.positions[term] for term in full.terms}
+    assert lengths == list(full.statistics["length"])
+
+
+def test_merge_in_background(collection, tmp_path):
+    segments = Segments(collection)
+    for i in range(2):
+        path = tmp_path / f"new{i}.all"
+        write_documents(path, [21 + i], f"new{i}", seed=i + 1)
+        segments.add([str(path)])
+
+    pid = segments.merge_in_background()
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert [s["level"] for s in segments.read_manifest()["segments"]] == [1]
+
+
+def test_open_while_merging(collection, tmp_path, monkeypatch):
+    segments = Segments(collection)
+    for i in range(3):
+        path = tmp_path / f"new{i}.all"
+        write_documents(path, [21 + i], f"new{i}", seed=i + 1)
+        segments.add([str(path)])
+    stale = segments.read_manifest()
+    assert segments.merge() == 1
+
+    # The manifest was read right before the merge removed its segments.
+    manifests = [stale]
+    read_manifest = Segments.read_manifest
+    monkeypatch.setattr(
+        Segments,
+        "read_manifest",
+        lambda self: manifests.pop() if manifests else read_manifest(self),
+    )
+    index = SegmentedIndex(Index.open(collection.index_cache), segments)
+    assert len(index.parts) == 3
+    assert list(index.doc_ids) == list(range(1, 24))
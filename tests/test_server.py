@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import data_collections
+from data_collections import CACM
+from indexes import Index
+from models.vector import vector_search
+from server import Client, ServerError
+from server.app import Server
+
+
+@pytest.fixture(name="collection")
+def fixture_collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_collections, "CACHE", str(tmp_path))
+    stop_words = tmp_path / "stop_words.txt"
+    stop_words.write_text("the\n")
+    monkeypatch.setenv("DATA_STOP_WORDS_PATH", str(stop_words))
+    lines = []
+    for doc_id, text in enumerate(["graph tree", "tree sort", "graph"], 1):
+        lines += [f".I {doc_id}", ".T", text, ".X", "1 5 1"]
+    path = tmp_path / "cacm.all"
+    path.write_text("\n".join(lines) + "\n")
+    monkeypatch.setenv("DATA_CACM_PATH", str(path))
+    collection = CACM()
+    Index.build(collection)
+    return collection
+
+
+def test_server(collection, tmp_path):
+    address = str(tmp_path / "server.sock")
+    server = Server([collection], workers=1)
+
+    def requests():
+        with Client(f"unix:{address}") as client:
+            boolean = client.boolean("CACM", "Q('tree') & ~Q('sort')")
+            vector = client.vector("cacm", "graph tree", k=2, engine="numpy")
+            fuzzy = client.vector("cacm", "grap tre", k=2, fuzzy=True)
+            with pytest.raises(ServerError):
+                client.boolean("CACM", "P('graph tree')")
+            with pytest.raises(ServerError):
+                client.vector("CS276", "graph")
+            for query in ["1", "Q('graph') & 3"]:
+                with pytest.raises(ServerError, match="Invalid query"):
+                    client.boolean("CACM", query)
+            # Errors raised while searching are answered on the same
+            # connection.
+            with pytest.raises(ServerError, match="Internal error"):
+                client.boolean("CACM", "Q(3)")
+            stats = client.stats()
+        return boolean, vector, fuzzy, stats
+
+    async def main():
+        serve = asyncio.create_task(server.serve(unix=address))
+        while not (tmp_path / "server.sock").exists():
+            await asyncio.sleep(0.01)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, requests)
+        finally:
+            serve.cancel()
+
+    try:
+        boolean, vector, fuzzy, stats = asyncio.run(main())
+    finally:
+        server.close()
+
+    assert boolean["results"] == [1]
+    index = Index.from_cache(collection)
+    assert vector["results"] == vector_search("graph tree", index, k=2)
+    assert vector["latency"] > 0
+    assert fuzzy["results"] == vector["results"]
+    assert stats["endpoints"]["/vector"]["requests"] == 2
+    assert stats["caches"]["cacm"]["misses"] == 5
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+import data_collections
+from data_collections import CACM
+from indexes import Index
+from indexes.shards import ShardedIndex, ShardIndex, Shards
+from models.boolean import Q, search_shards as boolean_search_shards
+from models.vector import VectorEngine, correct_request, search_shards, vector_search
+from models.vector.schemes import SCHEMES
+
+WORDS = ["graph", "tree", "sort", "matrix", "parallel", "compiler", "rare"]
+
+
+@pytest.fixture(name="collection")
+def fixture_collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_collections, "CACHE", str(tmp_path))
+    stop_words = tmp_path / "stop_words.txt"
+    stop_words.write_text("the\n")
+    monkeypatch.setenv("DATA_STOP_WORDS_PATH", str(stop_words))
+    rng = random.Random(0)
+    lines = []
+    for doc_id in range(1, 61):
+        # "rare" only occurs in the first documents, i.e. in the first shard.
+        words = WORDS if doc_id < 10 else WORDS[:-1]
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 10)))
+        lines += [f".I {doc_id}", ".T", text, ".X", "1 5 1"]
+    path = tmp_path / "cacm.all"
+    path.write_text("\n".join(lines) + "\n")
+    monkeypatch.setenv("DATA_CACM_PATH", str(path))
+    return CACM()
+
+
+@pytest.fixture(name="indexes")
+def fixture_indexes(collection):
+    index = Index.build(collection)
+    Shards(collection).build(3, workers=2)
+    with ShardedIndex.from_cache(collection) as sharded:
+        yield index, sharded
+
+
+def test_shards(collection, indexes):
+    index, sharded = indexes
+    assert len(sharded.paths) == 3
+    assert sharded.num_documents == index.num_documents == 60
+
+    shard = ShardIndex.open(sharded.paths[1], collection)
+    assert shard.num_documents == 60
+    assert "rare" not in shard.terms
+    # Document frequencies are those of the whole collection.
+    assert shard.df["rare"] == index.df["rare"] > 0
+    assert shard.df["graph"] == index.df["graph"] > len(shard.postings["graph"])
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        Q("graph") & Q("tree"),
+        Q("rare") | Q("sort"),
+        Q("matrix") & ~Q("parallel"),
+        ~Q("compiler"),
+        Q("ra*") | Q("*ee"),
+    ],
+)
+def test_boolean_search(indexes, query):
+    index, sharded = indexes
+    assert boolean_search_shards(query, sharded) == list(query(index))
+
+
+@pytest.mark.parametrize("request_", ["graph", "rare tree", "sort sort matrix"])
+@pytest.mark.parametrize("wcs", list(SCHEMES.values()))
+def test_vector_search(indexes, request_, wcs):
+    index, sharded = indexes
+    expected = vector_search(request_, index, k=5, wcs=wcs)
+    assert search_shards(request_, sharded, k=5, wcs=wcs) == expected
+
+    expected = VectorEngine(index, wcs=wcs).search(request_, k=5)
+    assert search_shards(request_, sharded, k=5, wcs=wcs, engine="numpy") == expected
+
+
+def test_fuzzy_search(indexes):
+    index, sharded = indexes
+    # "rare" is only in the first shard.
+    assert correct_request("rre grph", index) == "rare graph"
+    assert correct_request("rre grph", sharded) == "rare graph"
+    expected = vector_search("rre grph", index, fuzzy=True)
+    assert search_shards("rre grph", sharded, fuzzy=True) == expected
+    assert boolean_search_shards(Q("rar", fuzzy=1), sharded) == Q("rare")(index)
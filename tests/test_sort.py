@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from indexes.entry import TermDictionary
+from indexes.sort import BinarySorter, sort_term_ids
+
+
+def test_term_dictionary():
+    terms = TermDictionary(["b", "été", "a", "b"])
+    assert terms.terms == ["b", "été", "a"]
+
+    labels = terms.sort()
+    assert terms.terms == ["a", "b", "été"]
+    assert list(labels) == [1, 2, 0]
+    assert terms.add("b") == 1
+
+
+@pytest.mark.parametrize("batch_size", [2, 100])
+def test_binary_sorter(tmp_path, batch_size):
+    rng = random.Random(0)
+    entries = [
+        (rng.choice(["b", "été", "a", "c"]), rng.randint(1, 50), rng.randint(0, 9))
+        for _ in range(1000)
+    ]
+
+    terms = TermDictionary()
+    with BinarySorter(terms, block_size=10, temp_dir=str(tmp_path)) as sorter:
+        for entry in entries:
+            sorter.add(entry)
+        sorter.finish()
+        result = list(sorter.merge(batch_size=batch_size))
+
+    assert [(terms[term_id], *rest) for term_id, *rest in result] == sorted(entries)
+
+
+def test_sort_term_ids_empty(tmp_path):
+    terms = TermDictionary()
+    assert list(sort_term_ids([], terms, block_size=10, temp_dir=str(tmp_path))) == []
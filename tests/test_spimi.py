@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from indexes.sort import group_entries
+from indexes.spimi import SPIMIBuilder
+
+
+@pytest.fixture(name="entries")
+def fixture_entries():
+    rng = random.Random(0)
+    return [
+        (rng.choice(["a", "b", "c", "d", "été"]), doc_id, position)
+        for doc_id in range(1, 51)
+        for position in range(rng.randint(1, 10))
+    ]
+
+
+@pytest.mark.parametrize("positions", [False, True])
+@pytest.mark.parametrize("batch_size", [2, 100])
+def test_spimi(entries, tmp_path, positions, batch_size):
+    with SPIMIBuilder(
+        block_size=20, positions=positions, temp_dir=str(tmp_path / "spimi")
+    ) as builder:
+        for entry in entries:
+            builder.add(*entry)
+        result = list(builder.merge(batch_size=batch_size))
+
+    if not positions:
+        entries = [(token, doc_id) for token, doc_id, _ in entries]
+    assert result == list(group_entries(sorted(entries), positions))
+    assert not (tmp_path / "spimi").exists()
+
+
+def test_blocks_end_between_documents(tmp_path):
+    with SPIMIBuilder(block_size=1, temp_dir=str(tmp_path)) as builder:
+        for position in range(3):
+            builder.add("a", 1, position)
+        builder.add("a", 2)
+        assert len(list(tmp_path.iterdir())) == 1
+        assert list(builder.merge()) == [("a", ([1, 2], [3, 1], None))]
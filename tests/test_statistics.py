@@ -0,0 +1,55 @@
+from math import sqrt
+
+import pytest
+
+from indexes import Index
+from indexes.stats import STATISTICS
+from models.vector.schemes import NORMS, SchemeNorm, TfIdfComplex
+
+
+@pytest.fixture(name="index")
+def fixture_index():
+    return Index(
+        postings={"a": [0, 0, 1], "b": [0, 2]},
+        doc_ids={0, 1, 2},
+        terms={"a", "b"},
+        df={"a": 2, "b": 2},
+    )
+
+
+def test_builtin_statistics(index):
+    assert list(index.statistics["length"]) == [3, 1, 1]
+    assert list(index.statistics["unique_terms"]) == [2, 1, 1]
+
+
+def test_scheme_norm(index):
+    # Norms are specific to the vector model, and are not registered.
+    assert "norm:complex" not in STATISTICS
+    norms = index.statistics.fetch(SchemeNorm(TfIdfComplex))
+    assert index.statistics["norm:complex"] is norms
+    wcs = TfIdfComplex
+    w_a0 = wcs.tf_weight(2) * wcs.df_weight(2, 3)
+    w_b0 = wcs.tf_weight(1) * wcs.df_weight(2, 3)
+    assert norms[0] == pytest.approx(sqrt(w_a0 ** 2 + w_b0 ** 2))
+
+
+def test_unknown_statistic(index):
+    with pytest.raises(KeyError):
+        index.statistics["unknown"]
+
+
+def test_persisted_statistics(index, tmp_path):
+    path = str(tmp_path / "index.idx")
+    index.save(path)
+    Index.open(path).statistics.compute()
+
+    reopened = Index.open(path)
+    assert "length" in reopened.statistics.computed
+    assert list(reopened.statistics["length"]) == [3, 1, 1]
+
+    Index.open(path).statistics.compute(NORMS)
+    assert "norm:complex" in Index.open(path).statistics.computed
+
+    # Statistics of a previous build are not used.
+    index.save(path)
+    assert "length" not in Index.open(path).statistics.computed
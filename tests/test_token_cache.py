@@ -0,0 +1,89 @@
+import os
+import random
+
+import pytest
+
+from data_collections import CS276
+
+
+def _expected(root):
+    expected = []
+    doc_id = 1
+    for directory in sorted(os.listdir(root)):
+        for filename in sorted(os.listdir(root / directory)):
+            tokens = (root / directory / filename).read_text().split()
+            expected += [(token, doc_id, i) for i, token in enumerate(tokens)]
+            doc_id += 1
+    return expected
+
+
+@pytest.fixture(name="root")
+def fixture_root(tmp_path, monkeypatch):
+    rng = random.Random(0)
+    root = tmp_path / "cs276"
+    for directory in range(3):
+        (root / str(directory)).mkdir(parents=True)
+        for doc in range(rng.randint(1, 10)):
+            words = [rng.choice("abcdefgh") * rng.randint(1, 3) for _ in range(20)]
+            (root / str(directory) / f"doc{doc}").write_text(" ".join(words))
+    # A document without any token.
+    (root / "1" / "empty").write_text("\n")
+    monkeypatch.setenv("DATA_CS276_PATH", str(root))
+    return root
+
+
+@pytest.fixture(name="collection")
+def fixture_collection(root, tmp_path):
+    collection = CS276()
+    collection.token_cache_filename = str(tmp_path / "tokens.cache")
+    collection.doc_map_filename = str(tmp_path / "doc_map.txt")
+    return collection
+
+
+def test_token_cache(collection, root, capsys):
+    assert list(collection.positions()) == _expected(root)
+    assert "Loading" in capsys.readouterr().out
+    assert os.path.exists(collection.token_cache_filename)
+
+    # Tokens are then read from the cache.
+    assert list(collection.positions()) == _expected(root)
+    assert "Loading" not in capsys.readouterr().out
+
+
+def test_update(collection, root, capsys):
+    list(collection.positions())
+    num_docs = len(collection._manifest())
+
+    (root / "0" / "doc0").write_text("new tokens ahead")
+    assert list(collection.positions()) == _expected(root)
+    assert f"Tokenized 1 of {num_docs} documents" in capsys.readouterr().out
+
+    (root / "2" / "doc0").unlink()
+    (root / "2" / "added").write_text("another new document")
+    assert list(collection.positions()) == _expected(root)
+    assert f"Tokenized 1 of {num_docs} documents" in capsys.readouterr().out
+
+    with open(collection.doc_map_filename) as doc_map:
+        assert doc_map.readline() == "1 doc0\n"
+
+
+def test_partial_cache(collection, root):
+    list(collection.positions())
+    with open(collection.token_cache_filename, "r+b") as f:
+        f.truncate(os.path.getsize(collection.token_cache_filename) // 2)
+    assert not collection._token_cache().is_current(collection._manifest())
+    assert list(collection.positions()) == _expected(root)
+
+
+def test_partitions(collection, root):
+    # Without a cache, parts are directories.
+    parts = collection.partitions(2)
+    assert [kind for kind, *_ in parts] == ["dir"] * 3
+    streams = [list(collection.partition_positions(part)) for part in parts]
+    assert sum(streams, []) == _expected(root)
+
+    list(collection.positions())
+    parts = collection.partitions(4)
+    assert [kind for kind, *_ in parts] == ["cache"] * 4
+    streams = [list(collection.partition_positions(part)) for part in parts]
+    assert sum(streams, []) == _expected(root)
@@ -0,0 +1,78 @@
+import pytest
+
+from indexes import Index
+from models.vector import VectorEngine, correct_request, vector_search
+from models.vector.schemes import SCHEMES, TfIdfComplex, TfIdfSimple
+from models.vector.search import top_k
+
+
+@pytest.fixture(autouse=True)
+def fixture_stop_words(tmp_path, monkeypatch):
+    path = tmp_path / "stop_words.txt"
+    path.write_text("the\n")
+    monkeypatch.setenv("DATA_STOP_WORDS_PATH", str(path))
+
+
+@pytest.fixture(name="index")
+def fixture_index():
+    return Index(
+        postings={"a": [0, 0, 1, 3], "b": [0, 2, 3], "c": [4]},
+        doc_ids={0, 1, 2, 3, 4},
+        terms={"a", "b", "c"},
+        df={"a": 3, "b": 3, "c": 1},
+    )
+
+
+def test_only_matching_documents(index):
+    assert vector_search("a", index, wcs=TfIdfSimple) == [0, 1, 3]
+    assert vector_search("c", index) == [4]
+
+
+def test_scores(index):
+    # Doc 0 contains "a" twice and "b" once, docs 1, 2 and 3 have lower
+    # dot products with the request.
+    assert vector_search("a b", index, wcs=TfIdfSimple) == [0, 3, 1, 2]
+    assert vector_search("a b", index, k=2, wcs=TfIdfSimple) == [0, 3]
+
+
+def test_normalized_scores(index):
+    # Doc 3 contains both terms once, doc 0 is longer.
+    assert vector_search("a b", index, wcs=TfIdfComplex) == [3, 0, 1, 2]
+
+
+def test_ties_are_broken_by_doc_id():
+    assert top_k({5: 1.0, 2: 1.0, 7: 2.0, 3: 1.0}, 3) == [7, 2, 3]
+
+
+REQUESTS = ["a", "a b", "b b a", "c a", "unknown", ""]
+
+
+@pytest.mark.parametrize("wcs", list(SCHEMES.values()))
+@pytest.mark.parametrize("codec", [None, "raw", "vbyte"])
+def test_engine(index, tmp_path, wcs, codec):
+    if codec is not None:
+        path = str(tmp_path / "index.idx")
+        index.save(path, codec=codec)
+        index = Index.open(path)
+
+    engine = VectorEngine(index, wcs=wcs)
+    expected = [vector_search(request, index, wcs=wcs) for request in REQUESTS]
+    assert [engine.search(request) for request in REQUESTS] == expected
+    assert engine.search_many(REQUESTS) == expected
+    assert engine.search_many(REQUESTS, k=1) == [ids[:1] for ids in expected]
+
+
+def test_fuzzy():
+    postings = {"graph": [0, 1], "sorting": [1, 2], "string": [3], "tree": [2]}
+    index = Index(
+        postings=postings,
+        doc_ids={0, 1, 2, 3},
+        terms=set(postings),
+        df={term: len(doc_ids) for term, doc_ids in postings.items()},
+    )
+    # "srting" is as close to "sorting" as to "string", which is rarer.
+    assert correct_request("Grahp sortng srting tree", index) == (
+        "grahp sorting sorting tree"
+    )
+    assert vector_search("sortng", index) == []
+    assert vector_search("sortng", index, fuzzy=True) == [1, 2]
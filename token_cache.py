@@ -0,0 +1,146 @@
+"""Binary cache of the tokens of a collection stored as one file per document
+(i.e. CS276).
+
+The cache is a section file (see `indexes.storage`), memory-mapped when it
+is read, with the following sections:
+
+- `terms`: term IDs of the tokens of every document, in document order, as
+32-bit integers. Positions of tokens are their rank within their document.
+- `docs`: offset of the term IDs of each document in `terms` (one more than
+the number of documents).
+- `vocabulary`: tokens, separated by newlines, in term ID order.
+
+Its metadata holds the manifest of the collection: the path, size and
+modification time of each document, in doc ID order (the doc map). When
+the collection changes, only new or modified documents are tokenized again:
+the term IDs of the other documents are copied from the previous cache, as
+the vocabulary is only ever appended to.
+
+The cache is written to a temporary file which is then renamed (see
+`SectionFileWriter`), so a partially written cache is never read.
+"""
+import os
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from datatypes import Token
+from indexes.storage import SectionFile, SectionFileWriter, StorageError
+
+VERSION = 1
+
+# Path of a document relative to the collection, its size and modification
+# time (in nanoseconds).
+ManifestEntry = Tuple[str, int, int]
+
+
+class TokenCache:
+    """Token cache of the documents of a collection.
+
+    Parameters
+    ----------
+    path : str
+        Location of the cache file.
+    root : str
+        Directory of the collection, which document paths are relative to.
+    """
+
+    def __init__(self, path: str, root: str):
+        self.path = path
+        self.root = os.path.abspath(root)
+        self.file: Optional[SectionFile] = None
+        self.manifest: List[ManifestEntry] = []
+        self._load()
+
+    def _load(self):
+        try:
+            cache_file = SectionFile(self.path)
+        except (FileNotFoundError, StorageError):
+            return
+        meta = cache_file.meta
+        if meta.get("version") != VERSION or meta.get("root") != self.root:
+            return
+        self.file = cache_file
+        self.manifest = [tuple(entry) for entry in meta["manifest"]]
+
+    def __len__(self) -> int:
+        """Number of documents in the cache."""
+        return len(self.manifest)
+
+    def is_current(self, manifest: List[ManifestEntry]) -> bool:
+        return self.file is not None and self.manifest == manifest
+
+    def _vocabulary(self) -> List[Token]:
+        data = bytes(self.file.section("vocabulary")).decode()
+        return data.split("\n") if data else []
+
+    def update(
+        self,
+        manifest: List[ManifestEntry],
+        tokenize: Callable[[str], Iterable[Token]],
+    ) -> int:
+        """Write the cache of the documents of a manifest.
+
+        Parameters
+        ----------
+        manifest : list of (path, size, mtime) tuples
+        tokenize : callable
+            Return the tokens of the document at a (full) path.
+
+        Returns
+        -------
+        tokenized : int
+            Number of documents which were tokenized, i.e. which are not in
+            the previous cache or have changed since.
+        """
+        cached: Dict[ManifestEntry, int] = {}
+        vocabulary: List[Token] = []
+        if self.file is not None:
+            cached = {entry: i for i, entry in enumerate(self.manifest)}
+            terms = self.file.array("terms", "I")
+            docs = self.file.array("docs", "Q")
+            vocabulary = self._vocabulary()
+        term_ids = {token: term_id for term_id, token in enumerate(vocabulary)}
+
+        tokenized = 0
+        offsets = array("Q", [0])
+        meta = {"version": VERSION, "root": self.root, "manifest": manifest}
+        with SectionFileWriter(self.path, meta=meta) as writer:
+            writer.begin_section("terms")
+            for entry in manifest:
+                if entry in cached:
+                    i = cached[entry]
+                    doc_terms = terms[docs[i] : docs[i + 1]]
+                else:
+                    tokenized += 1
+                    doc_terms = array("I")
+                    for token in tokenize(os.path.join(self.root, entry[0])):
+                        term_id = term_ids.get(token)
+                        if term_id is None:
+                            term_id = term_ids[token] = len(vocabulary)
+                            vocabulary.append(token)
+                        doc_terms.append(term_id)
+                writer.write(doc_terms)
+                offsets.append(offsets[-1] + len(doc_terms))
+            writer.end_section()
+            writer.add_section("docs", offsets)
+            writer.add_section("vocabulary", "\n".join(vocabulary).encode())
+
+        self.file = None
+        self._load()
+        return tokenized
+
+    def documents(
+        self, start: int = 0, end: int = None
+    ) -> Iterator[Tuple[int, List[Token]]]:
+        """Return the stream of (index, tokens) pairs of documents, from the
+        `start`-th up to the `end`-th (excluded).
+        """
+        if self.file is None:
+            raise FileNotFoundError(self.path)
+        if end is None:
+            end = len(self)
+        terms = self.file.array("terms", "I")
+        docs = self.file.array("docs", "Q")
+        token = self._vocabulary().__getitem__
+        for i in range(start, end):
+            yield i, list(map(token, terms[docs[i] : docs[i + 1]]))
@@ -1,6 +1,6 @@
 import os
 from contextlib import ExitStack, contextmanager
-from typing import Tuple, Generator, List, Iterable, Any
+from typing import Any, Callable, Generator, Iterable, Iterator, List, Tuple
 from itertools import zip_longest
 import time
 
@@ -22,13 +22,70 @@ def find_dirs(root: str) -> Generator[Tuple[str, str], None, None]:
 
 
 @contextmanager
-def multi_open(paths: List[str]):
-    """Open multiple files."""
+def multi_open(paths: List[str], **kwargs):
+    """Open multiple files.
+
+    Keyword arguments are passed to `open()`.
+    """
     # NOTE: ExitStack calls `__exit__()` on the registered context managers.
     # We use it to make sure all opened files are closed when
     # exiting this context.
     with ExitStack() as stack:
-        yield [stack.enter_context(open(path)) for path in paths]
+        yield [stack.enter_context(open(path, **kwargs)) for path in paths]
+
+
+def read_lines(path: str, start: int = 0, end: int = None) -> Iterator[str]:
+    """Read the lines of a file between two byte offsets.
+
+    `start` must be the offset of the beginning of a line. Lines starting
+    before `end` are read.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if end is not None and offset >= end:
+                break
+            offset += len(line)
+            yield line.decode()
+
+
+def split_lines(
+    path: str, n: int, is_start: Callable[[bytes, bytes], bool]
+) -> List[Tuple[int, int]]:
+    """Split a file into at most `n` byte ranges of roughly equal sizes.
+
+    Ranges are split on lines for which `is_start(line, previous_line)` is
+    true, e.g. lines which start a new document.
+
+    Returns
+    -------
+    ranges : list of (start, end) tuples
+    """
+    size = os.path.getsize(path)
+    offsets = [0]
+    with open(path, "rb") as f:
+        for i in range(1, n):
+            target = size * i // n
+            if target <= offsets[-1]:
+                continue
+            f.seek(target)
+            # Skip the (possibly partial) line at the target offset, and
+            # the next one, which is compared to the following line.
+            offset = target + len(f.readline())
+            previous = f.readline()
+            offset += len(previous)
+            for line in f:
+                if is_start(line, previous):
+                    break
+                previous = line
+                offset += len(line)
+            if offset < size:
+                offsets.append(offset)
+    offsets.append(size)
+    return [
+        (start, end) for start, end in zip(offsets, offsets[1:]) if start < end
+    ]
 
 
 def grouped(n: int, iterable: Iterable, fillvalue: Any = None):